@@ -0,0 +1,118 @@
+"""
+Apollo variant typing pipeline, run through apollo_variant_typing.py
+Authors: Roxanne Wolthuis, Boas van der Putten
+Organization: Rijksinstituut voor Volksgezondheid en Milieu (RIVM)
+Department: Infektieziekteonderzoek, Diagnostiek en Laboratorium
+            Surveillance (IDS), Bacteriologie (BPD)
+Date: 10-07-2023
+"""
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import yaml
+from juno_library import Pipeline  # type: ignore
+
+from apollo_variant_typing import add_pipeline_arguments
+from version import __description__, __package_name__, __version__
+
+
+@dataclass
+class ApolloVariantTyping(Pipeline):
+    pipeline_name: str = __package_name__
+    pipeline_version: str = __version__
+    input_type: str = "bam_and_vcf"
+
+    def _add_args_to_parser(self) -> None:
+        super()._add_args_to_parser()
+
+        self.parser.description = __description__
+
+        add_pipeline_arguments(self.add_argument)
+
+    def _parse_args(self) -> argparse.Namespace:
+        args = super()._parse_args()
+
+        # Optional arguments are loaded into self here
+        self.db_dir: Path = args.db_dir.resolve()
+
+        self.genus: Optional[str]
+        self.species: Optional[str]
+        self.genus, self.species = args.species
+        self.metadata_file: Path = args.metadata
+        self.presets_path: Optional[Path] = args.presets_path
+
+        return args
+
+    def setup(self) -> None:
+        super().setup()
+        self.update_sample_dict_with_metadata()
+        self.set_presets()
+
+        if self.snakemake_args["use_singularity"]:
+            self.snakemake_args["singularity_args"] = " ".join(
+                [
+                    self.snakemake_args["singularity_args"],
+                    f"--bind {self.db_dir}:{self.db_dir}",
+                ]  # paths that singularity should be able to read from can be bound by adding to the above list
+            )
+
+        with open(
+            Path(__file__).parent.joinpath("config/pipeline_parameters.yaml")
+        ) as f:
+            parameters_dict = yaml.safe_load(f)
+        self.snakemake_config.update(parameters_dict)
+
+        self.user_parameters = {
+            "input_dir": str(self.input_dir),
+            "output_dir": str(self.output_dir),
+            "db_dir": str(self.db_dir),
+            "exclusion_file": str(self.exclusion_file),
+            "custom_presets_file": str(self.presets_path),
+            # "example": str(self.example), # other user parameters can be included in user_parameters.yaml here
+        }
+
+    def update_sample_dict_with_metadata(self) -> None:
+        self.get_metadata_from_csv_file(
+            filepath=self.metadata_file,
+            expected_colnames=["sample", "genus", "species"],
+        )
+        # Add metadata
+        for sample in self.sample_dict:
+            if self.genus is not None and self.species is not None:
+                self.sample_dict[sample]["genus"] = self.genus
+                self.sample_dict[sample]["species"] = self.species
+            else:
+                try:
+                    self.sample_dict[sample].update(self.juno_metadata[sample])
+                except (KeyError, TypeError):
+                    raise ValueError(
+                        f"One of your samples is not in the metadata file "
+                        f"({self.metadata_file}). Please ensure that all "
+                        "samples are present in the metadata file or provide "
+                        "a --species argument."
+                    )
+                self.sample_dict[sample]["genus"] = (
+                    self.sample_dict[sample]["genus"].strip().lower()
+                )
+                self.sample_dict[sample]["species"] = (
+                    self.sample_dict[sample]["species"].strip().lower()
+                )
+
+    def set_presets(self) -> None:
+        if self.presets_path is None:
+            self.presets_path = Path(__file__).parent.joinpath("config/presets.yaml")
+
+        with open(self.presets_path) as f:
+            presets_dict = yaml.safe_load(f)
+
+        for sample in self.sample_dict:
+            complete_species_name = "_".join(
+                [self.sample_dict[sample]["genus"], self.sample_dict[sample]["species"]]
+            )
+
+            if complete_species_name in presets_dict.keys():
+                for key, value in presets_dict[complete_species_name].items():
+                    self.sample_dict[sample][key] = value
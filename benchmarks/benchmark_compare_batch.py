@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark compare_mutations_batch on synthetic samples
+
+Writes a synthetic VariantsToTable output per sample and times the batch
+comparison for each requested number of worker processes. The speedup over the
+first number of workers is only meaningful up to the number of CPUs available
+to the benchmark, which is printed with the results.
+
+Usage: python -m benchmarks.benchmark_compare_batch --samples 1000 --threads 1 2 4 8 --output compare_batch.tsv
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from workflow.scripts.compare_mutations_batch import compare_batch
+
+
+def write_synthetic_sample(path: Path, nr_variants: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write("CHROM\tPOS\tTYPE\tREF\tALT\tDP\tAF\tBCSQ\n")
+        for pos in range(nr_variants):
+            locus_tag = f"B9J08_{rng.randint(0, 5500):05d}"
+            aa_pos = rng.randint(1, 500)
+            f.write(
+                f"PEKT02000001.1\t{pos}\tSNP\tA\tT\t30\t1\t"
+                f"missense|{locus_tag}|rna-{locus_tag}|protein_coding|+|"
+                f"{aa_pos}E>{aa_pos}K|{pos}A>T\n"
+            )
+
+
+def get_available_cpus() -> int:
+    """
+    Number of CPUs this process may run on, which can be fewer than the
+    machine has, for example in a container or a cluster job
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", default=1000, type=int)
+    parser.add_argument("--variants", default=20000, type=int)
+    parser.add_argument("--threads", default=[1, 2, 4], type=int, nargs="+")
+    parser.add_argument(
+        "--resistance_variants_csv",
+        default=Path("files/cauris/aa_resistance_list.csv"),
+        type=Path,
+    )
+    parser.add_argument(
+        "--output", help="Also write the results to this TSV", default=None
+    )
+    args = parser.parse_args()
+
+    available_cpus = get_available_cpus()
+    print(f"CPUs available: {available_cpus}")
+    if max(args.threads) > available_cpus:
+        print(
+            f"Warning: more workers than available CPUs, the speedup of "
+            f"{max(args.threads)} workers cannot be measured on this machine",
+            file=sys.stderr,
+        )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        # Samples share a few input files, only the outputs differ per sample
+        inputs = [tmp / f"input_{i}.tsv" for i in range(min(args.samples, 10))]
+        for seed, input_file in enumerate(inputs):
+            write_synthetic_sample(input_file, args.variants, seed)
+        list_samples: List[Dict[str, str]] = [
+            {
+                "sample": f"sample{i}",
+                "input": str(inputs[i % len(inputs)]),
+                "output": str(tmp / f"sample{i}.tsv"),
+                "full_output": str(tmp / f"sample{i}.full.tsv"),
+                "resistance_variants_csv": str(args.resistance_variants_csv),
+            }
+            for i in range(args.samples)
+        ]
+        timings: List[Tuple[int, float]] = []
+        for threads in args.threads:
+            start = time.perf_counter()
+            compare_batch(list_samples, "aa", threads)
+            timings.append((threads, time.perf_counter() - start))
+
+    baseline_threads, baseline = timings[0]
+    df_results = pd.DataFrame(
+        [
+            {
+                "samples": args.samples,
+                "threads": threads,
+                "available_cpus": available_cpus,
+                "seconds": round(seconds, 2),
+                "samples_per_s": round(args.samples / seconds, 2),
+                "speedup": round(baseline / seconds, 2),
+                # Speedup relative to the ideal, linear one
+                "efficiency": round(
+                    baseline * baseline_threads / (seconds * threads), 2
+                ),
+            }
+            for threads, seconds in timings
+        ]
+    )
+    print(df_results.to_string(index=False))
+    if args.output is not None:
+        df_results.to_csv(args.output, sep="\t", index=False)
+
+
+if __name__ == "__main__":
+    main()
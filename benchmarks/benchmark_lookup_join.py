@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark lookup_join against DataFrame.merge
+
+Joins synthetic observed mutations to a catalogue on (CHROM, POS, REF, ALT),
+as find_exact_matches does, for several numbers of input rows. The cold
+lookup_join builds the key index of the catalogue on every call, the warm one
+reuses it, as it does with catalogues compiled by compile_catalogue.
+
+Usage: python -m benchmarks.benchmark_lookup_join --rows 10000 1000000 10000000
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+from workflow.scripts.lookup_join import lookup_join
+from workflow.scripts.resistance_catalogue import ResistanceCatalogue
+
+
+def make_mutations(nr_rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "CHROM": rng.choice(["NC_007194.1", "NC_007195.1", "NC_007197.1"], nr_rows),
+            "POS": rng.integers(1, 5_000_000, nr_rows),
+            "TYPE": "SNP",
+            "REF": rng.choice(list("ACGT"), nr_rows),
+            "ALT": rng.choice(list("ACGT"), nr_rows),
+            "DP": rng.integers(10, 100, nr_rows),
+        }
+    )
+
+
+def make_catalogue(df_mutations: pd.DataFrame, nr_rows: int) -> ResistanceCatalogue:
+    df_catalogue = (
+        df_mutations.sample(nr_rows, random_state=1)
+        .drop_duplicates(["CHROM", "POS", "REF", "ALT"])
+        .rename(
+            columns={
+                "CHROM": "chrom",
+                "POS": "position",
+                "REF": "ref_nt",
+                "ALT": "alt_nt",
+            }
+        )[["chrom", "position", "ref_nt", "alt_nt"]]
+        .assign(genetic_element="gene", mutation_name="mutation", impact="resistance")
+        .reset_index(drop=True)
+    )
+    return ResistanceCatalogue(kind="nt", table=df_catalogue, content_hash="")
+
+
+def time_call(func: Callable[[], object], repeats: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rows", default=[10_000, 1_000_000, 10_000_000], type=int, nargs="+"
+    )
+    parser.add_argument("--catalogue-rows", default=100, type=int)
+    parser.add_argument("--repeats", default=3, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    left_on = ["CHROM", "POS", "REF", "ALT"]
+    right_on = ["chrom", "position", "ref_nt", "alt_nt"]
+    results = []
+    for nr_rows in args.rows:
+        df_mutations = make_mutations(nr_rows, rng)
+        catalogue = make_catalogue(df_mutations, min(args.catalogue_rows, nr_rows))
+        seconds_merge = time_call(
+            lambda: df_mutations.merge(
+                catalogue.table, how="inner", left_on=left_on, right_on=right_on
+            ),
+            args.repeats,
+        )
+        # A plain dataframe has no cached key index, so it is built on every call
+        seconds_cold = time_call(
+            lambda: lookup_join(
+                df_mutations, catalogue.table, left_on, right_on, "inner"
+            ),
+            args.repeats,
+        )
+        # Compiled catalogues have the index of the join columns already
+        catalogue.key_index(right_on)
+        seconds_warm = time_call(
+            lambda: lookup_join(df_mutations, catalogue, left_on, right_on, "inner"),
+            args.repeats,
+        )
+        results.append(
+            {
+                "rows": nr_rows,
+                "merge_s": round(seconds_merge, 4),
+                "lookup_join_cold_s": round(seconds_cold, 4),
+                "lookup_join_warm_s": round(seconds_warm, 4),
+                "speedup_cold": round(seconds_merge / seconds_cold, 2),
+                "speedup_warm": round(seconds_merge / seconds_warm, 2),
+            }
+        )
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
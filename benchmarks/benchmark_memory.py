@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the peak memory of reading a whole-genome variants table
+
+Writes a synthetic VariantsToTable output and reads it in a fresh process per
+reader, once with one string object per value and once with the compact
+representation used by the comparison scripts. The peak resident set size is
+reported above the size of the process after importing pandas.
+
+Usage: python -m benchmarks.benchmark_memory --variants 2000000
+"""
+
+import argparse
+import multiprocessing
+import random
+import resource
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+import pandas as pd
+
+from workflow.scripts import compare_aa_mutations, compare_nt_mutations
+
+readers = {
+    "nt": lambda path, compact: compare_nt_mutations.read_mutations(path, compact),
+    # All consequences are kept, as for a table of only resistance genes
+    "aa": lambda path, compact: compare_aa_mutations.read_input_file(
+        path, compact=compact
+    ),
+}
+
+
+def write_whole_genome_table(path: Path, nr_variants: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    chroms = [f"NC_00719{i}.1" for i in range(8)]
+    with open(path, "w") as f:
+        f.write("CHROM\tPOS\tTYPE\tREF\tALT\tDP\tAF\tBCSQ\n")
+        for pos in range(nr_variants):
+            chrom = chroms[pos * len(chroms) // nr_variants]
+            locus_tag = f"AFUA_{rng.randint(1, 8)}G{rng.randint(0, 17000):05d}"
+            aa_pos = rng.randint(1, 900)
+            if rng.random() < 0.1:
+                variant_type, ref, alt = "INDEL", "A", "A" + "T" * rng.randint(1, 10)
+            else:
+                variant_type, ref, alt = "SNP", rng.choice("ACGT"), rng.choice("ACGT")
+            f.write(
+                f"{chrom}\t{pos + 1}\t{variant_type}\t{ref}\t{alt}\t"
+                f"{rng.randint(5, 80)}\t{rng.choice(['1', '0.5', '0.333'])}\t"
+                f"missense|{locus_tag}|rna-{locus_tag}|protein_coding|+|"
+                f"{aa_pos}E>{aa_pos}K|{pos + 1}{ref}>{alt}\n"
+            )
+
+
+def measure(mode: str, path: Path, compact: bool) -> Tuple[float, int]:
+    """
+    Peak memory in MB above the process size before reading, and number of rows
+    """
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    nr_rows = len(readers[mode](path, compact))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux
+    return (peak - baseline) / 1024, nr_rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", default=2000000, type=int)
+    parser.add_argument("--modes", default=["nt", "aa"], nargs="+", choices=readers)
+    args = parser.parse_args()
+
+    # Every measurement starts from a fresh interpreter, so peaks do not carry over
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "variants.tsv"
+        write_whole_genome_table(path, args.variants)
+        for mode in args.modes:
+            peaks = {}
+            for compact in [False, True]:
+                with context.Pool(1) as pool:
+                    peaks[compact], nr_rows = pool.apply(measure, (mode, path, compact))
+            results.append(
+                {
+                    "mode": mode,
+                    "rows": nr_rows,
+                    "strings_mb": round(peaks[False]),
+                    "compact_mb": round(peaks[True]),
+                    "reduction": round(peaks[False] / max(peaks[True], 1), 1),
+                }
+            )
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
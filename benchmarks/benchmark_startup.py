@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark the start-up time of the entry point
+
+Imports every module in a fresh interpreter with `python -X importtime` and
+reports the time spent importing it, together with the heavy dependencies it
+pulled in. The budgets are checked by tests/test_amr_mutation_parsing.py, so a
+change that makes the entry point import pandas or juno_library again fails.
+
+Usage: python -m benchmarks.benchmark_startup --repeats 5
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+# Dependencies that take a large part of the start-up time of a script
+heavy_modules = ["juno_library", "snakemake", "yaml", "pandas", "numpy", "pyarrow"]
+
+# Budget in seconds for the time spent importing every module. The imports
+# take a few milliseconds, importing pandas alone takes several hundred.
+startup_budgets: Dict[str, float] = {
+    "apollo_variant_typing": 0.1,
+}
+
+
+def measure_import(module: str) -> Tuple[float, Set[str]]:
+    """
+    Import a module in a fresh interpreter
+
+    Parameters
+    ----------
+    module : str
+        Name of the module, importable from the root of the repository
+
+    Returns
+    -------
+    import_time : float
+        Seconds spent importing the module and its parent packages, as
+        reported by -X importtime
+    imported : set of str
+        Names of all modules the interpreter imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=repo_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_time_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, indented_name = line.split("|")
+        name = indented_name.strip()
+        imported.add(name)
+        # Modules imported by other modules are indented below them
+        nested = indented_name.startswith("  ")
+        if not nested and (name == module or module.startswith(f"{name}.")):
+            import_time_us += int(cumulative)
+    return import_time_us / 1e6, imported
+
+
+def get_heavy_imports(imported: Set[str]) -> List[str]:
+    """
+    Heavy dependencies among the imported modules
+    """
+    return [module for module in heavy_modules if module in imported]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", default=5, type=int)
+    parser.add_argument(
+        "--modules",
+        default=list(startup_budgets),
+        nargs="+",
+        help="Modules to import, also others than those with a budget",
+    )
+    args = parser.parse_args()
+
+    print("module\timport_ms\tbudget_ms\theavy_imports")
+    for module in args.modules:
+        # The fastest of several imports is the least affected by other load
+        times = []
+        for _ in range(args.repeats):
+            import_time, imported = measure_import(module)
+            times.append(import_time)
+        budget = startup_budgets.get(module)
+        print(
+            f"{module}\t{min(times) * 1000:.1f}\t"
+            f"{'-' if budget is None else f'{budget * 1000:.0f}'}\t"
+            f"{','.join(get_heavy_imports(imported)) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
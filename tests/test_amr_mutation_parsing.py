@@ -1,10 +1,40 @@
+import contextlib
+import gzip
+import importlib.util
+import io
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from pathlib import Path
 from sys import path
 
+import numpy as np
 import pandas as pd
+import yaml
 
+from benchmarks.benchmark_startup import (
+    get_heavy_imports,
+    measure_import,
+    startup_budgets,
+)
+from workflow.scripts.allele_normalisation import (
+    left_normalise_indels,
+    normalise_alleles,
+    read_reference_sequences,
+    split_multiallelic,
+)
+from workflow.scripts import compare_aa_mutations, compare_nt_mutations
+from workflow.scripts.annotate_and_compare import annotate_vcf_to_table
+from workflow.scripts.cohort_store import add_samples, get_matrix
+from workflow.scripts.combine_aa_nt_reports import combine_aa_nt, combine_reports
 from workflow.scripts.compare_aa_mutations import (
+    compile_locus_tag_pattern,
     create_locus_tag_gene_dict,
     filter_for_known_mutations,
     filter_for_resistance_genes,
@@ -12,12 +42,49 @@ from workflow.scripts.compare_aa_mutations import (
     read_input_file,
     rename_df_resistance_with_impact,
 )
+from workflow.scripts.compare_mutations_batch import (
+    compare_batch,
+    read_manifest,
+    write_manifest,
+)
 from workflow.scripts.compare_nt_mutations import (
     combine_exact_matches_and_possible_cnvs,
     find_exact_matches,
     find_large_indels,
+    read_mutations,
     screen_for_possible_cnv_in_known_regions,
 )
+from workflow.scripts.lookup_join import lookup_join
+from workflow.scripts.make_cluster_profile import make_profile
+from workflow.scripts.make_target_regions import make_target_regions, merge_regions
+from workflow.scripts.reference_cache import (
+    evict_entries,
+    is_cached,
+    restore_or_prepare_reference,
+    restore_reference,
+    store_reference,
+)
+from workflow.scripts.reference_key import get_reference_keys
+from workflow.scripts.report_io import read_report, write_report
+from workflow.scripts.resistance_catalogue import (
+    get_cache_path,
+    join_key_columns,
+    load_catalogue,
+    read_resistance_variants_csv,
+)
+from workflow.scripts.retype_cohort import retype_cohort
+from workflow.scripts.stage_profiler import StageProfiler
+from workflow.scripts.summarize_benchmarks import (
+    read_benchmarks,
+    suggest_resources,
+    summarize,
+)
+from workflow.scripts.variant_typer import VariantTyper, serve_lines
+from workflow.scripts.vcf_reader import (
+    VcfTable,
+    get_variant_type,
+    open_variants_table,
+)
 
 # init df_mutations with missense SNP and synonymous SNP in the same genetic element, and a large intergenic INDEL (promoter mutation)
 df_mutations = pd.read_csv("tests/test_files/df_mutations.tsv", sep="\t")
@@ -97,6 +164,25 @@ class TestNtComparison(unittest.TestCase):
         self.assertEqual(df_exact_matches.shape[1], 11)
         pd.testing.assert_frame_equal(df_exact_matches, self.df_exact_matches_correct)
 
+    def test_find_exact_matches_compact(self):
+        df_mutations_compact = read_mutations(
+            Path("tests/test_files/df_mutations.tsv"), compact=True
+        )
+        self.assertNotIn("BCSQ", df_mutations_compact.columns)
+        self.assertEqual(df_mutations_compact["CHROM"].dtype, "category")
+        self.assertEqual(df_mutations_compact["AF"].dtype, df_mutations["AF"].dtype)
+        df_exact_matches = find_exact_matches(
+            df_mutations=df_mutations_compact,
+            df_resistance_variants=df_nt_resistance_variants,
+            dict_col_rename=dict_col_rename_nt,
+        )
+        pd.testing.assert_frame_equal(
+            df_exact_matches,
+            self.df_exact_matches_correct,
+            check_categorical=False,
+            check_dtype=False,
+        )
+
     def test_find_large_indels_should_find_novel(self):
         df_large_indels = find_large_indels(
             df_mutations=df_mutations,
@@ -119,6 +205,42 @@ class TestNtComparison(unittest.TestCase):
         self.assertEqual(df_large_indels.shape[0], 0)
         self.assertEqual(df_large_indels.shape[1], 10)
 
+    @unittest.skipUnless(
+        os.environ.get("APOLLO_RUN_BENCHMARKS"),
+        "set APOLLO_RUN_BENCHMARKS=1 to run benchmarks",
+    )
+    def test_find_large_indels_benchmark(self):
+        nr_indels = 1_000_000
+        rng = np.random.default_rng(0)
+        df_indels = pd.DataFrame(
+            {
+                "CHROM": "NC_000913.3",
+                "POS": rng.integers(1, 1000, nr_indels),
+                "TYPE": "INDEL",
+                "REF": rng.choice(["A", "ACGTAC", "ACGTACGTACGT"], nr_indels),
+                "ALT": rng.choice(["A", "AC", "ACGTACG"], nr_indels),
+                "DP": 100,
+                "AF": 1,
+            }
+        )
+        start = time.perf_counter()
+        df_large_indels = find_large_indels(
+            df_mutations=df_indels,
+            screen_region=(250, 750),
+            genetic_element="b0004_promoter",
+        )
+        print(
+            f"\nfind_large_indels on {nr_indels} INDELs: {time.perf_counter() - start:.2f} s"
+        )
+        list_expected_names = [
+            f"possible_tandem_repeat_length_{max(len(ref), len(alt)) - 1}"
+            for ref, alt in zip(df_large_indels["REF"], df_large_indels["ALT"])
+        ]
+        self.assertEqual(df_large_indels["mutation_name"].tolist(), list_expected_names)
+        self.assertTrue(
+            ((df_large_indels["POS"] >= 250) & (df_large_indels["POS"] <= 750)).all()
+        )
+
     def test_screen_for_possible_cnv_in_known_regions(self):
         df_screen_for_possible_cnv_in_known_regions = (
             screen_for_possible_cnv_in_known_regions(
@@ -140,6 +262,36 @@ class TestNtComparison(unittest.TestCase):
             )
         )
 
+    def test_screen_for_possible_cnv_per_chromosome(self):
+        df_mutations_other_chrom = df_mutations.copy()
+        df_mutations_other_chrom["CHROM"] = "NC_000914.1"
+        df_possible_cnvs = screen_for_possible_cnv_in_known_regions(
+            df_mutations=pd.concat([df_mutations, df_mutations_other_chrom]),
+            df_resistance_variants=df_nt_resistance_variants,
+            dict_col_rename=dict_col_rename_nt,
+        )
+        # Large indels on a chromosome without tandem repeat regions are not reported
+        self.assertEqual(df_possible_cnvs.shape[0], 2)
+        self.assertEqual(set(df_possible_cnvs["chromosome"]), {"NC_000913.3"})
+
+    def test_screen_for_possible_cnv_with_settings(self):
+        df_possible_cnvs = screen_for_possible_cnv_in_known_regions(
+            df_mutations=df_mutations,
+            df_resistance_variants=df_nt_resistance_variants,
+            dict_col_rename=dict_col_rename_nt,
+            screen_window=0,
+        )
+        # Only the indel at the exact position of a tandem repeat region is found
+        self.assertEqual(df_possible_cnvs.shape[0], 1)
+        self.assertEqual(df_possible_cnvs["position"].tolist(), [300])
+        df_possible_cnvs = screen_for_possible_cnv_in_known_regions(
+            df_mutations=df_mutations,
+            df_resistance_variants=df_nt_resistance_variants,
+            dict_col_rename=dict_col_rename_nt,
+            min_indel_length=20,
+        )
+        self.assertEqual(df_possible_cnvs.shape[0], 0)
+
     def test_combine_exact_matches_and_possible_cnvs(self):
         # Copy to not change in memory dfs
         df_combined = combine_exact_matches_and_possible_cnvs(
@@ -184,6 +336,43 @@ class TestAaComparison(unittest.TestCase):
             df_mutations_test_read_input.equals(df_mutations_test_read_input_correct)
         )
 
+    def test_read_input_file_with_locus_tags(self):
+        df_mutations_test_read_input_correct = pd.read_csv(
+            "tests/test_files/df_mutations_test_read_input_correct.tsv",
+            sep="\t",
+            dtype={"AF": str},
+        )
+        df_mutations_test_read_input = read_input_file(
+            Path("tests/test_files/df_mutations_test_read_input.tsv"),
+            locus_tags={"b0001"},
+        )
+
+        self.assertEqual(df_mutations_test_read_input.shape[0], 2)
+        self.assertEqual(df_mutations_test_read_input.shape[1], 12)
+        df_mutations_test_read_input_correct = df_mutations_test_read_input_correct[
+            df_mutations_test_read_input_correct["locus_tag"] == "b0001"
+        ].reset_index(drop=True)
+        pd.testing.assert_frame_equal(
+            df_mutations_test_read_input, df_mutations_test_read_input_correct
+        )
+
+    def test_read_input_file_compact(self):
+        input_file = Path("tests/test_files/df_mutations_test_read_input.tsv")
+        for locus_tags in [None, {"b0001"}]:
+            df_strings = read_input_file(input_file, locus_tags)
+            df_compact = read_input_file(input_file, locus_tags, compact=True)
+            self.assertEqual(df_compact["locus_tag"].dtype, "category")
+            self.assertEqual(df_compact["mutation_name"].dtype, "category")
+            pd.testing.assert_frame_equal(
+                df_compact, df_strings, check_categorical=False, check_dtype=False
+            )
+
+    def test_compile_locus_tag_pattern(self):
+        locus_tag_pattern = compile_locus_tag_pattern({"b0001", "b0002"})
+        self.assertTrue(locus_tag_pattern.search("missense|b0002|rna-XM_b0002"))
+        self.assertFalse(locus_tag_pattern.search("missense|b0003|rna-XM_b0003"))
+        self.assertFalse(compile_locus_tag_pattern(set()).search("b0001"))
+
     def test_create_locus_tag_gene_dict(self):
         create_locus_tag_gene_dict_correct = {"b0001": "gene A"}
         create_locus_tag_gene_dict_test = create_locus_tag_gene_dict(
@@ -271,3 +460,900 @@ class TestAaComparison(unittest.TestCase):
         df_test_correct.reset_index(inplace=True, drop=True)
 
         self.assertTrue(df_test_filtered.equals(df_test_correct))
+
+
+class TestBatchComparison(unittest.TestCase):
+    def test_compare_batch(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            df_aa_resistance_variants.to_csv(tmp / "aa.csv", index=False)
+            df_nt_resistance_variants.to_csv(tmp / "nt.csv", index=False)
+            list_samples_aa = [
+                {
+                    "sample": sample,
+                    "input": "tests/test_files/df_mutations_test_read_input.tsv",
+                    "output": str(tmp / f"{sample}.aa.tsv"),
+                    "full_output": str(tmp / f"{sample}.aa.full.tsv"),
+                    "resistance_variants_csv": str(tmp / "aa.csv"),
+                }
+                for sample in ["sample1", "sample2"]
+            ]
+            list_samples_nt = [
+                {
+                    "sample": sample,
+                    "input": "tests/test_files/df_mutations.tsv",
+                    "output": str(tmp / f"{sample}.nt.tsv"),
+                    "resistance_variants_csv": str(tmp / "nt.csv"),
+                }
+                for sample in ["sample1", "sample2"]
+            ]
+            write_manifest(tmp / "aa_manifest.tsv", list_samples_aa)
+            write_manifest(tmp / "nt_manifest.tsv", list_samples_nt)
+
+            compare_batch(read_manifest(tmp / "aa_manifest.tsv"), "aa")
+            compare_batch(read_manifest(tmp / "nt_manifest.tsv"), "nt")
+
+            df_aa = pd.read_csv(tmp / "sample2.aa.tsv", sep="\t")
+            df_aa_full = pd.read_csv(tmp / "sample2.aa.full.tsv", sep="\t")
+            df_nt = pd.read_csv(tmp / "sample2.nt.tsv", sep="\t")
+            self.assertEqual(df_aa.shape[0], 1)
+            self.assertEqual(df_aa["mutation_name"].tolist(), ["10E>10K"])
+            self.assertEqual(df_aa_full.shape[0], 2)
+            pd.testing.assert_frame_equal(
+                df_nt, pd.read_csv(tmp / "sample1.nt.tsv", sep="\t")
+            )
+            self.assertEqual(df_nt.shape[0], 2)
+
+    def test_compare_batch_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            df_aa_resistance_variants.to_csv(tmp / "aa.csv", index=False)
+            list_samples = [
+                {
+                    "sample": f"sample{i}",
+                    "input": "tests/test_files/df_mutations_test_read_input.tsv",
+                    "output": str(tmp / f"sample{i}.aa.tsv"),
+                    "full_output": str(tmp / f"sample{i}.aa.full.tsv"),
+                    "resistance_variants_csv": str(tmp / "aa.csv"),
+                }
+                for i in range(4)
+            ]
+            compare_batch(list_samples, "aa", threads=2)
+
+            for i in range(4):
+                df_aa = pd.read_csv(tmp / f"sample{i}.aa.tsv", sep="\t")
+                self.assertEqual(df_aa["mutation_name"].tolist(), ["10E>10K"])
+
+
+class TestResistanceCatalogue(unittest.TestCase):
+    def test_read_resistance_variants_csv_with_bom(self):
+        kind, df_catalogue = read_resistance_variants_csv(
+            Path("files/cauris/aa_resistance_list.csv")
+        )
+        self.assertEqual(kind, "aa")
+        self.assertEqual(df_catalogue.columns[0], "genetic_element")
+
+    def test_read_resistance_variants_csv_missing_column(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = Path(tmpdir) / "aa.csv"
+            df_aa_resistance_variants.drop(columns=["ref_aa"]).to_csv(
+                csv_path, index=False
+            )
+            with self.assertRaises(ValueError):
+                read_resistance_variants_csv(csv_path)
+
+    def test_load_catalogue(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = Path(tmpdir) / "nt.csv"
+            df_nt_resistance_variants.to_csv(csv_path, index=False)
+
+            catalogue = load_catalogue(csv_path)
+            self.assertEqual(catalogue.kind, "nt")
+            self.assertTrue(get_cache_path(csv_path).exists())
+            self.assertEqual(len(catalogue.table), len(df_nt_resistance_variants))
+
+            # The cached catalogue has the key index of the join columns
+            catalogue = load_catalogue(csv_path)
+            self.assertIn(tuple(join_key_columns["nt"]), catalogue.key_indexes)
+
+            # Changing the CSV invalidates the cached catalogue
+            df_nt_resistance_variants.iloc[:1].to_csv(csv_path, index=False)
+            catalogue = load_catalogue(csv_path)
+            self.assertEqual(len(catalogue.table), 1)
+
+            # A cache that cannot be unpickled is recompiled
+            get_cache_path(csv_path).write_bytes(b"\x80\x05not a pickle")
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                catalogue = load_catalogue(csv_path)
+            self.assertEqual(len(catalogue.table), 1)
+            self.assertIn("Could not read cached catalogue", stderr.getvalue())
+
+
+class TestLookupJoin(unittest.TestCase):
+    def test_lookup_join_matches_merge(self):
+        df_left = df_mutations.copy()
+        df_left["CHROM"] = ["NC_000913.3", "NC_000913.3", "other", "NC_000913.3"]
+        for how in ["left", "inner"]:
+            df_merged = df_left.merge(
+                df_nt_resistance_variants,
+                how=how,
+                left_on=["CHROM", "POS", "REF", "ALT"],
+                right_on=["chrom", "position", "ref_nt", "alt_nt"],
+            )
+            df_joined = lookup_join(
+                df_left,
+                df_nt_resistance_variants,
+                left_on=["CHROM", "POS", "REF", "ALT"],
+                right_on=["chrom", "position", "ref_nt", "alt_nt"],
+                how=how,
+            )
+            pd.testing.assert_frame_equal(df_joined, df_merged)
+
+    def test_lookup_join_with_catalogue(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = Path(tmpdir) / "aa.csv"
+            df_aa_resistance_variants.to_csv(csv_path, index=False)
+            catalogue = load_catalogue(csv_path)
+        df_resistance_genes = pd.read_csv(
+            "tests/test_files/df_resistance_genes_correct.tsv",
+            sep="\t",
+            dtype={"AF": str},
+        )
+        df_resistance_with_impact = merge_resistance_genes_with_ref(
+            df_resistance_genes, catalogue
+        )
+        df_resistance_with_impact_correct = pd.read_csv(
+            "tests/test_files/df_resistance_with_impact_correct.tsv",
+            sep="\t",
+            dtype={"AF": str},
+        )
+        self.assertTrue(
+            df_resistance_with_impact.equals(df_resistance_with_impact_correct)
+        )
+
+
+class TestAlleleNormalisation(unittest.TestCase):
+    # Reference with the insertion of indel_1 (TCGATCGATCG after position 300)
+    # already present once, so callers can place the insertion anywhere in it
+    reference = "C" * 299 + "A" + "TCGATCGATCG" + "C" * 289
+
+    def test_split_multiallelic(self):
+        df_multiallelic = pd.DataFrame(
+            {
+                "CHROM": "NC_000913.3",
+                "POS": [100, 300],
+                "TYPE": ["SNP", "MIXED"],
+                "REF": ["A", "A"],
+                "ALT": ["T", "T,ATCGATCGATCG"],
+                "DP": 100,
+                "AF": ["1", "0.4,0.6"],
+            }
+        )
+        for compact in [False, True]:
+            if compact:
+                df_multiallelic = df_multiallelic.astype(
+                    {"CHROM": "category", "ALT": "category", "AF": "category"}
+                )
+            df_split = split_multiallelic(df_multiallelic)
+            self.assertEqual(df_split["POS"].tolist(), [100, 300, 300])
+            self.assertEqual(df_split["ALT"].tolist(), ["T", "T", "ATCGATCGATCG"])
+            self.assertEqual(df_split["AF"].tolist(), ["1", "0.4", "0.6"])
+            self.assertEqual(df_split["TYPE"].tolist(), ["SNP", "SNP", "INDEL"])
+            self.assertEqual(df_split["ALT"].dtype == "category", compact)
+
+            df_exact_matches = find_exact_matches(
+                df_mutations=df_split,
+                df_resistance_variants=df_nt_resistance_variants,
+                dict_col_rename=dict_col_rename_nt,
+            )
+            self.assertEqual(df_exact_matches["mutation_name"].tolist(), ["indel_1"])
+            self.assertEqual(df_exact_matches["allele_frequency"].tolist(), ["0.6"])
+
+    def test_left_normalise_indels(self):
+        # The same insertion placed at the end of the repeat, and a deletion of
+        # a C from the run of Cs
+        df_shifted = pd.DataFrame(
+            {
+                "CHROM": "NC_000913.3",
+                "POS": [311, 320, 100],
+                "TYPE": ["INDEL", "INDEL", "SNP"],
+                "REF": ["G", "CC", "C"],
+                "ALT": ["GTCGATCGATCG", "C", "T"],
+            }
+        )
+        sequences = {"NC_000913.3": np.frombuffer(self.reference.encode(), "S1")}
+        df_normalised = left_normalise_indels(df_shifted, sequences)
+        self.assertEqual(df_normalised["POS"].tolist(), [300, 311, 100])
+        self.assertEqual(df_normalised["REF"].tolist(), ["A", "GC", "C"])
+        self.assertEqual(df_normalised["ALT"].tolist(), ["ATCGATCGATCG", "G", "T"])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta_ref = Path(tmpdir) / "ref.fasta"
+            lines = [self.reference[i : i + 60] for i in range(0, 600, 60)]
+            fasta_ref.write_text(">NC_000913.3 test\n" + "\n".join(lines) + "\n")
+            df_normalised = normalise_alleles(df_shifted, fasta_ref)
+        df_exact_matches = find_exact_matches(
+            df_mutations=df_normalised.assign(DP=100, AF=1),
+            df_resistance_variants=df_nt_resistance_variants,
+            dict_col_rename=dict_col_rename_nt,
+        )
+        self.assertEqual(df_exact_matches["mutation_name"].tolist(), ["indel_1"])
+
+    def test_read_reference_sequences(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta_ref = Path(tmpdir) / "ref.fasta"
+            fasta_ref.write_text(">chr1 description\nACGTA\nCGT\n>chr2\naaaa\naaaa\n")
+            expected = {"chr1": b"ACGTACGT", "chr2": b"AAAAAAAA"}
+            sequences = read_reference_sequences(fasta_ref)
+            self.assertEqual(
+                {name: sequence.tobytes() for name, sequence in sequences.items()},
+                expected,
+            )
+
+            # With an index, only the sequences asked for are read
+            Path(f"{fasta_ref}.fai").write_text(
+                "chr1\t8\t18\t5\t6\nchr2\t8\t34\t4\t5\n"
+            )
+            for chroms in [{"chr2"}, {"chr1", "chr2", "chr3"}]:
+                sequences = read_reference_sequences(fasta_ref, chroms)
+                self.assertEqual(
+                    {name: sequence.tobytes() for name, sequence in sequences.items()},
+                    {name: expected[name] for name in chroms if name in expected},
+                )
+
+
+class TestVcfReader(unittest.TestCase):
+    vcf_path = Path("tests/test_files/df_mutations_test_read_input.vcf")
+    tsv_path = Path("tests/test_files/df_mutations_test_read_input.tsv")
+
+    def test_vcf_table_matches_variants_to_table(self):
+        # The filtered record at position 250 is skipped
+        with VcfTable(self.vcf_path) as table, open(self.tsv_path) as f:
+            self.assertEqual(table.read(), f.read())
+
+    def test_read_input_file_from_vcf(self):
+        df_from_vcf = read_input_file(self.vcf_path)
+        df_from_tsv = read_input_file(self.tsv_path)
+        self.assertTrue(df_from_vcf.equals(df_from_tsv))
+
+    def test_read_gzipped_vcf(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vcf_gz_path = Path(tmpdir) / "sample.vcf.gz"
+            with gzip.open(vcf_gz_path, "wb") as f:
+                f.write(self.vcf_path.read_bytes())
+            with open_variants_table(vcf_gz_path) as table:
+                df_from_vcf = pd.read_csv(table, sep="\t")
+        self.assertTrue(df_from_vcf.equals(pd.read_csv(self.tsv_path, sep="\t")))
+
+    def test_bcf_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bcf_path = Path(tmpdir) / "sample.bcf"
+            with gzip.open(bcf_path, "wb") as f:
+                f.write(b"BCF\x02\x02")
+            with self.assertRaises(ValueError):
+                VcfTable(bcf_path)
+
+    def test_get_variant_type(self):
+        self.assertEqual(get_variant_type("A", ["T"]), "SNP")
+        self.assertEqual(get_variant_type("AC", ["TG"]), "MNP")
+        self.assertEqual(get_variant_type("A", ["ATCG"]), "INDEL")
+        self.assertEqual(get_variant_type("A", ["<DEL>"]), "SYMBOLIC")
+        self.assertEqual(get_variant_type("A", ["T", "ATCG"]), "MIXED")
+        self.assertEqual(get_variant_type("A", []), "NO_VARIATION")
+
+
+class TestAnnotateAndCompare(unittest.TestCase):
+    vcf_path = Path("tests/test_files/df_mutations_test_read_input.vcf")
+    tsv_path = Path("tests/test_files/df_mutations_test_read_input.tsv")
+
+    def test_annotate_vcf_to_table(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Stand-in for bcftools csq that prints the already annotated VCF
+            fake_bcftools = Path(tmpdir) / "bcftools"
+            fake_bcftools.write_text('#!/bin/sh\nfor last; do :; done\ncat "$last"\n')
+            fake_bcftools.chmod(0o755)
+            annotated_vcf = Path(tmpdir) / "annotated.vcf"
+            table_copy = io.StringIO()
+
+            table_lines = annotate_vcf_to_table(
+                self.vcf_path,
+                Path("ref.fasta"),
+                Path("ref.gff"),
+                annotated_vcf=annotated_vcf,
+                bcftools=str(fake_bcftools),
+                table_copy=table_copy,
+            )
+            self.assertEqual("".join(table_lines), self.tsv_path.read_text())
+            self.assertEqual(table_copy.getvalue(), self.tsv_path.read_text())
+            self.assertEqual(annotated_vcf.read_text(), self.vcf_path.read_text())
+
+
+class TestVariantTyper(unittest.TestCase):
+    vcf_path = Path("tests/test_files/df_mutations_test_read_input.vcf")
+
+    def test_type_sample_matches_reports(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            aa_csv = Path(tmpdir) / "aa.csv"
+            nt_csv = Path(tmpdir) / "nt.csv"
+            df_aa_resistance_variants.to_csv(aa_csv, index=False)
+            df_nt_resistance_variants.to_csv(nt_csv, index=False)
+            typer = VariantTyper(aa_csv, nt_csv)
+            report = typer.type_sample(self.vcf_path, "sample1")
+
+            compare_aa_mutations.compare_sample(
+                self.vcf_path,
+                Path(tmpdir) / "aa.tsv",
+                Path(tmpdir) / "aa.full.tsv",
+                typer.aa_catalogue,
+            )
+            compare_nt_mutations.compare_sample(
+                self.vcf_path, Path(tmpdir) / "nt.tsv", typer.nt_catalogue
+            )
+            for df_report, written in [
+                (report.aa_mutations, "aa.tsv"),
+                (report.aa_full, "aa.full.tsv"),
+                (report.nt_mutations, "nt.tsv"),
+            ]:
+                write_report(df_report, Path(tmpdir) / "typer.tsv")
+                self.assertEqual(
+                    (Path(tmpdir) / "typer.tsv").read_text(),
+                    (Path(tmpdir) / written).read_text(),
+                )
+
+            report_from_lines = typer.type_sample(
+                self.vcf_path.read_text().splitlines(), "sample1"
+            )
+            self.assertEqual(report_from_lines.to_dict(), report.to_dict())
+            self.assertEqual(report.to_dict()["sample"], "sample1")
+            self.assertEqual(
+                len(report.to_dict()["full"]),
+                len(report.aa_full) + len(report.nt_mutations),
+            )
+
+    def test_serve_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            aa_csv = Path(tmpdir) / "aa.csv"
+            df_aa_resistance_variants.to_csv(aa_csv, index=False)
+            typer = VariantTyper(aa_csv)
+            requests = io.StringIO(
+                json.dumps({"id": 1, "sample": "s1", "input": str(self.vcf_path)})
+                + "\n\n"
+                + json.dumps({"id": 2, "input": str(Path(tmpdir) / "missing.vcf")})
+                + "\nnot json\n"
+            )
+            responses = io.StringIO()
+            serve_lines(typer, requests, responses)
+
+        list_responses = [
+            json.loads(line) for line in responses.getvalue().splitlines()
+        ]
+        self.assertEqual(len(list_responses), 3)
+        self.assertEqual(list_responses[0]["id"], 1)
+        self.assertEqual(
+            list_responses[0],
+            {**typer.type_sample(self.vcf_path, "s1").to_dict(), "id": 1},
+        )
+        self.assertEqual(list_responses[1]["id"], 2)
+        self.assertIn("FileNotFoundError", list_responses[1]["error"])
+        self.assertIn("error", list_responses[2])
+
+
+class TestTargetRegions(unittest.TestCase):
+    def test_merge_regions(self):
+        self.assertEqual(
+            merge_regions([("chr2", 0, 10), ("chr1", 20, 30), ("chr1", 5, 20)]),
+            [("chr1", 5, 30), ("chr2", 0, 10)],
+        )
+
+    def test_make_target_regions(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gff_path = Path(tmpdir) / "ref.gff"
+            gff_path.write_text(
+                "##gff-version 3\n"
+                "NC_000913.3\tRefSeq\tgene\t90\t150\t.\t+\t.\tID=gene-b0001;locus_tag=b0001\n"
+                "NC_000913.3\tRefSeq\tCDS\t95\t160\t.\t+\t0\tParent=gene-b0001;locus_tag=b0001\n"
+                "NC_000913.3\tRefSeq\tgene\t1000\t2000\t.\t+\t.\tID=gene-b0009;locus_tag=b0009\n"
+            )
+            aa_csv_path = Path(tmpdir) / "aa.csv"
+            df_aa_resistance_variants.to_csv(aa_csv_path, index=False)
+            nt_csv_path = Path(tmpdir) / "nt.csv"
+            df_nt_resistance_variants.to_csv(nt_csv_path, index=False)
+
+            regions = make_target_regions(
+                gff_path, [aa_csv_path, nt_csv_path], padding=10, screen_window=50
+            )
+        # One region spanning the gene and CDS of b0001, and the overlapping
+        # windows around positions 300, 399 and 500 merged into one. b0009 is
+        # not in the reference list.
+        self.assertEqual(regions, [("NC_000913.3", 79, 170), ("NC_000913.3", 239, 560)])
+
+
+class TestReferenceKey(unittest.TestCase):
+    def test_get_reference_keys(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, content in [
+                ("ref.fasta", ">chr1\nACGT\n"),
+                ("copy.fasta", ">chr1\nACGT\n"),
+                ("ref.gff", "##gff-version 3\n"),
+                ("other.gff", "##gff-version 3\nchr1\t.\tgene\t1\t4\t.\t+\t.\tID=a\n"),
+            ]:
+                Path(tmpdir, name).write_text(content)
+            samples = {
+                "sample1": {
+                    "reference": f"{tmpdir}/ref.fasta",
+                    "reference_gff": f"{tmpdir}/ref.gff",
+                },
+                "sample2": {
+                    "reference": f"{tmpdir}/copy.fasta",
+                    "reference_gff": f"{tmpdir}/ref.gff",
+                },
+                "sample3": {
+                    "reference": f"{tmpdir}/ref.fasta",
+                    "reference_gff": f"{tmpdir}/other.gff",
+                },
+                "sample4": {"genus": "other"},
+            }
+            dict_reference_keys = get_reference_keys(samples)
+        # Identical content at another path shares the key, another GFF does not
+        self.assertEqual(dict_reference_keys["sample1"], dict_reference_keys["sample2"])
+        self.assertNotEqual(
+            dict_reference_keys["sample1"], dict_reference_keys["sample3"]
+        )
+        self.assertNotIn("sample4", dict_reference_keys)
+
+
+class TestReferenceCache(unittest.TestCase):
+    def test_store_and_restore_reference(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir) / "cache"
+            files = [Path(tmpdir) / "ref.fasta", Path(tmpdir) / "ref.fasta.fai"]
+            for path in files:
+                path.write_text(f"{path.name}\n")
+
+            self.assertFalse(is_cached(cache_dir, "abc", ["ref.fasta"]))
+            store_reference(cache_dir, "abc", files, max_size=1000)
+            self.assertTrue(is_cached(cache_dir, "abc", ["ref.fasta", "ref.fasta.fai"]))
+
+            output_dir = Path(tmpdir) / "restored"
+            restore_reference(cache_dir, "abc", ["ref.fasta"], output_dir)
+            self.assertEqual((output_dir / "ref.fasta").read_text(), "ref.fasta\n")
+            with self.assertRaises(ValueError):
+                restore_reference(cache_dir, "abc", ["ref.dict"], output_dir)
+
+    def test_evict_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir) / "cache"
+            path = Path(tmpdir) / "ref.fasta"
+            path.write_text("A" * 100)
+            for reference_key, last_use in [("old", 1), ("new", 3), ("mid", 2)]:
+                entry_path = store_reference(cache_dir, reference_key, [path], 1000)
+                os.utime(entry_path, (last_use, last_use))
+
+            catalogue = load_catalogue(
+                Path("files/cauris/aa_resistance_list.csv"), cache_dir / "catalogues"
+            )
+            catalogue_path = get_cache_path(
+                Path("files/cauris/aa_resistance_list.csv"),
+                cache_dir / "catalogues",
+                catalogue.content_hash,
+            )
+            self.assertTrue(catalogue_path.exists())
+
+            # The catalogue was used last, so only the two oldest references go
+            max_size = 100 + catalogue_path.stat().st_size
+            evicted = evict_entries(cache_dir, max_size)
+            self.assertEqual([path.name for path in evicted], ["old", "mid"])
+            self.assertTrue(is_cached(cache_dir, "new", ["ref.fasta"]))
+            self.assertTrue(catalogue_path.exists())
+
+    @unittest.skipUnless(shutil.which("samtools"), "Indexing requires samtools")
+    def test_prepare_evicted_reference(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            cache_dir = tmp / "cache"
+            reference = tmp / "reference.fasta"
+            reference.write_text(">chr1 description\nACGTA\nCGT\n>chr2\nAAAA\nAAAA\n")
+            reference_gff = tmp / "reference.gff"
+            reference_gff.write_text("##gff-version 3\n")
+
+            # The entry was evicted after the run decided to restore it
+            filenames = ["ref.fasta", "ref.gff", "ref.fasta.fai"]
+            store_reference(cache_dir, "abc", [reference], max_size=1000)
+            evict_entries(cache_dir, max_size=0)
+            output_dir = tmp / "restored"
+            restored = restore_or_prepare_reference(
+                cache_dir, "abc", filenames, output_dir, reference, reference_gff
+            )
+            self.assertFalse(restored)
+            for filename in filenames:
+                self.assertTrue((output_dir / filename).is_file())
+            self.assertEqual(
+                (output_dir / "ref.fasta.fai").read_text(),
+                "chr1\t8\t18\t5\t6\nchr2\t8\t34\t4\t5\n",
+            )
+            with self.assertRaises(ValueError):
+                restore_or_prepare_reference(cache_dir, "abc", filenames, output_dir)
+
+
+class TestReportIo(unittest.TestCase):
+    @unittest.skipUnless(
+        importlib.util.find_spec("pyarrow"), "Parquet reports require pyarrow"
+    )
+    def test_parquet_report_schema(self):
+        df_report = pd.DataFrame(
+            {
+                "genetic_element": ["ERG11", "ERG11", "FKS1"],
+                "mutation_name": ["132E>132K", "-", "639S>639F"],
+                "chromosome": ["PEKT02000007.1", "PEKT02000007.1", "-"],
+                "position": [132, 250, 2250],
+                "depth": [30, "-", 12],
+                "allele_frequency": ["1", "0.5,0.25", np.nan],
+            }
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = Path(tmpdir) / "sample.aa.full.tsv"
+            write_report(df_report, output, parquet=True)
+            pd.testing.assert_frame_equal(
+                read_report(output), pd.read_csv(output, sep="\t")
+            )
+            df_parquet = read_report(Path(tmpdir) / "sample.aa.full.parquet")
+
+        self.assertEqual(df_parquet["genetic_element"].dtype, "category")
+        self.assertEqual(df_parquet["position"].dtype, "int32")
+        self.assertTrue(pd.isna(df_parquet["depth"][1]))
+        self.assertEqual(list(df_parquet["allele_frequency"][1]), [0.5, 0.25])
+        self.assertIsNone(df_parquet["allele_frequency"][2])
+
+
+class TestCombineReports(unittest.TestCase):
+    df_aa = pd.DataFrame(
+        {
+            "genetic_element": ["ERG11", "FKS1"],
+            "mutation_name": ["132E>132K", "639S>639F"],
+            "impact": ["resistance", np.nan],
+            "chromosome": ["PEKT02000007.1", "PEKT02000001.1"],
+            "position": [250, 2250],
+            "depth": [30, 12],
+            "allele_frequency": ["1.0", "0.5,0.5"],
+        }
+    )
+
+    def test_combine_reports_writes_floats_as_pandas(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            aa = Path(tmpdir) / "sample.aa.tsv"
+            nt = Path(tmpdir) / "sample.nt.tsv"
+            aa.write_text(
+                "genetic_element\tchromosome\tposition\tallele_frequency\n"
+                "ERG11\tPEKT02000007.1\t132\t0.0013436424411240122\n"
+            )
+            nt.write_text(
+                "chromosome\tposition\tallele_frequency\tdepth\n"
+                "PEKT02000001.1\t2250\t0.33333333333333331\t12\n"
+            )
+            output = Path(tmpdir) / "sample.combined.tsv"
+            combine_reports(aa, nt, output)
+            expected = Path(tmpdir) / "expected.tsv"
+            df_combined = combine_aa_nt(
+                pd.read_csv(aa, sep="\t"), pd.read_csv(nt, sep="\t")
+            )
+            df_combined.to_csv(expected, sep="\t", index=False)
+            self.assertEqual(output.read_text(), expected.read_text())
+            # pandas does not write every float with its shortest round-trip
+            # representation, so the frequencies are not copied as text
+            self.assertEqual(
+                list(pd.read_csv(output, sep="\t", dtype=str)["allele_frequency"]),
+                ["0.3333333333333333", "0.001343642441124"],
+            )
+
+
+class TestStartup(unittest.TestCase):
+    def test_startup_budgets(self):
+        for module, budget in startup_budgets.items():
+            with self.subTest(module=module):
+                # The fastest of a few imports is the least affected by other load
+                import_times = []
+                for _ in range(3):
+                    import_time, imported = measure_import(module)
+                    import_times.append(import_time)
+                self.assertEqual(get_heavy_imports(imported), [])
+                self.assertLess(min(import_times), budget)
+
+    @unittest.skipUnless(
+        importlib.util.find_spec("juno_library"), "The pipeline requires juno_library"
+    )
+    def test_help_lists_pipeline_options(self):
+        result = subprocess.run(
+            [sys.executable, "apollo_variant_typing.py", "--help"],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("--input", result.stdout)
+        self.assertIn("--presets-path", result.stdout)
+
+
+class TestCohortStore(unittest.TestCase):
+    def test_add_samples_and_get_matrix(self):
+        columns = [
+            "genetic_element",
+            "mutation_name",
+            "impact",
+            "chromosome",
+            "position",
+            "ref_nt",
+            "alt_nt",
+            "depth",
+            "allele_frequency",
+        ]
+        reports = {
+            "s1": [
+                ["Cyp51A", "L98H", "resistant", "chr4", 100, "T", "A", 30, "1"],
+                ["Cyp51A", "-", "-", "chr4", 200, "G", "C", 20, "0.5"],
+            ],
+            "s2": [["Cyp51A", "L98H", "resistant", "chr4", 100, "T", "A", 25, "1"]],
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = Path(tmpdir) / "cohort.sqlite"
+            list_samples = []
+            for sample, rows in reports.items():
+                report = Path(tmpdir) / f"{sample}.combined.full.tsv"
+                pd.DataFrame(rows, columns=columns).to_csv(
+                    report, sep="\t", index=False
+                )
+                list_samples.append(
+                    {"sample": sample, "species": "afumigatus", "report": str(report)}
+                )
+            df_status = add_samples(database, list_samples)
+            self.assertEqual(list(df_status["status"]), ["added", "added"])
+
+            # Only the changed report is rewritten
+            pd.DataFrame(reports["s1"][:1], columns=columns).to_csv(
+                list_samples[0]["report"], sep="\t", index=False
+            )
+            df_status = add_samples(database, list_samples)
+            self.assertEqual(list(df_status["status"]), ["updated", "unchanged"])
+
+            df_matrix = get_matrix(database, "depth")
+            self.assertEqual(list(df_matrix.index), ["s1", "s2"])
+            self.assertEqual(list(df_matrix.columns), ["chr4:100:T>A"])
+            self.assertEqual(list(df_matrix["chr4:100:T>A"]), [30, 25])
+
+            pd.DataFrame(reports["s1"], columns=columns).to_csv(
+                list_samples[0]["report"], sep="\t", index=False
+            )
+            add_samples(database, list_samples[:1])
+            df_presence = get_matrix(database)
+            self.assertEqual(list(df_presence.loc["s2"]), [1, 0])
+            df_known = get_matrix(database, known_only=True, samples=["s1"])
+            self.assertEqual(list(df_known.columns), ["chr4:100:T>A"])
+
+    def test_retype_cohort(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            database = tmp / "cohort" / "cohort.sqlite"
+            df_aa_resistance_variants.to_csv(tmp / "aa.csv", index=False)
+            variants = "tests/test_files/df_mutations_test_read_input.vcf"
+            compare_batch(
+                [
+                    {
+                        "sample": "s1",
+                        "input": variants,
+                        "output": str(tmp / "s1.tsv"),
+                        "full_output": str(tmp / "s1.full.tsv"),
+                        "resistance_variants_csv": str(tmp / "aa.csv"),
+                    }
+                ],
+                "aa",
+            )
+            list_samples = [
+                {
+                    "sample": "s1",
+                    "species": "cauris",
+                    "report": str(tmp / "s1.full.tsv"),
+                    "variants": variants,
+                    "aa_resistance_variants_csv": str(tmp / "aa.csv"),
+                }
+            ]
+            add_samples(database, list_samples)
+            self.assertTrue(
+                (tmp / "cohort" / "annotated_variants" / "s1.vcf.gz").exists()
+            )
+            self.assertEqual(get_matrix(database, known_only=True).shape, (1, 1))
+
+            # Nothing changed, so nothing is re-typed
+            output_dir = tmp / "retyped"
+            df_status = retype_cohort(database, "cauris", output_dir, tmp / "aa.csv")
+            self.assertEqual(df_status.shape[0], 0)
+
+            # A mutation is no longer known in the new catalogue
+            df_new = df_aa_resistance_variants.assign(alt_aa="10R")
+            df_new.to_csv(tmp / "aa_new.csv", index=False)
+            df_status = retype_cohort(
+                database, "cauris", output_dir, tmp / "aa_new.csv"
+            )
+            self.assertEqual(list(df_status["status"]), ["updated"])
+            df_report = pd.read_csv(
+                output_dir / "cauris_typing" / "resistance_mutations" / "s1.full.tsv",
+                sep="\t",
+            )
+            self.assertEqual(
+                set(df_report["catalogue_version"]),
+                {load_catalogue(tmp / "aa_new.csv").version},
+            )
+            self.assertEqual(get_matrix(database, known_only=True).shape, (1, 0))
+
+
+class TestClusterProfile(unittest.TestCase):
+    def setUp(self):
+        with open("config/pipeline_parameters.yaml") as f:
+            self.parameters = yaml.safe_load(f)
+
+    def test_profile(self):
+        profile = make_profile(self.parameters, queue="short")
+        self.assertIn("--time={resources.runtime}", profile["cluster"])
+        self.assertTrue(profile["cluster"].endswith(" --partition=short"))
+        self.assertIn(
+            f"runtime={self.parameters['runtime_min']['other']}",
+            profile["default-resources"],
+        )
+        self.assertNotIn("group-components", profile)
+
+    def test_samples_per_job(self):
+        profile = make_profile(self.parameters, samples_per_job=10)
+        self.assertNotIn("group-components", profile)
+        self.parameters["group_sample_jobs"] = True
+        profile = make_profile(self.parameters, "lsf", samples_per_job=10)
+        self.assertTrue(profile["cluster"].startswith("bsub "))
+        self.assertEqual(profile["group-components"], ["sample=10"])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            make_profile(self.parameters, scheduler="pbs")
+        with self.assertRaises(ValueError):
+            make_profile(self.parameters, samples_per_job=0)
+
+
+class TestBenchmarkReport(unittest.TestCase):
+    header = "s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time\n"
+
+    def write_benchmark(self, benchmark_dir, rule, name, s, max_rss, cpu_time):
+        path = benchmark_dir / rule / f"{name}.tsv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            self.header + f"{s}\t0:00:00\t{max_rss}\t-\t-\t-\t1.5\t0.5\t-\t{cpu_time}\n"
+        )
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            benchmark_dir = Path(tmpdir)
+            for i in range(4):
+                self.write_benchmark(
+                    benchmark_dir, "afumigatus_annotate_vcf", f"af{i}", 100, 1000, 180
+                )
+            self.write_benchmark(benchmark_dir, "index_sample_vcf", "ca1", 30, 200, 10)
+            self.write_benchmark(benchmark_dir, "copy_ref", "abc", 2, "-", 1)
+            df_benchmarks = read_benchmarks(benchmark_dir, {"ca1": "cauris"})
+        self.assertEqual(
+            df_benchmarks.groupby("rule")["species"].first().to_dict(),
+            {
+                "afumigatus_annotate_vcf": "afumigatus",
+                "copy_ref": "shared",
+                "index_sample_vcf": "cauris",
+            },
+        )
+
+        df_species = summarize(df_benchmarks, ["species"]).set_index("species")
+        self.assertEqual(df_species.loc["afumigatus", "jobs"], 4)
+        self.assertEqual(df_species.loc["afumigatus", "wall_time_s_total"], 400)
+        self.assertEqual(df_species.loc["afumigatus", "io_in_mb_total"], 6)
+
+        df_requested = pd.DataFrame(
+            {"rule": ["copy_ref"], "threads": [1], "mem_gb": [1], "runtime": [10]}
+        )
+        df_suggestions = suggest_resources(df_benchmarks, df_requested).set_index(
+            "rule"
+        )
+        self.assertEqual(
+            df_suggestions.loc["afumigatus_annotate_vcf"][
+                ["suggested_threads", "suggested_mem_gb", "suggested_runtime_min"]
+            ].tolist(),
+            [2, 2, 2],
+        )
+        self.assertTrue(pd.isna(df_suggestions.loc["copy_ref", "suggested_mem_gb"]))
+        self.assertEqual(df_suggestions.loc["copy_ref", "requested_runtime_min"], 10)
+        self.assertTrue(
+            pd.isna(df_suggestions.loc["index_sample_vcf", "requested_mem_gb"])
+        )
+
+
+class TestStageProfiler(unittest.TestCase):
+    def run_script(self, script, args, env_value=""):
+        subprocess.run(
+            [sys.executable, "-m", f"workflow.scripts.{script}", *args],
+            env={**os.environ, "APOLLO_PROFILE_STAGES": env_value},
+            check=True,
+        )
+
+    def test_compare_scripts(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            df_aa_resistance_variants.to_csv(tmp / "aa.csv", index=False)
+            df_nt_resistance_variants.to_csv(tmp / "nt.csv", index=False)
+            self.run_script(
+                "compare_aa_mutations",
+                [
+                    "-i",
+                    "tests/test_files/df_mutations_test_read_input.tsv",
+                    "-o",
+                    str(tmp / "sample.aa.tsv"),
+                    "--full-output",
+                    str(tmp / "sample.aa.full.tsv"),
+                    "-r",
+                    str(tmp / "aa.csv"),
+                ],
+                env_value="1",
+            )
+            self.run_script(
+                "compare_nt_mutations",
+                [
+                    "-i",
+                    "tests/test_files/df_mutations.tsv",
+                    "-o",
+                    str(tmp / "sample.nt.tsv"),
+                    "-r",
+                    str(tmp / "nt.csv"),
+                    "--cprofile",
+                ],
+            )
+            with open(tmp / "sample.aa.profile.json") as f:
+                aa_profile = json.load(f)
+            with open(tmp / "sample.nt.profile.json") as f:
+                nt_profile = json.load(f)
+            df_aa_full = pd.read_csv(tmp / "sample.aa.full.tsv", sep="\t")
+            df_nt = pd.read_csv(tmp / "sample.nt.tsv", sep="\t")
+            self.assertTrue(
+                all(Path(stage["cprofile"]).is_file() for stage in nt_profile["stages"])
+            )
+            pstats.Stats(nt_profile["stages"][-1]["cprofile"])
+            self.assertFalse(any(tmp.glob("sample.aa.*.prof")))
+
+        self.assertEqual(
+            [stage["name"] for stage in aa_profile["stages"]],
+            [
+                "load_catalogue",
+                "read_input_file",
+                "filter_for_resistance_genes",
+                "merge_resistance_genes_with_ref",
+                "filter_for_known_mutations",
+                "write_report",
+            ],
+        )
+        self.assertEqual(
+            [stage["name"] for stage in nt_profile["stages"]],
+            [
+                "load_catalogue",
+                "read_input_file",
+                "normalise_alleles",
+                "find_exact_matches",
+                "screen_for_possible_cnv_in_known_regions",
+                "combine_exact_matches_and_possible_cnvs",
+                "write_report",
+            ],
+        )
+        self.assertEqual(
+            aa_profile["stages"][0]["rows_out"], len(df_aa_resistance_variants)
+        )
+        self.assertEqual(aa_profile["stages"][4]["rows_in"], len(df_aa_full))
+        self.assertEqual(nt_profile["stages"][-1]["rows_out"], len(df_nt))
+        for stage in aa_profile["stages"] + nt_profile["stages"]:
+            self.assertGreaterEqual(stage["wall_time_s"], 0)
+            self.assertGreater(stage["peak_rss_mb"], 0)
+
+    def test_disabled(self):
+        profiler = StageProfiler(enabled=False)
+        with profiler.stage("stage", 10) as stage:
+            stage["rows_out"] = 5
+        with tempfile.TemporaryDirectory() as tmpdir:
+            profiler.write(Path(tmpdir) / "profile.json")
+            self.assertEqual(list(Path(tmpdir).iterdir()), [])
+        self.assertEqual(profiler.stages, [])
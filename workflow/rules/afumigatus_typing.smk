@@ -1,12 +1,52 @@
+rule afumigatus_target_regions:
+    input:
+        gff_ref=get_reference_file("ref.gff"),
+        aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+            "aa_resistance_variants_csv"
+        ],
+        nt_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+            "nt_resistance_variants_csv"
+        ],
+    output:
+        bed=OUT + "/afumigatus_typing/target_regions/{sample}.bed",
+    message:
+        "Make regions around resistance genes to annotate for {wildcards.sample}"
+    group:
+        get_sample_group()
+    resources:
+        mem_gb=config["mem_gb"]["other"],
+        runtime=config["runtime_min"]["other"],
+    params:
+        padding=config["target_regions"]["padding"],
+        screen_window=config["tandem_repeat_screen"]["window"],
+    log:
+        OUT + "/log/afumigatus_target_regions/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/afumigatus_target_regions/{sample}.tsv"
+    shell:
+        """
+python -m workflow.scripts.make_target_regions \
+    --gff {input.gff_ref} \
+    --resistance_variants_csv {input.aa_resistance_variants_csv} {input.nt_resistance_variants_csv} \
+    --output {output.bed} \
+    --padding {params.padding} \
+    --screen-window {params.screen_window} \
+    2>{log}
+        """
+
+
 rule afumigatus_annotate_vcf:
     input:
-        vcf=lambda wildcards: SAMPLES[wildcards.sample]["vcf"],
-        gff_ref=OUT + "/prepared_files/{sample}_ref.gff",
-        fasta_ref=OUT + "/prepared_files/{sample}_ref.fasta",
+        **get_annotation_input("afumigatus_typing"),
+        gff_ref=get_reference_file("ref.gff"),
+        fasta_ref=get_reference_file("ref.fasta"),
+        fasta_ref_fai=get_reference_file("ref.fasta.fai"),
     output:
         vcf=OUT + "/afumigatus_typing/annotated_vcf/{sample}.vcf",
     message:
         "Annotate VCF for {wildcards.sample}"
+    group:
+        get_sample_group()
     container:
         "docker://staphb/bcftools:1.18"
     conda:
@@ -14,12 +54,18 @@ rule afumigatus_annotate_vcf:
     threads: config["threads"]["bcftools"]
     resources:
         mem_gb=config["mem_gb"]["bcftools"],
+        runtime=config["runtime_min"]["bcftools"],
     log:
         OUT + "/log/bcftools_csq/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/afumigatus_annotate_vcf/{sample}.tsv"
+    params:
+        regions=get_regions_option,
     shell:
         """
 bcftools csq \
     --phase a \
+    {params.regions} \
     -f {input.fasta_ref} \
     -g {input.gff_ref} \
     {input.vcf} \
@@ -35,6 +81,8 @@ rule afumigatus_annotated_vcf_to_table:
         tsv=OUT + "/afumigatus_typing/annotated_variants/{sample}.tsv",
     message:
         "Convert annotated variants to table for {wildcards.sample}"
+    group:
+        get_sample_group()
     container:
         "docker://broadinstitute/gatk:4.3.0.0"
     conda:
@@ -42,8 +90,11 @@ rule afumigatus_annotated_vcf_to_table:
     threads: config["threads"]["gatk"]
     resources:
         mem_gb=config["mem_gb"]["gatk"],
+        runtime=config["runtime_min"]["gatk"],
     log:
         OUT + "/log/afumigatus_annotated_vcf_to_table/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/afumigatus_annotated_vcf_to_table/{sample}.tsv"
     shell:
         """
 gatk VariantsToTable \
@@ -60,52 +111,289 @@ gatk VariantsToTable \
         """
 
 
-rule afumigatus_compare_aa_mutations:
-    input:
-        tsv=OUT + "/afumigatus_typing/annotated_variants/{sample}.tsv",
-        aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
-            "aa_resistance_variants_csv"
-        ],
-    output:
-        tsv=OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.tsv",
-        full=OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.tsv",
-    message:
-        "Extract AMR mutations (amino acid based) for {wildcards.sample}"
-    resources:
-        mem_gb=config["mem_gb"]["compare"],
-    log:
-        OUT + "/log/afumigatus_compare_aa_mutations/{sample}.log",
-    shell:
-        """
-python workflow/scripts/compare_aa_mutations.py \
-    --input {input.tsv} \
+if config["fused_annotation"]:
+
+    ruleorder: afumigatus_annotate_and_compare > afumigatus_annotate_vcf
+
+    rule afumigatus_annotate_and_compare:
+        input:
+            **get_annotation_input("afumigatus_typing"),
+            gff_ref=get_reference_file("ref.gff"),
+            fasta_ref=get_reference_file("ref.fasta"),
+            fasta_ref_fai=get_reference_file("ref.fasta.fai"),
+            aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "aa_resistance_variants_csv"
+            ],
+            nt_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "nt_resistance_variants_csv"
+            ],
+        output:
+            **with_parquet_outputs(
+                aa=OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.tsv",
+                aa_full=OUT
+                + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.tsv",
+                nt=OUT + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.tsv",
+            ),
+            **get_annotated_vcf_output("afumigatus_typing"),
+        message:
+            "Annotate VCF and extract AMR mutations for {wildcards.sample}"
+        group:
+            get_sample_group()
+        conda:
+            "../envs/bcftools_python.yaml"
+        threads: config["threads"]["bcftools"]
+        resources:
+            mem_gb=config["mem_gb"]["bcftools"],
+            runtime=config["runtime_min"]["bcftools"],
+        params:
+            catalogue_cache=get_catalogue_cache_option(),
+            parquet=get_parquet_option(),
+            regions=lambda wildcards, input: (
+                f"--regions {input.regions}" if "regions" in input.keys() else ""
+            ),
+            annotated_vcf=lambda wildcards, output: (
+                f"--annotated-vcf {output.vcf}" if "vcf" in output.keys() else ""
+            ),
+            left_normalise=(
+                "--left-normalise" if config["left_normalise_indels"] else ""
+            ),
+            screen_window=config["tandem_repeat_screen"]["window"],
+            min_indel_length=config["tandem_repeat_screen"]["min_indel_length"],
+        log:
+            OUT + "/log/afumigatus_annotate_and_compare/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/afumigatus_annotate_and_compare/{sample}.tsv"
+        shell:
+            """
+python -m workflow.scripts.annotate_and_compare \
+    --vcf {input.vcf} \
+    --fasta-ref {input.fasta_ref} \
+    --gff-ref {input.gff_ref} \
+    {params.regions} \
+    {params.annotated_vcf} \
+    --aa-output {output.aa} \
+    --aa-full-output {output.aa_full} \
+    --aa-resistance-variants-csv {input.aa_resistance_variants_csv} \
+    --nt-output {output.nt} \
+    --nt-resistance-variants-csv {input.nt_resistance_variants_csv} \
+    {params.left_normalise} \
+    --screen-window {params.screen_window} \
+    --min-indel-length {params.min_indel_length} \
+    {params.catalogue_cache} \
+    {params.parquet} \
+    > {log} 2>&1
+            """
+
+elif config["batch_size"]["compare"] > 1:
+    for batch_nr, batch in enumerate(
+        make_batches(
+            get_samples_of_species(SAMPLES, "aspergillus", "fumigatus"),
+            config["batch_size"]["compare"],
+        )
+    ):
+
+        rule:
+            name:
+                f"afumigatus_compare_aa_mutations_batch_{batch_nr}"
+            input:
+                variants=expand(
+                    get_variants_path("afumigatus_typing"),
+                    sample=batch,
+                ),
+                aa_resistance_variants_csv=[
+                    SAMPLES[sample]["aa_resistance_variants_csv"] for sample in batch
+                ],
+            output:
+                **with_parquet_outputs(
+                    tsv=expand(
+                        OUT
+                        + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.tsv",
+                        sample=batch,
+                    ),
+                    full=expand(
+                        OUT
+                        + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.tsv",
+                        sample=batch,
+                    ),
+                ),
+            message:
+                f"Extract AMR mutations (amino acid based) for batch {batch_nr}"
+            threads: config["threads"]["compare"]
+            resources:
+                mem_gb=config["mem_gb"]["compare"],
+                runtime=config["runtime_min"]["compare"],
+            params:
+                catalogue_cache=get_catalogue_cache_option(),
+                parquet=get_parquet_option(),
+                manifest=OUT
+                + f"/afumigatus_typing/resistance_mutations/aa/batch_{batch_nr}.manifest.tsv",
+                manifest_content=make_manifest(
+                    batch,
+                    get_variants_path("afumigatus_typing"),
+                    OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.tsv",
+                    OUT
+                    + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.tsv",
+                    "aa_resistance_variants_csv",
+                ),
+            log:
+                OUT + f"/log/afumigatus_compare_aa_mutations/batch_{batch_nr}.log",
+            benchmark:
+                OUT + f"/benchmark/afumigatus_compare_aa_mutations/batch_{batch_nr}.tsv"
+            run:
+                with open(params.manifest, "w") as f:
+                    f.write(params.manifest_content)
+                shell(
+                    "python -m workflow.scripts.compare_mutations_batch"
+                    " --mode aa"
+                    " --manifest {params.manifest}"
+                    " --threads {threads}"
+                    " {params.catalogue_cache}"
+                    " {params.parquet}"
+                    " > {log} 2>&1"
+                )
+
+        rule:
+            name:
+                f"afumigatus_compare_nt_mutations_batch_{batch_nr}"
+            input:
+                **get_normalisation_input(batch),
+                variants=expand(
+                    get_variants_path("afumigatus_typing"),
+                    sample=batch,
+                ),
+                nt_resistance_variants_csv=[
+                    SAMPLES[sample]["nt_resistance_variants_csv"] for sample in batch
+                ],
+            output:
+                **with_parquet_outputs(
+                    tsv=expand(
+                        OUT
+                        + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.tsv",
+                        sample=batch,
+                    ),
+                ),
+            message:
+                f"Extract AMR mutations (nucleotide based) for batch {batch_nr}"
+            threads: config["threads"]["compare"]
+            resources:
+                mem_gb=config["mem_gb"]["compare"],
+                runtime=config["runtime_min"]["compare"],
+            params:
+                catalogue_cache=get_catalogue_cache_option(),
+                parquet=get_parquet_option(),
+                manifest=OUT
+                + f"/afumigatus_typing/resistance_mutations/nt/batch_{batch_nr}.manifest.tsv",
+                manifest_content=make_manifest(
+                    batch,
+                    get_variants_path("afumigatus_typing"),
+                    OUT + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.tsv",
+                    None,
+                    "nt_resistance_variants_csv",
+                    fasta_ref=config["left_normalise_indels"],
+                ),
+                screen_window=config["tandem_repeat_screen"]["window"],
+                min_indel_length=config["tandem_repeat_screen"]["min_indel_length"],
+            log:
+                OUT + f"/log/afumigatus_compare_nt_mutations/batch_{batch_nr}.log",
+            benchmark:
+                OUT + f"/benchmark/afumigatus_compare_nt_mutations/batch_{batch_nr}.tsv"
+            run:
+                with open(params.manifest, "w") as f:
+                    f.write(params.manifest_content)
+                shell(
+                    "python -m workflow.scripts.compare_mutations_batch"
+                    " --mode nt"
+                    " --manifest {params.manifest}"
+                    " --threads {threads}"
+                    " --screen-window {params.screen_window}"
+                    " --min-indel-length {params.min_indel_length}"
+                    " {params.catalogue_cache}"
+                    " {params.parquet}"
+                    " > {log} 2>&1"
+                )
+
+
+else:
+
+    rule afumigatus_compare_aa_mutations:
+        input:
+            variants=get_variants_path("afumigatus_typing"),
+            aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "aa_resistance_variants_csv"
+            ],
+        output:
+            **with_parquet_outputs(
+                tsv=OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.tsv",
+                full=OUT
+                + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.tsv",
+            ),
+        message:
+            "Extract AMR mutations (amino acid based) for {wildcards.sample}"
+        group:
+            get_sample_group()
+        threads: config["threads"]["compare"]
+        resources:
+            mem_gb=config["mem_gb"]["compare"],
+            runtime=config["runtime_min"]["compare"],
+        params:
+            catalogue_cache=get_catalogue_cache_option(),
+            parquet=get_parquet_option(),
+        log:
+            OUT + "/log/afumigatus_compare_aa_mutations/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/afumigatus_compare_aa_mutations/{sample}.tsv"
+        shell:
+            """
+python -m workflow.scripts.compare_aa_mutations \
+    --input {input.variants} \
     --output {output.tsv} \
     --full-output {output.full} \
-    --resistance_variants_csv {input.aa_resistance_variants_csv}
-        """
-
+    --resistance_variants_csv {input.aa_resistance_variants_csv} \
+    {params.catalogue_cache} \
+    {params.parquet}
+            """
 
-rule afumigatus_compare_nt_mutations:
-    input:
-        tsv=OUT + "/afumigatus_typing/annotated_variants/{sample}.tsv",
-        nt_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
-            "nt_resistance_variants_csv"
-        ],
-    output:
-        tsv=OUT + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.tsv",
-    message:
-        "Extract AMR mutations (nucleotide based) for {wildcards.sample}"
-    resources:
-        mem_gb=config["mem_gb"]["compare"],
-    log:
-        OUT + "/log/afumigatus_compare_nt_mutations/{sample}.log",
-    shell:
-        """
-python workflow/scripts/compare_nt_mutations.py \
-    --input {input.tsv} \
+    rule afumigatus_compare_nt_mutations:
+        input:
+            **get_normalisation_input(),
+            variants=get_variants_path("afumigatus_typing"),
+            nt_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "nt_resistance_variants_csv"
+            ],
+        output:
+            **with_parquet_outputs(
+                tsv=OUT + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.tsv",
+            ),
+        message:
+            "Extract AMR mutations (nucleotide based) for {wildcards.sample}"
+        group:
+            get_sample_group()
+        threads: config["threads"]["compare"]
+        resources:
+            mem_gb=config["mem_gb"]["compare"],
+            runtime=config["runtime_min"]["compare"],
+        params:
+            catalogue_cache=get_catalogue_cache_option(),
+            parquet=get_parquet_option(),
+            fasta_ref=get_normalisation_option,
+            screen_window=config["tandem_repeat_screen"]["window"],
+            min_indel_length=config["tandem_repeat_screen"]["min_indel_length"],
+        log:
+            OUT + "/log/afumigatus_compare_nt_mutations/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/afumigatus_compare_nt_mutations/{sample}.tsv"
+        shell:
+            """
+python -m workflow.scripts.compare_nt_mutations \
+    --input {input.variants} \
     --output {output.tsv} \
-    --resistance_variants_csv {input.nt_resistance_variants_csv}
-        """
+    --resistance_variants_csv {input.nt_resistance_variants_csv} \
+    {params.fasta_ref} \
+    --screen-window {params.screen_window} \
+    --min-indel-length {params.min_indel_length} \
+    {params.catalogue_cache} \
+    {params.parquet}
+            """
 
 
 rule afumigatus_combine_aa_nt_mutations:
@@ -118,12 +406,50 @@ rule afumigatus_combine_aa_nt_mutations:
         full=OUT + "/afumigatus_typing/resistance_mutations/{sample}.combined.full.tsv",
     message:
         "Combine AMR mutations (amino acid and nucleotide based) for {wildcards.sample}"
+    group:
+        get_sample_group()
+    threads: config["threads"]["compare"]
     resources:
         mem_gb=config["mem_gb"]["compare"],
+        runtime=config["runtime_min"]["compare"],
     log:
         OUT + "/log/afumigatus_combine_aa_nt_mutations/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/afumigatus_combine_aa_nt_mutations/{sample}.tsv"
     shell:
         """
-        python workflow/scripts/combine_aa_nt_reports.py -aa {input.aa} -nt {input.nt} -o {output.tsv}
-        python workflow/scripts/combine_aa_nt_reports.py -aa {input.aa_full} -nt {input.nt} -o {output.full}
+        python -m workflow.scripts.combine_aa_nt_reports -aa {input.aa} -nt {input.nt} -o {output.tsv}
+        python -m workflow.scripts.combine_aa_nt_reports -aa {input.aa_full} -nt {input.nt} -o {output.full}
         """
+
+
+if config["parquet_reports"]:
+
+    rule afumigatus_combine_aa_nt_mutations_parquet:
+        input:
+            aa=OUT + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.parquet",
+            nt=OUT + "/afumigatus_typing/resistance_mutations/nt/{sample}.nt.parquet",
+            aa_full=OUT
+            + "/afumigatus_typing/resistance_mutations/aa/{sample}.aa.full.parquet",
+        output:
+            parquet=OUT
+            + "/afumigatus_typing/resistance_mutations/{sample}.combined.parquet",
+            full=OUT
+            + "/afumigatus_typing/resistance_mutations/{sample}.combined.full.parquet",
+        message:
+            "Combine AMR mutations (amino acid and nucleotide based) as Parquet for {wildcards.sample}"
+        group:
+            get_sample_group()
+        threads: config["threads"]["compare"]
+        resources:
+            mem_gb=config["mem_gb"]["compare"],
+            runtime=config["runtime_min"]["compare"],
+        log:
+            OUT + "/log/afumigatus_combine_aa_nt_mutations_parquet/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/afumigatus_combine_aa_nt_mutations_parquet/{sample}.tsv"
+        shell:
+            """
+            python -m workflow.scripts.combine_aa_nt_reports -aa {input.aa} -nt {input.nt} -o {output.parquet}
+            python -m workflow.scripts.combine_aa_nt_reports -aa {input.aa_full} -nt {input.nt} -o {output.full}
+            """
@@ -0,0 +1,34 @@
+rule benchmark_report:
+    input:
+        BENCHMARK_REPORT_INPUT,
+    output:
+        html=OUT + "/benchmark_report/benchmark_report.html",
+        species=OUT + "/benchmark_report/species.tsv",
+        rules=OUT + "/benchmark_report/rules.tsv",
+        suggestions=OUT + "/benchmark_report/suggested_resources.tsv",
+    log:
+        OUT + "/log/benchmark_report.log",
+    resources:
+        mem_gb=config["mem_gb"]["other"],
+        runtime=config["runtime_min"]["other"],
+    params:
+        benchmark_dir=OUT + "/benchmark",
+        species=OUT + "/benchmark_report/species_by_name.tsv",
+        species_content=make_benchmark_species_table(),
+        requested=OUT + "/benchmark_report/requested_resources.tsv",
+        requested_content=make_requested_resources_table,
+    message:
+        "Summarize the run time, memory and I/O of the jobs"
+    run:
+        with open(params.species, "w") as f:
+            f.write(params.species_content)
+        with open(params.requested, "w") as f:
+            f.write(params.requested_content)
+        shell(
+            "python -m workflow.scripts.summarize_benchmarks"
+            " --benchmark-dir {params.benchmark_dir}"
+            " --species {params.species}"
+            " --requested {params.requested}"
+            " --output-dir $(dirname {output.html})"
+            " > {log} 2>&1"
+        )
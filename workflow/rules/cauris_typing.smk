@@ -1,12 +1,49 @@
+rule cauris_target_regions:
+    input:
+        gff_ref=get_reference_file("ref.gff"),
+        aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+            "aa_resistance_variants_csv"
+        ],
+    output:
+        bed=OUT + "/cauris_typing/target_regions/{sample}.bed",
+    message:
+        "Make regions around resistance genes to annotate for {wildcards.sample}"
+    group:
+        get_sample_group()
+    resources:
+        mem_gb=config["mem_gb"]["other"],
+        runtime=config["runtime_min"]["other"],
+    params:
+        padding=config["target_regions"]["padding"],
+        screen_window=config["tandem_repeat_screen"]["window"],
+    log:
+        OUT + "/log/cauris_target_regions/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/cauris_target_regions/{sample}.tsv"
+    shell:
+        """
+python -m workflow.scripts.make_target_regions \
+    --gff {input.gff_ref} \
+    --resistance_variants_csv {input.aa_resistance_variants_csv} \
+    --output {output.bed} \
+    --padding {params.padding} \
+    --screen-window {params.screen_window} \
+    2>{log}
+        """
+
+
 rule cauris_annotate_vcf:
     input:
-        vcf=lambda wildcards: SAMPLES[wildcards.sample]["vcf"],
-        gff_ref=OUT + "/prepared_files/{sample}_ref.gff",
-        fasta_ref=OUT + "/prepared_files/{sample}_ref.fasta",
+        **get_annotation_input("cauris_typing"),
+        gff_ref=get_reference_file("ref.gff"),
+        fasta_ref=get_reference_file("ref.fasta"),
+        fasta_ref_fai=get_reference_file("ref.fasta.fai"),
     output:
         vcf=OUT + "/cauris_typing/annotated_vcf/{sample}.vcf",
     message:
         "Annotate VCF for {wildcards.sample}"
+    group:
+        get_sample_group()
     container:
         "docker://staphb/bcftools:1.18"
     conda:
@@ -14,12 +51,18 @@ rule cauris_annotate_vcf:
     threads: config["threads"]["bcftools"]
     resources:
         mem_gb=config["mem_gb"]["bcftools"],
+        runtime=config["runtime_min"]["bcftools"],
     log:
         OUT + "/log/bcftools_csq/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/cauris_annotate_vcf/{sample}.tsv"
+    params:
+        regions=get_regions_option,
     shell:
         """
 bcftools csq \
     --phase a \
+    {params.regions} \
     -f {input.fasta_ref} \
     -g {input.gff_ref} \
     {input.vcf} \
@@ -35,6 +78,8 @@ rule cauris_annotated_vcf_to_table:
         tsv=OUT + "/cauris_typing/annotated_variants/{sample}.tsv",
     message:
         "Convert annotated variants to table for {wildcards.sample}"
+    group:
+        get_sample_group()
     container:
         "docker://broadinstitute/gatk:4.3.0.0"
     conda:
@@ -42,8 +87,11 @@ rule cauris_annotated_vcf_to_table:
     threads: config["threads"]["gatk"]
     resources:
         mem_gb=config["mem_gb"]["gatk"],
+        runtime=config["runtime_min"]["gatk"],
     log:
         OUT + "/log/cauris_annotated_vcf_to_table/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/cauris_annotated_vcf_to_table/{sample}.tsv"
     shell:
         """
 gatk VariantsToTable \
@@ -60,54 +108,231 @@ gatk VariantsToTable \
         """
 
 
-rule cauris_extract_aa_mutations:
-    input:
-        tsv=OUT + "/cauris_typing/annotated_variants/{sample}.tsv",
-        aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
-            "aa_resistance_variants_csv"
-        ],
-    output:
-        tsv=OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
-        full=OUT + "/cauris_typing/resistance_mutations/{sample}.full.tsv",
-    message:
-        "Extract AMR mutations for {wildcards.sample}"
-    log:
-        OUT + "/log/cauris_compare_aa_mutations/{sample}.log",
-    shell:
-        """
-python workflow/scripts/compare_aa_mutations.py \
-    --input {input.tsv} \
+if config["fused_annotation"]:
+
+    ruleorder: cauris_annotate_and_compare > cauris_annotate_vcf
+
+    rule cauris_annotate_and_compare:
+        input:
+            **get_annotation_input("cauris_typing"),
+            gff_ref=get_reference_file("ref.gff"),
+            fasta_ref=get_reference_file("ref.fasta"),
+            fasta_ref_fai=get_reference_file("ref.fasta.fai"),
+            aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "aa_resistance_variants_csv"
+            ],
+        output:
+            **with_parquet_outputs(
+                tsv=OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
+                full=OUT + "/cauris_typing/resistance_mutations/{sample}.full.tsv",
+            ),
+            **get_annotated_vcf_output("cauris_typing"),
+        message:
+            "Annotate VCF and extract AMR mutations for {wildcards.sample}"
+        group:
+            get_sample_group()
+        conda:
+            "../envs/bcftools_python.yaml"
+        threads: config["threads"]["bcftools"]
+        resources:
+            mem_gb=config["mem_gb"]["bcftools"],
+            runtime=config["runtime_min"]["bcftools"],
+        params:
+            catalogue_cache=get_catalogue_cache_option(),
+            parquet=get_parquet_option(),
+            regions=lambda wildcards, input: (
+                f"--regions {input.regions}" if "regions" in input.keys() else ""
+            ),
+            annotated_vcf=lambda wildcards, output: (
+                f"--annotated-vcf {output.vcf}" if "vcf" in output.keys() else ""
+            ),
+        log:
+            OUT + "/log/cauris_annotate_and_compare/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/cauris_annotate_and_compare/{sample}.tsv"
+        shell:
+            """
+python -m workflow.scripts.annotate_and_compare \
+    --vcf {input.vcf} \
+    --fasta-ref {input.fasta_ref} \
+    --gff-ref {input.gff_ref} \
+    {params.regions} \
+    {params.annotated_vcf} \
+    --aa-output {output.tsv} \
+    --aa-full-output {output.full} \
+    --aa-resistance-variants-csv {input.aa_resistance_variants_csv} \
+    {params.catalogue_cache} \
+    {params.parquet} \
+    > {log} 2>&1
+            """
+
+elif config["batch_size"]["compare"] > 1:
+    for batch_nr, batch in enumerate(
+        make_batches(
+            get_samples_of_species(SAMPLES, "candida", "auris"),
+            config["batch_size"]["compare"],
+        )
+    ):
+
+        rule:
+            name:
+                f"cauris_extract_aa_mutations_batch_{batch_nr}"
+            input:
+                variants=expand(
+                    get_variants_path("cauris_typing"),
+                    sample=batch,
+                ),
+                aa_resistance_variants_csv=[
+                    SAMPLES[sample]["aa_resistance_variants_csv"] for sample in batch
+                ],
+            output:
+                **with_parquet_outputs(
+                    tsv=expand(
+                        OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
+                        sample=batch,
+                    ),
+                    full=expand(
+                        OUT + "/cauris_typing/resistance_mutations/{sample}.full.tsv",
+                        sample=batch,
+                    ),
+                ),
+            message:
+                f"Extract AMR mutations for batch {batch_nr}"
+            threads: config["threads"]["compare"]
+            resources:
+                mem_gb=config["mem_gb"]["compare"],
+                runtime=config["runtime_min"]["compare"],
+            params:
+                catalogue_cache=get_catalogue_cache_option(),
+                parquet=get_parquet_option(),
+                manifest=OUT
+                + f"/cauris_typing/resistance_mutations/batch_{batch_nr}.manifest.tsv",
+                manifest_content=make_manifest(
+                    batch,
+                    get_variants_path("cauris_typing"),
+                    OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
+                    OUT + "/cauris_typing/resistance_mutations/{sample}.full.tsv",
+                    "aa_resistance_variants_csv",
+                ),
+            log:
+                OUT + f"/log/cauris_compare_aa_mutations/batch_{batch_nr}.log",
+            benchmark:
+                OUT + f"/benchmark/cauris_extract_aa_mutations/batch_{batch_nr}.tsv"
+            run:
+                with open(params.manifest, "w") as f:
+                    f.write(params.manifest_content)
+                shell(
+                    "python -m workflow.scripts.compare_mutations_batch"
+                    " --mode aa"
+                    " --manifest {params.manifest}"
+                    " --threads {threads}"
+                    " {params.catalogue_cache}"
+                    " {params.parquet}"
+                    " > {log} 2>&1"
+                )
+
+
+else:
+
+    localrules:
+        cauris_extract_aa_mutations,
+
+    rule cauris_extract_aa_mutations:
+        input:
+            variants=get_variants_path("cauris_typing"),
+            aa_resistance_variants_csv=lambda wildcards: SAMPLES[wildcards.sample][
+                "aa_resistance_variants_csv"
+            ],
+        output:
+            **with_parquet_outputs(
+                tsv=OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
+                full=OUT + "/cauris_typing/resistance_mutations/{sample}.full.tsv",
+            ),
+        message:
+            "Extract AMR mutations for {wildcards.sample}"
+        group:
+            get_sample_group()
+        threads: config["threads"]["compare"]
+        resources:
+            mem_gb=config["mem_gb"]["compare"],
+            runtime=config["runtime_min"]["compare"],
+        params:
+            catalogue_cache=get_catalogue_cache_option(),
+            parquet=get_parquet_option(),
+        log:
+            OUT + "/log/cauris_compare_aa_mutations/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/cauris_extract_aa_mutations/{sample}.tsv"
+        shell:
+            """
+python -m workflow.scripts.compare_aa_mutations \
+    --input {input.variants} \
     --output {output.tsv} \
     --full-output {output.full} \
-    --resistance_variants_csv {input.aa_resistance_variants_csv}
-        """
+    --resistance_variants_csv {input.aa_resistance_variants_csv} \
+    {params.catalogue_cache} \
+    {params.parquet}
+            """
 
 
-rule cauris_bam_to_fastq:
-    input:
-        bam=lambda wildcards: SAMPLES[wildcards.sample]["bam"],
-    output:
-        r1=temp(OUT + "/fastq/{sample}.R1.fastq"),
-        r2=temp(OUT + "/fastq/{sample}.R2.fastq"),
-    message:
-        "Convert {input.bam} to fastq for {wildcards.sample}"
-    container:
-        "docker://broadinstitute/picard:2.27.5"
-    conda:
-        "../envs/gatk_picard.yaml"
-    threads: config["threads"]["picard"]
-    resources:
-        mem_gb=config["mem_gb"]["picard"],
-    log:
-        OUT + "/log/cauris_bam_to_fastq/{sample}.log",
-    shell:
-        """
+if config["auriclass_input"] == "stream":
+
+    # Experimental. AuriClass only reads R1, so only first-of-pair and
+    # unpaired reads are streamed through a named pipe, skipping secondary,
+    # supplementary and QC-failed alignments like Picard SamToFastq. Not
+    # benchmarked, because the job lasts as long as AuriClass reads the pipe.
+    rule cauris_bam_to_fastq:
+        input:
+            bam=lambda wildcards: SAMPLES[wildcards.sample]["bam"],
+        output:
+            r1=pipe(OUT + "/fastq/{sample}.R1.fastq"),
+        message:
+            "Stream {input.bam} as fastq for {wildcards.sample}"
+        container:
+            "docker://staphb/samtools:1.17"
+        conda:
+            "../envs/bwa_samtools.yaml"
+        threads: config["threads"]["samtools"]
+        resources:
+            mem_gb=config["mem_gb"]["samtools"],
+            runtime=config["runtime_min"]["samtools"],
+        log:
+            OUT + "/log/cauris_bam_to_fastq/{sample}.log",
+        shell:
+            """
+samtools fastq -F 0xB80 {input.bam} > {output.r1} 2> {log}
+            """
+
+else:
+
+    rule cauris_bam_to_fastq:
+        input:
+            bam=lambda wildcards: SAMPLES[wildcards.sample]["bam"],
+        output:
+            r1=temp(OUT + "/fastq/{sample}.R1.fastq"),
+            r2=temp(OUT + "/fastq/{sample}.R2.fastq"),
+        message:
+            "Convert {input.bam} to fastq for {wildcards.sample}"
+        container:
+            "docker://broadinstitute/picard:2.27.5"
+        conda:
+            "../envs/gatk_picard.yaml"
+        threads: config["threads"]["picard"]
+        resources:
+            mem_gb=config["mem_gb"]["picard"],
+            runtime=config["runtime_min"]["picard"],
+        log:
+            OUT + "/log/cauris_bam_to_fastq/{sample}.log",
+        benchmark:
+            OUT + "/benchmark/cauris_bam_to_fastq/{sample}.tsv"
+        shell:
+            """
 java -jar /usr/picard/picard.jar SamToFastq \
     --INPUT {input.bam}\
     --FASTQ {output.r1} \
     --SECOND_END_FASTQ {output.r2} \
     2> {log}
-        """
+            """
 
 
 rule cauris_auriclass:
@@ -124,10 +349,13 @@ rule cauris_auriclass:
     threads: config["threads"]["auriclass"]
     resources:
         mem_gb=config["mem_gb"]["auriclass"],
+        runtime=config["runtime_min"]["auriclass"],
     params:
         name="{sample}",
     log:
         OUT + "/log/cauris_auriclass/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/cauris_auriclass/{sample}.tsv"
     shell:
         """
 auriclass \
@@ -146,6 +374,8 @@ rule combine_auriclas:
         "Combine auriclass results"
     log:
         OUT + "/log/combine_auriclas.log",
+    benchmark:
+        OUT + "/benchmark/combine_auriclas/all_samples.tsv"
     shell:
         """
 cat <(head -n 1 {input[0]}) \
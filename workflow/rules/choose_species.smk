@@ -3,14 +3,22 @@ def choose_species(wildcards):
         SAMPLES[wildcards.sample]["species"] == "fumigatus"
     ):
         return [
-            OUT + "/afumigatus_typing/annotated_vcf/{sample}.vcf",
+            *get_annotated_vcf_output("afumigatus_typing").values(),
             OUT + "/afumigatus_typing/resistance_mutations/{sample}.combined.tsv",
+            *(
+                [
+                    OUT
+                    + "/afumigatus_typing/resistance_mutations/{sample}.combined.parquet"
+                ]
+                if config["parquet_reports"]
+                else []
+            ),
         ]
     elif (SAMPLES[wildcards.sample]["genus"] == "candida") & (
         SAMPLES[wildcards.sample]["species"] == "auris"
     ):
         return [
-            OUT + "/cauris_typing/annotated_vcf/{sample}.vcf",
+            *get_annotated_vcf_output("cauris_typing").values(),
             OUT + "/cauris_typing/resistance_mutations/{sample}.tsv",
             OUT + "/cauris_typing/auriclass/{sample}.tsv",
         ]
@@ -28,6 +36,7 @@ rule aggregate_species:
     threads: 1
     resources:
         mem_gb=config["mem_gb"]["other"],
+        runtime=config["runtime_min"]["other"],
     shell:
         "touch {output}"
 
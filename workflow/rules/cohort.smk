@@ -0,0 +1,36 @@
+rule write_cohort_manifest:
+    output:
+        manifest=temp(OUT + "/cohort_store/manifest.tsv"),
+    params:
+        manifest_content=make_cohort_manifest(),
+    message:
+        "Write the manifest of the reports to add to the cohort store"
+    run:
+        with open(output.manifest, "w") as f:
+            f.write(params.manifest_content)
+
+
+rule update_cohort_store:
+    input:
+        manifest=OUT + "/cohort_store/manifest.tsv",
+        reports=[cohort_sample["report_path"] for cohort_sample in get_cohort_samples()],
+        variants=[cohort_sample["variants"] for cohort_sample in get_cohort_samples()],
+    output:
+        tsv=OUT + "/cohort_store/added_samples.tsv",
+    log:
+        OUT + "/log/update_cohort_store.log",
+    resources:
+        mem_gb=config["mem_gb"]["compare"],
+        runtime=config["runtime_min"]["compare"],
+    params:
+        database=config["cohort_store"],
+    message:
+        "Add resistance reports to the cohort store {params.database}"
+    shell:
+        """
+python -m workflow.scripts.cohort_store add \
+    --database {params.database} \
+    --manifest {input.manifest} \
+    --output {output.tsv} \
+    > {log} 2>&1
+        """
@@ -5,6 +5,8 @@ rule copy_sample_bam:
         bam=temp(OUT + "/prepared_files/{sample}.bam"),
     log:
         OUT + "/log/copy_sample_bam/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/copy_sample_bam/{sample}.tsv"
     shell:
         """
 cp {input.bam} {output.bam} 2>&1>{log}
@@ -22,26 +24,60 @@ rule index_sample_bam:
         "../envs/gatk_picard.yaml"
     log:
         OUT + "/log/index_sample_bam/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/index_sample_bam/{sample}.tsv"
     message:
         "Indexing bam for {wildcards.sample}"
     threads: config["threads"]["samtools"]
     resources:
         mem_gb=config["mem_gb"]["samtools"],
+        runtime=config["runtime_min"]["samtools"],
     shell:
         """
 samtools index {input.bam} 2>&1>>{log}
         """
 
 
+rule index_sample_vcf:
+    input:
+        vcf=lambda wildcards: SAMPLES[wildcards.sample]["vcf"],
+    output:
+        vcf=temp(OUT + "/prepared_files/{sample}.vcf.gz"),
+        csi=temp(OUT + "/prepared_files/{sample}.vcf.gz.csi"),
+    container:
+        "docker://staphb/bcftools:1.18"
+    conda:
+        "../envs/bcftools.yaml"
+    log:
+        OUT + "/log/index_sample_vcf/{sample}.log",
+    benchmark:
+        OUT + "/benchmark/index_sample_vcf/{sample}.tsv"
+    message:
+        "Compressing and indexing VCF for {wildcards.sample}"
+    group:
+        get_sample_group()
+    threads: config["threads"]["bcftools"]
+    resources:
+        mem_gb=config["mem_gb"]["bcftools"],
+        runtime=config["runtime_min"]["bcftools"],
+    shell:
+        """
+bcftools view -Oz -o {output.vcf} {input.vcf} 2>{log}
+bcftools index {output.vcf} 2>>{log}
+        """
+
+
 rule copy_ref:
     input:
-        reference=lambda wildcards: SAMPLES[wildcards.sample]["reference"],
+        reference=lambda wildcards: REFERENCES[wildcards.reference_key]["reference"],
     output:
-        reference=temp(OUT + "/prepared_files/{sample}_ref.fasta"),
+        reference=temp(OUT + "/prepared_files/references/{reference_key}/ref.fasta"),
     message:
-        "Copying reference genome to output directory"
+        "Copying reference genome {wildcards.reference_key} to output directory"
     log:
-        OUT + "/log/copy_sample_ref/{sample}.log",
+        OUT + "/log/copy_ref/{reference_key}.log",
+    benchmark:
+        OUT + "/benchmark/copy_ref/{reference_key}.tsv"
     shell:
         """
 cp {input.reference} {output.reference}
@@ -50,13 +86,15 @@ cp {input.reference} {output.reference}
 
 rule copy_ref_gff:
     input:
-        ref_gff=lambda wildcards: SAMPLES[wildcards.sample]["reference_gff"],
+        ref_gff=lambda wildcards: REFERENCES[wildcards.reference_key]["reference_gff"],
     output:
-        ref_gff=temp(OUT + "/prepared_files/{sample}_ref.gff"),
+        ref_gff=temp(OUT + "/prepared_files/references/{reference_key}/ref.gff"),
     message:
-        "Copying reference gff to output directory"
+        "Copying reference gff {wildcards.reference_key} to output directory"
     log:
-        OUT + "/log/copy_sample_ref_gff/{sample}.log",
+        OUT + "/log/copy_ref_gff/{reference_key}.log",
+    benchmark:
+        OUT + "/benchmark/copy_ref_gff/{reference_key}.tsv"
     shell:
         """
 cp {input.ref_gff} {output.ref_gff}
@@ -65,22 +103,23 @@ cp {input.ref_gff} {output.ref_gff}
 
 rule bwa_index_ref:
     input:
-        reference=OUT + "/prepared_files/{sample}_ref.fasta",
+        reference=OUT + "/prepared_files/references/{reference_key}/ref.fasta",
     output:
-        reference=temp(OUT + "/prepared_files/{sample}_ref.fasta.sa"),
-    message:
-        "Indexing reference genome for {wildcards.sample} using bwa"
+        reference=temp(OUT + "/prepared_files/references/{reference_key}/ref.fasta.sa"),
     conda:
         "../envs/bwa_samtools.yaml"
     container:
         "docker://staphb/bwa:0.7.17"
     log:
-        OUT + "/log/bwa_index_ref/{sample}.log",
+        OUT + "/log/bwa_index_ref/{reference_key}.log",
+    benchmark:
+        OUT + "/benchmark/bwa_index_ref/{reference_key}.tsv"
     message:
-        "Indexing ref (bwa) for {wildcards.sample}"
+        "Indexing ref {wildcards.reference_key} (bwa)"
     threads: config["threads"]["bwa"]
     resources:
         mem_gb=config["mem_gb"]["bwa"],
+        runtime=config["runtime_min"]["bwa"],
     shell:
         """
 bwa index {input} 2>&1>{log}
@@ -89,22 +128,23 @@ bwa index {input} 2>&1>{log}
 
 rule gatk_index_ref:
     input:
-        reference=OUT + "/prepared_files/{sample}_ref.fasta",
+        reference=OUT + "/prepared_files/references/{reference_key}/ref.fasta",
     output:
-        reference=temp(OUT + "/prepared_files/{sample}_ref.dict"),
-    message:
-        "Indexing reference genome for {wildcards.sample} using GATK"
+        reference=temp(OUT + "/prepared_files/references/{reference_key}/ref.dict"),
     conda:
         "../envs/gatk_picard.yaml"
     container:
         "docker://broadinstitute/gatk:4.3.0.0"
     log:
-        OUT + "/log/gatk_index_ref/{sample}.log",
+        OUT + "/log/gatk_index_ref/{reference_key}.log",
+    benchmark:
+        OUT + "/benchmark/gatk_index_ref/{reference_key}.tsv"
     message:
-        "Indexing ref (GATK) for {wildcards.sample}"
+        "Indexing ref {wildcards.reference_key} (GATK)"
     threads: config["threads"]["gatk"]
     resources:
         mem_gb=config["mem_gb"]["gatk"],
+        runtime=config["runtime_min"]["gatk"],
     shell:
         """
 gatk CreateSequenceDictionary -R {input.reference} 2>&1>{log}
@@ -113,23 +153,109 @@ gatk CreateSequenceDictionary -R {input.reference} 2>&1>{log}
 
 rule samtools_index_ref:
     input:
-        reference=OUT + "/prepared_files/{sample}_ref.fasta",
+        reference=OUT + "/prepared_files/references/{reference_key}/ref.fasta",
     output:
-        reference=temp(OUT + "/prepared_files/{sample}_ref.fasta.fai"),
-    message:
-        "Indexing reference genome for {wildcards.sample} using samtools"
+        reference=temp(OUT + "/prepared_files/references/{reference_key}/ref.fasta.fai"),
     conda:
         "../envs/bwa_samtools.yaml"
     container:
         "docker://staphb/samtools:1.17"
     log:
-        OUT + "/log/samtools_index_ref/{sample}.log",
+        OUT + "/log/samtools_index_ref/{reference_key}.log",
+    benchmark:
+        OUT + "/benchmark/samtools_index_ref/{reference_key}.tsv"
     message:
-        "Indexing ref (samtools) for {wildcards.sample}"
+        "Indexing ref {wildcards.reference_key} (samtools)"
     threads: config["threads"]["samtools"]
     resources:
         mem_gb=config["mem_gb"]["samtools"],
+        runtime=config["runtime_min"]["samtools"],
     shell:
         """
 samtools faidx {input.reference} 2>&1>{log}
         """
+
+
+if config["use_reference_cache"]:
+
+    rule store_reference_in_cache:
+        input:
+            expand(
+                OUT + "/prepared_files/references/{{reference_key}}/{filename}",
+                filename=REFERENCE_CACHE_FILES,
+            ),
+        output:
+            temp(OUT + "/prepared_files/references/{reference_key}/stored_in_cache.txt"),
+        message:
+            "Storing ref {wildcards.reference_key} in the reference cache"
+        resources:
+            mem_gb=config["mem_gb"]["other"],
+            runtime=config["runtime_min"]["other"],
+        params:
+            cache_dir=REFERENCE_CACHE_DIR,
+            max_size_gb=config["reference_cache"]["max_size_gb"],
+        log:
+            OUT + "/log/store_reference_in_cache/{reference_key}.log",
+        benchmark:
+            OUT + "/benchmark/store_reference_in_cache/{reference_key}.tsv"
+        shell:
+            """
+# The cache only saves time in later runs, so failing to write it is not an error
+python -m workflow.scripts.reference_cache store \
+    --cache-dir {params.cache_dir} \
+    --reference-key {wildcards.reference_key} \
+    --files {input} \
+    --max-size-gb {params.max_size_gb} \
+    > {log} 2>&1 \
+    || echo "Could not store reference {wildcards.reference_key} in {params.cache_dir}" >> {log}
+touch {output}
+            """
+
+
+if CACHED_REFERENCE_KEYS:
+
+    ruleorder: restore_cached_reference > copy_ref
+    ruleorder: restore_cached_reference > copy_ref_gff
+    ruleorder: restore_cached_reference > samtools_index_ref
+
+    # Falls back to copying and indexing the original reference and GFF, like
+    # copy_ref, copy_ref_gff and samtools_index_ref, if the entry was evicted
+    # after the Snakefile was parsed
+    rule restore_cached_reference:
+        input:
+            reference=lambda wildcards: REFERENCES[wildcards.reference_key]["reference"],
+            ref_gff=lambda wildcards: REFERENCES[wildcards.reference_key][
+                "reference_gff"
+            ],
+        output:
+            reference=temp(OUT + "/prepared_files/references/{reference_key}/ref.fasta"),
+            ref_gff=temp(OUT + "/prepared_files/references/{reference_key}/ref.gff"),
+            fai=temp(OUT + "/prepared_files/references/{reference_key}/ref.fasta.fai"),
+        wildcard_constraints:
+            reference_key="|".join(CACHED_REFERENCE_KEYS),
+        conda:
+            "../envs/samtools_python.yaml"
+        message:
+            "Restoring ref {wildcards.reference_key} from the reference cache"
+        resources:
+            mem_gb=config["mem_gb"]["other"],
+            runtime=config["runtime_min"]["other"],
+        params:
+            cache_dir=REFERENCE_CACHE_DIR,
+            filenames=REFERENCE_CACHE_FILES,
+            output_dir=OUT + "/prepared_files/references/{reference_key}",
+        log:
+            OUT + "/log/restore_cached_reference/{reference_key}.log",
+        benchmark:
+            OUT + "/benchmark/restore_cached_reference/{reference_key}.tsv"
+        shell:
+            """
+python -m workflow.scripts.reference_cache restore \
+    --cache-dir {params.cache_dir} \
+    --reference-key {wildcards.reference_key} \
+    --files {params.filenames} \
+    --output-dir {params.output_dir} \
+    --fallback-reference {input.reference} \
+    --fallback-gff {input.ref_gff} \
+    > {log} 2>&1
+            """
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+import itertools
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+
+def split_values(
+    values: pd.Series,
+) -> Tuple[npt.NDArray[np.intp], npt.NDArray[np.object_], npt.NDArray[np.intp]]:
+    """
+    Split the comma separated values of a column, once per distinct value
+
+    Parameters
+    ----------
+    values : pandas series
+        Column of strings, such as ALT or AF, or a categorical of strings
+
+    Returns
+    -------
+    codes : numpy array
+        Number of the distinct value of every row, -1 for missing values
+    parts : numpy array
+        Parts of all distinct values, in order
+    offsets : numpy array
+        Index in parts of the first part of every distinct value, followed by
+        the total number of parts
+    """
+    codes, uniques = pd.factorize(values)
+    list_parts = [str(value).split(",") for value in np.asarray(uniques, dtype=object)]
+    parts = np.array(list(itertools.chain.from_iterable(list_parts)), dtype=object)
+    offsets = np.cumsum([0] + [len(value_parts) for value_parts in list_parts])
+    return codes, parts, offsets
+
+
+def replace_values(
+    column: pd.Series, mask: npt.NDArray[np.bool_], new_values: npt.NDArray[Any]
+) -> pd.Series:
+    """
+    Replace the values of the rows in mask, keeping categoricals categorical
+    """
+    values = np.asarray(column, dtype=object).copy()
+    values[mask] = new_values
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        values = pd.Categorical(values)
+    return pd.Series(values, index=column.index, name=column.name)
+
+
+def get_allele_types(ref: pd.Series, alt: pd.Series) -> npt.NDArray[np.object_]:
+    """
+    Type of every single alternate allele, with the rules of
+    vcf_reader.get_variant_type
+
+    Parameters
+    ----------
+    ref : pandas series
+        Reference alleles
+    alt : pandas series
+        Alternate alleles, one per row
+
+    Returns
+    -------
+    allele_types : numpy array
+        SNP, MNP, INDEL or SYMBOLIC for every row
+    """
+    ref_length = ref.str.len().to_numpy()
+    alt_length = alt.str.len().to_numpy()
+    symbolic = alt.str.contains(r"^<|>$|\[|\]", regex=True).to_numpy(dtype=bool) | (
+        (alt_length > 1) & alt.str.contains(r"^\.|\.$", regex=True).to_numpy(bool)
+    )
+    return np.select(
+        [symbolic, alt_length != ref_length, ref_length == 1],
+        ["SYMBOLIC", "INDEL", "SNP"],
+        default="MNP",
+    ).astype(object)
+
+
+def split_multiallelic(df_mutations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Split multi-allelic records into one row per alternate allele
+
+    Every allele gets the matching value of a comma separated AF with one
+    value per allele, and its own TYPE. Other columns, and AF values with
+    another number of values, are repeated. The distinct ALT and AF values are
+    split once, after which the rows are expanded with array operations.
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Mutations with at least the columns CHROM, POS, REF and ALT
+
+    Returns
+    -------
+    df_split : pandas dataframe
+        Mutations with a single ALT allele per row, in input order. Returns
+        df_mutations itself if no record is multi-allelic.
+    """
+    alt_codes, alt_parts, alt_offsets = split_values(df_mutations["ALT"])
+    # Missing values (code -1) have one allele
+    nr_alleles = np.append(np.diff(alt_offsets), 1)[alt_codes]
+    if (nr_alleles <= 1).all():
+        return df_mutations
+
+    rows = np.repeat(np.arange(len(df_mutations)), nr_alleles)
+    allele_index = np.arange(len(rows)) - np.repeat(
+        np.cumsum(nr_alleles) - nr_alleles, nr_alleles
+    )
+    is_split = nr_alleles[rows] > 1
+    split_rows = rows[is_split]
+    split_allele_index = allele_index[is_split]
+
+    df_split = df_mutations.take(rows).reset_index(drop=True)
+    alts = alt_parts[alt_offsets[alt_codes[split_rows]] + split_allele_index]
+    df_split["ALT"] = replace_values(df_split["ALT"], is_split, alts)
+
+    if "AF" in df_split.columns and not pd.api.types.is_numeric_dtype(df_split["AF"]):
+        af_codes, af_parts, af_offsets = split_values(df_mutations["AF"])
+        af_codes = af_codes[split_rows]
+        nr_afs = np.append(np.diff(af_offsets), 0)[af_codes]
+        # Only split AF values with one value per allele
+        matches = nr_afs == nr_alleles[split_rows]
+        af_mask = is_split.copy()
+        af_mask[is_split] = matches
+        afs = af_parts[af_offsets[af_codes[matches]] + split_allele_index[matches]]
+        df_split["AF"] = replace_values(df_split["AF"], af_mask, afs)
+
+    if "TYPE" in df_split.columns:
+        allele_types = get_allele_types(
+            pd.Series(np.asarray(df_split["REF"], dtype=object)[is_split]),
+            pd.Series(alts),
+        )
+        df_split["TYPE"] = replace_values(df_split["TYPE"], is_split, allele_types)
+    return df_split
+
+
+def read_fasta_index(fai: Path) -> Dict[str, Tuple[int, int, int, int]]:
+    """
+    Read a samtools faidx index
+
+    Returns
+    -------
+    index : dict
+        Length, offset of the first base, bases per line and bytes per line of
+        every sequence by name
+    """
+    index = {}
+    with open(fai) as f:
+        for line in f:
+            name, length, offset, line_bases, line_width = line.split("\t")[:5]
+            index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+    return index
+
+
+def read_reference_sequences(
+    fasta_ref: Path, chroms: Optional[Collection[str]] = None
+) -> Dict[str, npt.NDArray[np.bytes_]]:
+    """
+    Read the sequences of a reference FASTA
+
+    If only some sequences are asked for and the FASTA has a samtools faidx
+    index next to it, only those sequences are read from the file. Otherwise
+    the file is read line by line, keeping the sequences asked for.
+
+    Parameters
+    ----------
+    fasta_ref : Path
+        Reference genome
+    chroms : collection of str, optional
+        Names of the sequences to keep, all sequences are kept if None
+
+    Returns
+    -------
+    sequences : dict
+        Upper case sequence as an array of single bytes by name, up to the
+        first whitespace of the header
+    """
+    sequences: Dict[str, npt.NDArray[np.bytes_]] = {}
+    fai = Path(f"{fasta_ref}.fai")
+    if chroms is not None and fai.is_file():
+        index = read_fasta_index(fai)
+        with open(fasta_ref, "rb") as f:
+            for chrom in chroms:
+                if chrom not in index:
+                    continue
+                length, offset, line_bases, line_width = index[chrom]
+                f.seek(offset)
+                full_lines, last_bases = divmod(length, line_bases or 1)
+                sequence = f.read(full_lines * line_width + last_bases)
+                sequence = sequence.replace(b"\n", b"").replace(b"\r", b"").upper()
+                sequences[chrom] = np.frombuffer(sequence, dtype="S1")
+        return sequences
+
+    name: Optional[str] = None
+    parts: List[bytes] = []
+    with open(fasta_ref, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    sequences[name] = np.frombuffer(b"".join(parts).upper(), dtype="S1")
+                header = line[1:].split(maxsplit=1)
+                name = header[0].decode() if header else ""
+                if chroms is not None and name not in chroms:
+                    name = None
+                parts = []
+            elif name is not None:
+                parts.append(line.rstrip(b"\r\n"))
+    if name is not None:
+        sequences[name] = np.frombuffer(b"".join(parts).upper(), dtype="S1")
+    return sequences
+
+
+def get_reference_bases(
+    sequences: Dict[str, npt.NDArray[np.bytes_]],
+    chroms: npt.NDArray[np.object_],
+    positions: npt.NDArray[np.int64],
+) -> npt.NDArray[np.object_]:
+    """
+    Reference base at every 1-based position
+    """
+    bases = np.empty(len(positions), dtype=object)
+    for chrom in np.unique(chroms):
+        mask = chroms == chrom
+        sequence = sequences[chrom]
+        if (positions[mask] > len(sequence)).any():
+            raise ValueError(
+                f"Variants on {chrom} are outside of its reference sequence of {len(sequence)} bases"
+            )
+        bases[mask] = sequence[positions[mask] - 1].astype(str).tolist()
+    return bases
+
+
+def left_normalise_indels(
+    df_mutations: pd.DataFrame, sequences: Dict[str, npt.NDArray[np.bytes_]]
+) -> pd.DataFrame:
+    """
+    Left-align and trim INDELs against the reference
+
+    Alleles that end with the same base are shortened at the end, and an
+    allele that becomes empty is extended with the preceding reference base,
+    until the INDEL can not be moved further left. Bases that both alleles
+    start with are then removed while both are at least two bases long. This
+    gives every INDEL in a tandem repeat the same position and alleles, however
+    the variant caller placed it. All INDELs are moved a base at a time
+    together, so the number of passes is the largest shift, not the number of
+    INDELs.
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Mutations with a single ALT allele per row, see split_multiallelic
+    sequences : dict
+        Reference sequences by name, see read_reference_sequences. INDELs on
+        other chromosomes are not changed.
+
+    Returns
+    -------
+    df_normalised : pandas dataframe
+        df_mutations with updated POS, REF and ALT
+    """
+    chrom_values = np.asarray(df_mutations["CHROM"], dtype=object)
+    indels = (
+        (df_mutations["TYPE"] == "INDEL").to_numpy()
+        & np.isin(chrom_values, list(sequences))
+        & (df_mutations["REF"].str.len() != df_mutations["ALT"].str.len()).to_numpy()
+    )
+    if not indels.any():
+        return df_mutations
+
+    chroms = chrom_values[indels]
+    positions = df_mutations["POS"].to_numpy()[indels].astype(np.int64)
+    ref = np.asarray(df_mutations["REF"], dtype=object)[indels]
+    alt = np.asarray(df_mutations["ALT"], dtype=object)[indels]
+
+    # Every pass only looks at the INDELs that moved in the previous one
+    active = np.arange(len(positions))
+    while len(active):
+        active_ref, active_alt = pd.Series(ref[active]), pd.Series(alt[active])
+        ref_length = active_ref.str.len().to_numpy()
+        alt_length = active_alt.str.len().to_numpy()
+        # The first base of a chromosome has no preceding base to extend with
+        move = (active_ref.str[-1] == active_alt.str[-1]).to_numpy() & (
+            (positions[active] > 1) | ((ref_length > 1) & (alt_length > 1))
+        )
+        active = active[move]
+        ref[active] = active_ref[move].str[:-1].to_numpy(dtype=object)
+        alt[active] = active_alt[move].str[:-1].to_numpy(dtype=object)
+        extend = active[(ref_length[move] == 1) | (alt_length[move] == 1)]
+        positions[extend] -= 1
+        bases = get_reference_bases(sequences, chroms[extend], positions[extend])
+        ref[extend] = bases + ref[extend]
+        alt[extend] = bases + alt[extend]
+
+    active = np.arange(len(positions))
+    while len(active):
+        active_ref, active_alt = pd.Series(ref[active]), pd.Series(alt[active])
+        trim = (
+            (active_ref.str.len() >= 2)
+            & (active_alt.str.len() >= 2)
+            & (active_ref.str[0] == active_alt.str[0])
+        ).to_numpy()
+        active = active[trim]
+        ref[active] = active_ref[trim].str[1:].to_numpy(dtype=object)
+        alt[active] = active_alt[trim].str[1:].to_numpy(dtype=object)
+        positions[active] += 1
+
+    df_normalised = df_mutations.copy()
+    all_positions = df_normalised["POS"].to_numpy().copy()
+    all_positions[indels] = positions
+    df_normalised["POS"] = all_positions
+    df_normalised["REF"] = replace_values(df_normalised["REF"], indels, ref)
+    df_normalised["ALT"] = replace_values(df_normalised["ALT"], indels, alt)
+    return df_normalised
+
+
+def normalise_alleles(
+    df_mutations: pd.DataFrame,
+    fasta_ref: Optional[Path] = None,
+    sequences: Optional[Dict[str, npt.NDArray[np.bytes_]]] = None,
+) -> pd.DataFrame:
+    """
+    Split multi-allelic records and, if a reference is given, left-normalise
+    INDELs
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Mutations read from a VariantsToTable export
+    fasta_ref : Path, optional
+        Reference genome the variants were called against
+    sequences : dict, optional
+        Sequences of the reference genome that were already read with
+        read_reference_sequences, used instead of fasta_ref
+
+    Returns
+    -------
+    df_normalised : pandas dataframe
+        One row per alternate allele, see split_multiallelic and
+        left_normalise_indels
+    """
+    df_normalised = split_multiallelic(df_mutations)
+    if "TYPE" not in df_normalised.columns:
+        return df_normalised
+    if sequences is None:
+        if fasta_ref is None:
+            return df_normalised
+        chroms = pd.unique(
+            np.asarray(
+                df_normalised["CHROM"][df_normalised["TYPE"] == "INDEL"], dtype=object
+            )
+        )
+        if len(chroms) == 0:
+            return df_normalised
+        sequences = read_reference_sequences(fasta_ref, set(chroms))
+    return left_normalise_indels(df_normalised, sequences)
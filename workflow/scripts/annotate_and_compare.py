@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import contextlib
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional
+
+from workflow.scripts import compare_aa_mutations, compare_nt_mutations
+from workflow.scripts.resistance_catalogue import load_catalogue
+from workflow.scripts.vcf_reader import iter_table_lines
+
+
+def tee_lines(lines: Iterable[str], copy: Optional[IO[str]]) -> Iterator[str]:
+    """
+    Yield lines, writing a copy of every line to copy if it is given
+    """
+    for line in lines:
+        if copy is not None:
+            copy.write(line)
+        yield line
+
+
+def annotate_vcf_to_table(
+    vcf: Path,
+    fasta_ref: Path,
+    gff_ref: Path,
+    annotated_vcf: Optional[Path] = None,
+    bcftools: str = "bcftools",
+    regions: Optional[Path] = None,
+    table_copy: Optional[IO[str]] = None,
+) -> Iterator[str]:
+    """
+    Annotate a VCF with bcftools csq and convert the output to a VariantsToTable export
+
+    The output of bcftools csq is read from a pipe and converted while it is
+    read, so the annotated VCF is only written to disk if annotated_vcf is
+    given and the table only if table_copy is given.
+
+    Parameters
+    ----------
+    vcf : Path
+        VCF to annotate
+    fasta_ref : Path
+        Reference genome
+    gff_ref : Path
+        Reference annotation
+    annotated_vcf : Path, optional
+        Path to keep a copy of the annotated VCF
+    bcftools : str
+        bcftools executable
+    regions : Path, optional
+        BED file with the regions to annotate, requires an indexed VCF
+    table_copy : file object, optional
+        File to write a copy of the table to, for a second reader
+
+    Yields
+    ------
+    line : str
+        Header line followed by one tab separated line per annotated record
+    """
+    command = [
+        bcftools,
+        "csq",
+        "--phase",
+        "a",
+        "-f",
+        str(fasta_ref),
+        "-g",
+        str(gff_ref),
+    ]
+    if regions is not None:
+        command.extend(["-R", str(regions)])
+    command.append(str(vcf))
+    # stderr is not captured, so bcftools messages end up in the log of the rule
+    with subprocess.Popen(command, stdout=subprocess.PIPE, text=True) as process:
+        assert process.stdout is not None
+        copy = open(annotated_vcf, "w") if annotated_vcf is not None else None
+        try:
+            yield from tee_lines(
+                iter_table_lines(tee_lines(process.stdout, copy)), table_copy
+            )
+        finally:
+            if copy is not None:
+                copy.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Annotate a VCF with bcftools csq and compare the annotated mutations to reference lists of AMR mutations, without writing intermediate files"
+    )
+    parser.add_argument("--vcf", help="VCF to annotate", required=True, type=Path)
+    parser.add_argument(
+        "--fasta-ref", help="Reference genome", required=True, type=Path
+    )
+    parser.add_argument(
+        "--gff-ref", help="Reference annotation", required=True, type=Path
+    )
+    parser.add_argument(
+        "--regions",
+        help="BED file with the regions to annotate, requires an indexed VCF",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--annotated-vcf",
+        help="Keep the annotated VCF at this path",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--aa-output",
+        help="Output file with only known AMR mutations (amino acid based)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--aa-full-output",
+        help="Output file with all mutations in resistance genes (amino acid based)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--aa-resistance-variants-csv",
+        help="Reference CSV of AMR mutations (amino acid based)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--nt-output",
+        help="Output file with only known AMR mutations (nucleotide based)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--nt-resistance-variants-csv",
+        help="Reference CSV of AMR mutations (nucleotide based)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--left-normalise",
+        help="Left-normalise INDELs against --fasta-ref before the nucleotide based comparison",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases up- and downstream of tandem repeat regions to screen for large INDELs",
+        default=50,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-indel-length",
+        help="Minimum length of the REF or ALT allele of a possible CNV",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "--bcftools", help="bcftools executable", default="bcftools", type=str
+    )
+    parser.add_argument(
+        "--parquet",
+        help="Also write the reports as Parquet, next to the TSV files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    if args.aa_output is not None and (
+        args.aa_full_output is None or args.aa_resistance_variants_csv is None
+    ):
+        parser.error(
+            "--aa-output requires --aa-full-output and --aa-resistance-variants-csv"
+        )
+    if args.nt_output is not None and args.nt_resistance_variants_csv is None:
+        parser.error("--nt-output requires --nt-resistance-variants-csv")
+
+    # The amino acid based comparison reads the table while it is annotated,
+    # the nucleotide based one reads the copy in a temporary file afterwards
+    with contextlib.ExitStack() as stack:
+        nt_table = None
+        if args.nt_output is not None:
+            nt_table = stack.enter_context(
+                tempfile.TemporaryFile("w+", dir=args.nt_output.parent)
+            )
+        table_lines = annotate_vcf_to_table(
+            args.vcf,
+            args.fasta_ref,
+            args.gff_ref,
+            args.annotated_vcf,
+            args.bcftools,
+            args.regions,
+            nt_table,
+        )
+
+        if args.aa_output is not None:
+            compare_aa_mutations.compare_lines(
+                table_lines,
+                args.aa_output,
+                args.aa_full_output,
+                load_catalogue(
+                    args.aa_resistance_variants_csv, args.catalogue_cache_dir
+                ),
+                parquet=args.parquet,
+            )
+        # Annotates the records the amino acid based comparison did not read
+        collections.deque(table_lines, maxlen=0)
+        if nt_table is not None:
+            nt_table.seek(0)
+            df_mutations = compare_nt_mutations.read_mutations(nt_table, compact=True)
+            compare_nt_mutations.compare_mutations(
+                df_mutations,
+                args.nt_output,
+                load_catalogue(
+                    args.nt_resistance_variants_csv, args.catalogue_cache_dir
+                ),
+                screen_window=args.screen_window,
+                min_indel_length=args.min_indel_length,
+                parquet=args.parquet,
+                fasta_ref=args.fasta_ref if args.left_normalise else None,
+            )
+
+
+if __name__ == "__main__":
+    main()
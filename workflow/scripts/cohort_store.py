@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from workflow.scripts.report_io import parse_float_list, read_report
+from workflow.scripts.resistance_catalogue import get_catalogue_version, hash_file
+
+manifest_columns = ["sample", "species", "report"]
+# Annotated VCF and reference CSVs of a sample, to re-type it when the
+# catalogue changes, see retype_cohort.py
+optional_manifest_columns = [
+    "variants",
+    "aa_resistance_variants_csv",
+    "nt_resistance_variants_csv",
+]
+
+# Directory next to the database with the stored annotated VCFs
+variants_dir = "annotated_variants"
+
+# Columns of the resistance reports kept in the store. Reports of one species
+# do not have all of them, missing columns are stored as NULL.
+variant_columns = ["chromosome", "position", "ref_nt", "alt_nt"]
+mutation_columns = variant_columns + [
+    "genetic_element",
+    "mutation_name",
+    "comparison_type",
+    "impact",
+    "drug",
+    "type_of_variant",
+    "type_of_consequence",
+    "locus_tag",
+    "ref_aa",
+    "alt_aa",
+    "depth",
+    "allele_frequency",
+]
+
+matrix_values = ["presence", "allele_frequency", "depth"]
+
+# Seconds to wait for other pipeline runs that are writing to the store
+busy_timeout = 600
+
+schema = """
+CREATE TABLE IF NOT EXISTS samples (
+    sample TEXT PRIMARY KEY,
+    species TEXT NOT NULL,
+    report_hash TEXT NOT NULL,
+    catalogue_version TEXT,
+    variants TEXT,
+    variants_hash TEXT,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mutations (
+    sample TEXT NOT NULL,
+    chromosome TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    ref_nt TEXT NOT NULL,
+    alt_nt TEXT NOT NULL,
+    genetic_element TEXT,
+    mutation_name TEXT,
+    comparison_type TEXT,
+    impact TEXT,
+    drug TEXT,
+    type_of_variant TEXT,
+    type_of_consequence TEXT,
+    locus_tag TEXT,
+    ref_aa TEXT,
+    alt_aa TEXT,
+    depth INTEGER,
+    allele_frequency TEXT
+);
+CREATE INDEX IF NOT EXISTS mutations_sample ON mutations (sample);
+CREATE INDEX IF NOT EXISTS mutations_variant
+    ON mutations (chromosome, position, ref_nt, alt_nt);
+"""
+
+
+def connect(database: Path) -> sqlite3.Connection:
+    """
+    Open the cohort store, creating its tables if needed
+
+    SQLite locks the database file while writing, so several pipeline runs can
+    add samples to the same store. The transactions of a run wait up to
+    busy_timeout seconds for those of other runs.
+    """
+    database.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(database, timeout=busy_timeout, isolation_level=None)
+    con.executescript(schema)
+    return con
+
+
+def read_manifest(manifest: Path) -> List[Dict[str, str]]:
+    """
+    Read manifest of reports to add
+
+    Parameters
+    ----------
+    manifest : Path
+        Tab separated file with a header and the columns sample, species and
+        report, and optionally the columns in optional_manifest_columns
+
+    Returns
+    -------
+    list_samples : list of dicts
+        One dict per sample with the manifest columns as keys
+    """
+    with open(manifest, "r") as f:
+        list_samples = list(csv.DictReader(f, delimiter="\t"))
+    if list_samples:
+        missing_columns = set(manifest_columns) - set(list_samples[0].keys())
+        if missing_columns:
+            raise ValueError(
+                f"Manifest {manifest} is missing columns: {', '.join(sorted(missing_columns))}"
+            )
+    return list_samples
+
+
+def format_allele_frequency(value: object) -> Optional[str]:
+    """
+    Allele frequency as written in the TSV reports, comma separated for
+    multi-allelic variants
+    """
+    allele_frequencies = parse_float_list(value)
+    if allele_frequencies is None:
+        return None
+    return ",".join(f"{af:g}" for af in allele_frequencies)
+
+
+def get_mutation_rows(report: Path) -> List[Tuple[Any, ...]]:
+    """
+    Read a resistance report as rows of the mutations table
+
+    The "-" placeholders of the combined reports are stored as NULL, like the
+    empty fields of the other reports.
+
+    Parameters
+    ----------
+    report : Path
+        Resistance report written by the comparison scripts (TSV or Parquet)
+
+    Returns
+    -------
+    list_rows : list of tuples
+        Values of mutation_columns for every row of the report
+    """
+    df_report = read_report(report)
+    categorical = df_report.select_dtypes("category").columns
+    df_report[categorical] = df_report[categorical].astype(object)
+    df_report = df_report.reindex(columns=mutation_columns).replace("-", None)
+    for col in ["position", "depth"]:
+        df_report[col] = pd.to_numeric(df_report[col], errors="coerce").astype("Int64")
+    df_report["allele_frequency"] = df_report["allele_frequency"].map(
+        format_allele_frequency
+    )
+    df_report = df_report.astype(object).where(df_report.notnull(), None)
+    return list(df_report.itertuples(index=False, name=None))
+
+
+def get_variants_dir(database: Path) -> Path:
+    """
+    Location of the annotated VCFs stored with a cohort store
+    """
+    return database.parent.joinpath(variants_dir)
+
+
+def store_variants(variants: Path, stored_variants: Path) -> None:
+    """
+    Store a gzip compressed copy of an annotated VCF
+
+    The copy is written to a temporary file that is renamed when complete, so
+    a stored VCF is never incomplete.
+    """
+    stored_variants.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=stored_variants.parent, prefix=f".{stored_variants.name}."
+    )
+    try:
+        with open(variants, "rb") as f_in, os.fdopen(fd, "wb") as f_out:
+            with gzip.GzipFile(fileobj=f_out, mode="wb", compresslevel=6) as f_gz:
+                shutil.copyfileobj(f_in, f_gz)
+        # mkstemp only makes the file readable for its owner
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, stored_variants)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def add_sample(
+    con: sqlite3.Connection,
+    sample: str,
+    species: str,
+    report: Path,
+    variants: Optional[Path] = None,
+    resistance_variants_csvs: Sequence[Path] = (),
+    database_variants_dir: Optional[Path] = None,
+) -> str:
+    """
+    Add or replace the mutations of a sample in the cohort store
+
+    A sample is identified by its name. If the store already has the same
+    report, catalogue version and annotated VCF of the sample, nothing is
+    written.
+
+    Parameters
+    ----------
+    con : sqlite3 Connection
+        Connection to the store, see connect
+    sample : str
+        Sample name
+    species : str
+        Species (typing) of the sample, such as afumigatus
+    report : Path
+        Resistance report of the sample
+    variants : Path, optional
+        Annotated VCF of the sample, stored in database_variants_dir. If not
+        given, an earlier stored VCF of the sample is kept.
+    resistance_variants_csvs : sequence of Path
+        Reference CSVs the report was made with, recorded as its catalogue
+        version (see resistance_catalogue.get_catalogue_version)
+    database_variants_dir : Path, optional
+        Directory to store annotated VCFs in, see get_variants_dir. Required
+        if variants is given.
+
+    Returns
+    -------
+    status : str
+        added, updated or unchanged
+    """
+    report_hash = hash_file(report)
+    variants_hash = None if variants is None else hash_file(variants)
+    catalogue_version = (
+        get_catalogue_version(resistance_variants_csvs)
+        if resistance_variants_csvs
+        else None
+    )
+    stored = con.execute(
+        "SELECT report_hash, catalogue_version, variants, variants_hash "
+        "FROM samples WHERE sample = ?",
+        (sample,),
+    ).fetchone()
+    stored_variants = None if stored is None else stored[2]
+    stored_variants_hash = None if stored is None else stored[3]
+    # A report without mutations is the same for every catalogue
+    if (
+        stored is not None
+        and stored[0] == report_hash
+        and stored[1] == catalogue_version
+        and (variants is None or stored_variants_hash == variants_hash)
+    ):
+        return "unchanged"
+
+    if variants is not None and variants_hash != stored_variants_hash:
+        if database_variants_dir is None:
+            raise ValueError(
+                f"No directory given to store the annotated VCF of sample {sample}"
+            )
+        stored_variants = str(database_variants_dir.joinpath(f"{sample}.vcf.gz"))
+        stored_variants_hash = variants_hash
+        store_variants(variants, Path(stored_variants))
+
+    list_rows = get_mutation_rows(report)
+    placeholders = ", ".join("?" for _ in mutation_columns)
+    # Take the write lock up front, so the sample is replaced in one step
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        con.execute("DELETE FROM mutations WHERE sample = ?", (sample,))
+        con.executemany(
+            f"INSERT INTO mutations (sample, {', '.join(mutation_columns)}) "
+            f"VALUES (?, {placeholders})",
+            [(sample, *row) for row in list_rows],
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO samples (sample, species, report_hash, "
+            "catalogue_version, variants, variants_hash, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                sample,
+                species,
+                report_hash,
+                catalogue_version,
+                stored_variants,
+                stored_variants_hash,
+                datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            ),
+        )
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    return "added" if stored is None else "updated"
+
+
+def add_samples(database: Path, list_samples: List[Dict[str, str]]) -> pd.DataFrame:
+    """
+    Add the reports of a manifest to the cohort store
+
+    Parameters
+    ----------
+    database : Path
+        SQLite database of the cohort store, created if it does not exist
+    list_samples : list of dicts
+        Samples from the manifest
+
+    Returns
+    -------
+    df_status : pandas dataframe
+        sample, species and status (see add_sample) of every sample
+    """
+    con = connect(database)
+    try:
+        statuses = [
+            add_sample(
+                con,
+                s["sample"],
+                s["species"],
+                Path(s["report"]),
+                Path(s["variants"]) if s.get("variants") else None,
+                [
+                    Path(s[col])
+                    for col in [
+                        "aa_resistance_variants_csv",
+                        "nt_resistance_variants_csv",
+                    ]
+                    if s.get(col)
+                ],
+                get_variants_dir(database),
+            )
+            for s in list_samples
+        ]
+    finally:
+        con.close()
+    return pd.DataFrame(
+        {
+            "sample": [s["sample"] for s in list_samples],
+            "species": [s["species"] for s in list_samples],
+            "status": statuses,
+        }
+    )
+
+
+def get_matrix(
+    database: Path,
+    value: str = "presence",
+    samples: Optional[Sequence[str]] = None,
+    genetic_elements: Optional[Sequence[str]] = None,
+    known_only: bool = False,
+) -> pd.DataFrame:
+    """
+    Query a sample x mutation matrix from the cohort store
+
+    Only the selected rows are read, using the indexes of the store.
+
+    Parameters
+    ----------
+    database : Path
+        SQLite database of the cohort store
+    value : str
+        Value of the cells, one of matrix_values. presence is 1 if the sample
+        has the mutation and 0 otherwise, the other values are empty for
+        absent mutations.
+    samples : sequence of str, optional
+        Samples to include, defaults to all samples in the store
+    genetic_elements : sequence of str, optional
+        Genes or other genetic elements to include, defaults to all
+    known_only : bool
+        Only include mutations with a known impact on resistance
+
+    Returns
+    -------
+    df_matrix : pandas dataframe
+        One row per sample and one column per mutation, labelled
+        chromosome:position:ref_nt>alt_nt
+    """
+    if value not in matrix_values:
+        raise ValueError(
+            f"Unknown matrix value {value}, choose from {', '.join(matrix_values)}"
+        )
+    conditions = []
+    parameters: List[str] = []
+    if samples is not None:
+        conditions.append(f"sample IN ({', '.join('?' for _ in samples)})")
+        parameters.extend(samples)
+    if genetic_elements is not None:
+        conditions.append(
+            f"genetic_element IN ({', '.join('?' for _ in genetic_elements)})"
+        )
+        parameters.extend(genetic_elements)
+    if known_only:
+        conditions.append("impact IS NOT NULL")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cell = "1" if value == "presence" else value
+
+    con = connect(database)
+    try:
+        df_mutations = pd.read_sql_query(
+            f"SELECT DISTINCT sample, {', '.join(variant_columns)}, {cell} AS value "
+            f"FROM mutations {where} ORDER BY chromosome, position, ref_nt, alt_nt",
+            con,
+            params=parameters,
+        )
+        if samples is None:
+            samples = [
+                row[0]
+                for row in con.execute("SELECT sample FROM samples ORDER BY sample")
+            ]
+    finally:
+        con.close()
+
+    df_mutations["mutation"] = (
+        df_mutations["chromosome"]
+        + ":"
+        + df_mutations["position"].astype(str)
+        + ":"
+        + df_mutations["ref_nt"]
+        + ">"
+        + df_mutations["alt_nt"]
+    )
+    mutations = list(dict.fromkeys(df_mutations["mutation"]))
+    # A mutation can be reported more than once per sample (amino acid and
+    # nucleotide based), with the same values
+    df_matrix = (
+        df_mutations.drop_duplicates(["sample", "mutation"])
+        .pivot(index="sample", columns="mutation", values="value")
+        .reindex(index=samples, columns=mutations)
+    )
+    if value == "presence":
+        df_matrix = df_matrix.fillna(0).astype(int)
+    df_matrix.index.name = "sample"
+    df_matrix.columns.name = None
+    return df_matrix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Add resistance reports to a cohort store shared by pipeline runs, or query a sample x mutation matrix from it"
+    )
+    parser.add_argument(
+        "action",
+        help="Add the reports of a manifest (add) or write a matrix (matrix)",
+        choices=["add", "matrix"],
+    )
+    parser.add_argument(
+        "-d", "--database", help="SQLite database", required=True, type=Path
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="Tab separated file with the columns sample, species and report, and optionally variants, aa_resistance_variants_csv and nt_resistance_variants_csv (add)",
+        type=Path,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Status of the added samples (add) or the matrix (matrix), as TSV",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--value",
+        help="Value of the matrix cells (matrix)",
+        choices=matrix_values,
+        default="presence",
+    )
+    parser.add_argument(
+        "--samples", help="Samples to include (matrix)", nargs="+", default=None
+    )
+    parser.add_argument(
+        "--genetic-elements",
+        help="Genetic elements to include (matrix)",
+        nargs="+",
+        default=None,
+    )
+    parser.add_argument(
+        "--known-only",
+        help="Only include mutations with a known impact on resistance (matrix)",
+        action="store_true",
+    )
+    args = parser.parse_args()
+
+    if args.action == "add":
+        if args.manifest is None:
+            parser.error("add requires --manifest")
+        df_status = add_samples(args.database, read_manifest(args.manifest))
+        for status, count in df_status["status"].value_counts().items():
+            print(f"{count} samples {status}", file=sys.stderr)
+        df_status.to_csv(args.output, sep="\t", index=False)
+    else:
+        df_matrix = get_matrix(
+            args.database,
+            args.value,
+            args.samples,
+            args.genetic_elements,
+            args.known_only,
+        )
+        df_matrix.to_csv(args.output, sep="\t")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,49 @@ from pathlib import Path
 
 import pandas as pd
 
+from workflow.scripts.report_io import read_report, write_report
+
+
+def combine_reports(aa_mutations: Path, nt_mutations: Path, output: Path) -> None:
+    """
+    Combine the amino acid and nucleotide based reports of a sample
+
+    Reports are read and written as Parquet or TSV depending on their suffix.
+
+    Parameters
+    ----------
+    aa_mutations : Path
+        Report with amino acid mutations
+    nt_mutations : Path
+        Report with nucleotide mutations
+    output : Path
+        Combined report, sorted by chromosome and position
+    """
+    df_combined = combine_aa_nt(read_report(aa_mutations), read_report(nt_mutations))
+    write_report(df_combined, output)
 
-def main(args):
-    df_aa = pd.read_csv(args.aa_mutations, sep="\t")
-    df_nt = pd.read_csv(args.nt_mutations, sep="\t")
 
+def combine_aa_nt(df_aa: pd.DataFrame, df_nt: pd.DataFrame) -> pd.DataFrame:
+    """
+    Combine amino acid and nucleotide based reports
+
+    Parameters
+    ----------
+    df_aa : pandas dataframe
+        Report with amino acid mutations
+    df_nt : pandas dataframe
+        Report with nucleotide mutations
+
+    Returns
+    -------
+    df_combined : pandas dataframe
+        Mutations of both reports sorted by chromosome and position, with "-"
+        for the columns that only one of the reports has
+    """
     df_combined = pd.concat([df_aa, df_nt])
+    # Categories of Parquet reports do not include the placeholder below
+    categorical = df_combined.select_dtypes("category").columns
+    df_combined[categorical] = df_combined[categorical].astype(object)
 
     df_combined.fillna("-", inplace=True)
 
@@ -19,8 +56,11 @@ def main(args):
         ascending=True,
         inplace=True,
     )
+    return df_combined
 
-    df_combined.to_csv(args.output, sep="\t", index=False)
+
+def main(args):
+    combine_reports(args.aa_mutations, args.nt_mutations, args.output)
 
 
 if __name__ == "__main__":
@@ -29,21 +69,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "-aa",
         "--aa-mutations",
-        help="Input file with amino acid mutations",
+        help="Input file with amino acid mutations (TSV or Parquet)",
         required=True,
         type=Path,
     )
     parser.add_argument(
         "-nt",
         "--nt-mutations",
-        help="Input file with nucleotide mutations",
+        help="Input file with nucleotide mutations (TSV or Parquet)",
         required=True,
         type=Path,
     )
     parser.add_argument(
         "-o",
         "--output",
-        help="Output file with combined mutations",
+        help="Output file with combined mutations, written as Parquet if it ends with .parquet",
         required=True,
         type=Path,
     )
@@ -2,11 +2,40 @@
 
 import argparse
 import re
+from array import array
 from pathlib import Path
-from typing import Dict
-
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
+from workflow.scripts.lookup_join import lookup_join
+from workflow.scripts.report_io import write_report
+from workflow.scripts.resistance_catalogue import (
+    ResistanceCatalogue,
+    join_key_columns,
+    load_catalogue,
+)
+from workflow.scripts.stage_profiler import (
+    StageProfiler,
+    add_profiling_arguments,
+    get_profile_path,
+    get_profiler,
+)
+from workflow.scripts.vcf_reader import open_variants_table
+
 dict_col_rename = {
     "gene": "genetic_element",
     "aa_change": "mutation_name",
@@ -25,56 +54,391 @@ dict_col_rename = {
     "AF": "allele_frequency",
 }
 
+# Columns with few distinct values, stored as categoricals in compact tables
+compact_columns = [
+    "CHROM",
+    "TYPE",
+    "REF",
+    "ALT",
+    "AF",
+    "type",
+    "locus_tag",
+    "mutation_name",
+    "ref_aa",
+    "alt_aa",
+]
+
+
+def compile_locus_tag_pattern(locus_tags: Collection[str]) -> Pattern[str]:
+    """
+    Compile a pattern that matches any of the locus tags
+
+    Parameters
+    ----------
+    locus_tags : collection of str
+        Locus tags to search for
+
+    Returns
+    -------
+    locus_tag_pattern : compiled regular expression
+        Pattern matching a line that names at least one of the locus tags
+    """
+    if not locus_tags:
+        # Never matches, so every line is skipped
+        return re.compile(r"(?!)")
+    return re.compile("|".join(re.escape(tag) for tag in sorted(locus_tags)))
+
+
+def iter_consequences(
+    lines: Iterator[str], header: List[str], locus_tags: Optional[Collection[str]]
+) -> Iterator[Tuple[Optional[List[Any]], List[str]]]:
+    """
+    Split lines of a VariantsToTable output into their BCSQ consequences
+
+    Lines that do not mention any of locus_tags are skipped before they are
+    split into consequences, but their consequences are still yielded when
+    they could be wider than all earlier ones, as the width of the widest
+    consequence determines which field holds the amino acid mutation.
 
-def read_input_file(input_file: Path) -> pd.DataFrame:
+    Parameters
+    ----------
+    lines : iterator of str
+        Lines of the input file after the header
+    header : list of str
+        Column names of the input file
+    locus_tags : collection of str, optional
+        Locus tags to keep, all consequences are kept if None
+
+    Yields
+    ------
+    fields : list or None
+        Fields of the line without BCSQ, with POS and DP as int, or None for
+        consequences that are not kept. Consequences of the same line share
+        the list.
+    bcsq_fields : list of str
+        Fields of the consequence
+    """
+    bcsq_index = header.index("BCSQ")
+    pos_index = header.index("POS")
+    dp_index = header.index("DP")
+    nr_col = 0
+    locus_tag_pattern = (
+        compile_locus_tag_pattern(locus_tags) if locus_tags is not None else None
+    )
+    for line in lines:
+        # Skip lines that only contain "@[0-9]+". These are listed for variants
+        # of which the effect is superceded by another variant's effect
+        if not line.strip() or re.search(r"\t@[0-9]+$", line):
+            continue
+        if locus_tag_pattern is not None and not locus_tag_pattern.search(line):
+            # Line names none of the locus tags, so only the BCSQ width matters.
+            # A consequence can not have more pipes than the whole line.
+            if line.count("|") >= nr_col:
+                bcsq = line.rstrip("\n").split("\t")[bcsq_index]
+                for consequence in bcsq.split(","):
+                    bcsq_fields = consequence.split("|")
+                    nr_col = max(nr_col, len(bcsq_fields))
+                    yield None, bcsq_fields
+            continue
+        fields: List[Any] = line.rstrip("\n").split("\t")
+        fields[pos_index] = int(fields[pos_index])
+        fields[dp_index] = int(fields[dp_index])
+        # split on comma to separate multiple entries on single line
+        for consequence in fields.pop(bcsq_index).split(","):
+            bcsq_fields = consequence.split("|")
+            nr_col = max(nr_col, len(bcsq_fields))
+            if locus_tags is not None and (
+                len(bcsq_fields) < 2 or bcsq_fields[1] not in locus_tags
+            ):
+                yield None, bcsq_fields
+            else:
+                yield fields, bcsq_fields
+
+
+def get_output_columns(header: List[str]) -> List[str]:
+    """
+    Column names of the parsed records, with BCSQ replaced by its parts
+    """
+    return [col for col in header if col != "BCSQ"] + [
+        "type",
+        "locus_tag",
+        "mutation_name",
+        "ref_aa",
+        "alt_aa",
+    ]
+
+
+def parse_input_lines(
+    lines: Iterable[str], locus_tags: Optional[Collection[str]] = None
+) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Parse lines of a VariantsToTable output into one record per BCSQ consequence
+
+    Lines are consumed one at a time, so the input is never held in memory as a
+    whole. Only consequences in locus_tags are kept when it is provided, and
+    lines that do not mention any of these locus tags are skipped before they
+    are split into consequences.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the input file, starting with the header
+    locus_tags : collection of str, optional
+        Locus tags to keep, all consequences are kept if None
+
+    Returns
+    -------
+    columns : list of str
+        Column names of the parsed records
+    records : list of lists
+        Parsed records, with BCSQ replaced by type, locus_tag, mutation_name,
+        ref_aa and alt_aa
+    """
+    lines = iter(lines)
+    header = next(lines).rstrip("\n").split("\t")
+
+    kept: List[Tuple[List[Any], List[str]]] = []
+    # Number of BCSQ fields is usually 7 or 9 with the second to last containing
+    # the aa mutation. This differs per reference, so track the maximum over all
+    # consequences in the file, including the ones that are not kept.
+    nr_col = 0
+    for fields, bcsq_fields in iter_consequences(lines, header, locus_tags):
+        nr_col = max(nr_col, len(bcsq_fields))
+        if fields is not None:
+            kept.append((fields, bcsq_fields))
+
+    aa_mutation_col = nr_col - 2
+    records: List[List[Any]] = []
+    for fields, bcsq_fields in kept:
+        # Keep type, locus_tag and amino acid mutation name, missing fields are None
+        padded: List[Optional[str]] = [*bcsq_fields]
+        padded += [None] * (max(nr_col, 2) - len(bcsq_fields))
+        mutation_name = padded[aa_mutation_col] if aa_mutation_col >= 0 else None
+        # Split aa mutation into ref and alt
+        if mutation_name is None:
+            ref_aa, alt_aa = None, None
+        else:
+            aa_fields = mutation_name.split(">")
+            ref_aa = aa_fields[0]
+            alt_aa = aa_fields[1] if len(aa_fields) > 1 else None
+        records.append(fields + [padded[0], padded[1], mutation_name, ref_aa, alt_aa])
+
+    return get_output_columns(header), records
+
+
+class StringDictionary:
+    """
+    Dictionary encoding of a column of strings, built while the column is read
+
+    Every distinct string is stored once and every value as the 32-bit code of
+    its string, with -1 for missing values.
+    """
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        return self.codes.setdefault(value, len(self.codes))
+
+    def to_categorical(
+        self, codes: Union["array[int]", npt.NDArray[np.int32]]
+    ) -> pd.Categorical:
+        """
+        Categorical of encoded values, with sorted categories like
+        astype("category")
+        """
+        categorical = pd.Categorical.from_codes(
+            np.asarray(codes, dtype=np.int32), categories=list(self.codes)
+        )
+        return categorical.reorder_categories(sorted(self.codes))
+
+
+def parse_input_columns(
+    lines: Iterable[str], locus_tags: Optional[Collection[str]] = None
+) -> Dict[str, Any]:
+    """
+    Parse lines of a VariantsToTable output into compact columns, with one
+    value per BCSQ consequence
+
+    Gives the same values as parse_input_lines, but no object is created per
+    record: the columns in compact_columns are dictionary encoded while they
+    are read, so amino acid changes, chromosomes and alleles that repeat are
+    only stored once, and POS and DP are stored as arrays of integers.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the input file, starting with the header
+    locus_tags : collection of str, optional
+        Locus tags to keep, all consequences are kept if None
+
+    Returns
+    -------
+    columns : dict
+        Categorical, numpy array or list of values by column name, with BCSQ
+        replaced by type, locus_tag, mutation_name, ref_aa and alt_aa
+    """
+    lines = iter(lines)
+    header = next(lines).rstrip("\n").split("\t")
+    header_columns = [col for col in header if col != "BCSQ"]
+    int_columns = {"POS", "DP"}
+    dictionaries = {
+        col: StringDictionary()
+        for col in header_columns + ["type", "locus_tag"]
+        if col in compact_columns
+    }
+    values: Dict[str, Any] = {
+        col: array("q") if col in int_columns else array("i")
+        for col in header_columns + ["type", "locus_tag"]
+        if col in int_columns or col in dictionaries
+    }
+    values.update({col: [] for col in header_columns if col not in values})
+    encoded = [
+        (index, values[col], dictionaries.get(col))
+        for index, col in enumerate(header_columns)
+    ]
+
+    # The amino acid mutation is the second to last field of the widest
+    # consequence in the file, which is only known at the end. Consequences
+    # that are as wide store their second to last field, and the last fields
+    # of consequences that are one field narrower are kept as UTF-8 bytes.
+    mutations = StringDictionary()
+    second_last_codes = array("i")
+    widths = array("i")
+    last_fields = bytearray()
+    last_ends = array("q")
+    nr_col = 0
+    for fields, bcsq_fields in iter_consequences(lines, header, locus_tags):
+        width = len(bcsq_fields)
+        nr_col = max(nr_col, width)
+        if fields is None:
+            continue
+        for index, column, dictionary in encoded:
+            if dictionary is None:
+                column.append(fields[index])
+            else:
+                column.append(dictionary.encode(fields[index]))
+        values["type"].append(dictionaries["type"].encode(bcsq_fields[0]))
+        values["locus_tag"].append(
+            dictionaries["locus_tag"].encode(bcsq_fields[1] if width > 1 else None)
+        )
+        widths.append(width)
+        second_last_codes.append(mutations.encode(bcsq_fields[-2]) if width > 1 else -1)
+        last_fields += bcsq_fields[-1].encode()
+        last_ends.append(len(last_fields))
+
+    # Same rules as the padding in parse_input_lines
+    np_widths = np.asarray(widths, dtype=np.int32)
+    if nr_col >= 2:
+        mutation_codes = np.where(
+            np_widths == nr_col, np.asarray(second_last_codes, dtype=np.int32), -1
+        ).astype(np.int32)
+        for i in np.flatnonzero(np_widths == nr_col - 1):
+            start = last_ends[i - 1] if i > 0 else 0
+            mutation_codes[i] = mutations.encode(
+                last_fields[start : last_ends[i]].decode()
+            )
+    else:
+        mutation_codes = np.full(len(np_widths), -1, dtype=np.int32)
+    del last_fields, last_ends
+
+    # Split every distinct aa mutation into ref and alt once
+    ref_aas, alt_aas = StringDictionary(), StringDictionary()
+    mutation_ref_codes: List[int] = []
+    mutation_alt_codes: List[int] = []
+    for mutation_name in mutations.codes:
+        aa_fields = mutation_name.split(">")
+        mutation_ref_codes.append(ref_aas.encode(aa_fields[0]))
+        mutation_alt_codes.append(
+            alt_aas.encode(aa_fields[1] if len(aa_fields) > 1 else None)
+        )
+    # Missing mutations (code -1) index the appended -1
+    ref_codes: npt.NDArray[np.int32] = np.array(
+        mutation_ref_codes + [-1], dtype=np.int32
+    )[mutation_codes]
+    alt_codes: npt.NDArray[np.int32] = np.array(
+        mutation_alt_codes + [-1], dtype=np.int32
+    )[mutation_codes]
+
+    columns: Dict[str, Any] = {}
+    for col in header_columns + ["type", "locus_tag"]:
+        if col in dictionaries:
+            columns[col] = dictionaries[col].to_categorical(values[col])
+        elif col in int_columns:
+            columns[col] = np.asarray(values[col], dtype=np.int64)
+        else:
+            columns[col] = values[col]
+    columns["mutation_name"] = mutations.to_categorical(mutation_codes)
+    columns["ref_aa"] = ref_aas.to_categorical(ref_codes)
+    columns["alt_aa"] = alt_aas.to_categorical(alt_codes)
+    return {col: columns[col] for col in get_output_columns(header)}
+
+
+def read_input_file(
+    input_file: Path,
+    locus_tags: Optional[Collection[str]] = None,
+    compact: bool = False,
+) -> pd.DataFrame:
     """
     Read in input file and return pandas dataframe
 
+    The file is streamed line by line and only the kept consequences are
+    loaded into the dataframe, so peak memory does not grow with the size of
+    the input when locus_tags is given.
+
     Parameters
     ----------
     input_file : str
-        Path to input file
+        Path to the annotated VCF, or its export by GATK VariantsToTable
+    locus_tags : collection of str, optional
+        Locus tags to keep, all consequences are kept if None
+    compact : bool
+        Store the columns in compact_columns as categoricals, see
+        parse_input_columns
 
     Returns
     -------
     df_input : pandas dataframe
     """
-    # Open input files and filter out lines that only contain "@[0-9]+"
-    # These are listed for variants of which the effect is superceded by another variant's effect
-    with open(input_file, "r") as f:
-        lines = f.readlines()
-        lines = [
-            line.rstrip("\n") for line in lines if not re.search(r"\t@[0-9]+$", line)
-        ]
-    # Read lines into pandas dataframe
-    df_input = pd.DataFrame([line.split("\t") for line in lines[1:]])
-    df_input.columns = lines[0].rstrip("\n").split("\t")
+    with open_variants_table(input_file) as f:
+        return read_input_lines(f, locus_tags, compact)
+
+
+def read_input_lines(
+    lines: Iterable[str],
+    locus_tags: Optional[Collection[str]] = None,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """
+    Read in lines of a VariantsToTable export and return pandas dataframe
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the export, starting with the header
+    locus_tags : collection of str, optional
+        Locus tags to keep, all consequences are kept if None
+    compact : bool
+        Store the columns in compact_columns as categoricals instead of one
+        string per row, see parse_input_columns. The values and the results of
+        the comparison are the same.
+
+    Returns
+    -------
+    df_input : pandas dataframe
+    """
+    if compact:
+        return pd.DataFrame(parse_input_columns(lines, locus_tags))
+    columns, records = parse_input_lines(lines, locus_tags)
+    df_input = pd.DataFrame(records, columns=columns, index=pd.RangeIndex(len(records)))
     # if AF contains a string like 0.5,0.5 convert to two rows for this record with AF 0.5
     # df_input = df_input.assign(AF=df_input["AF"].str.split(",")).explode("AF")
     # Set dtypes
     # df_input = df_input.astype({"POS": int, "DP": int, "AF": float})
     df_input = df_input.astype({"POS": int, "DP": int, "AF": str})
-
-    # split on comma to separate multiple entries on single line
-    df_input["BCSQ"] = df_input["BCSQ"].str.split(",")
-    df_input_long = df_input.explode("BCSQ", ignore_index=True)
-
-    # Get number of columns. Ususally 7 or 9 with the second to last containing aa mutation
-    # This differs per reference
-    nr_col = df_input_long["BCSQ"].str.split("|", expand=True).shape[1]
-    aa_mutation_col = nr_col - 2
-
-    # Split BCSQ fields based on pipe and keep type, locus_tag and amino acid mutation name
-    df_input_long[["type", "locus_tag", "mutation_name"]] = df_input_long[
-        "BCSQ"
-    ].str.split("|", expand=True)[[0, 1, aa_mutation_col]]
-
-    # Split aa mutation into ref and alt
-    df_input_long[["ref_aa", "alt_aa"]] = df_input_long["mutation_name"].str.split(
-        ">", expand=True
-    )
-    df_input_long = df_input_long.drop(columns=["BCSQ"])
-    return df_input_long
+    return df_input
 
 
 def create_locus_tag_gene_dict(resistance_variants_csv: pd.DataFrame) -> Dict[str, str]:
@@ -134,7 +498,8 @@ def filter_for_resistance_genes(
 
 
 def merge_resistance_genes_with_ref(
-    df_resistance_genes: pd.DataFrame, resistance_variants_csv: pd.DataFrame
+    df_resistance_genes: pd.DataFrame,
+    resistance_variants_csv: Union[pd.DataFrame, ResistanceCatalogue],
 ) -> pd.DataFrame:
     """
     Add known info on resistance mutations to observed mutations
@@ -143,19 +508,20 @@ def merge_resistance_genes_with_ref(
     ----------
     df_resistance_genes : pandas dataframe
         Dataframe with mutations in resistance genes and gene names
-    resistance_variants_csv : pandas dataframe
-        Reference CSV of AMR mutations
+    resistance_variants_csv : pandas dataframe or ResistanceCatalogue
+        Reference CSV of AMR mutations, a catalogue reuses its lookup index
 
     Returns
     -------
     df_resistance_with_impact : pandas dataframe
         Dataframe with mutations in resistance genes, gene names and known info on resistance mutations
     """
-    df_resistance_with_impact = df_resistance_genes.merge(
+    df_resistance_with_impact = lookup_join(
+        df_resistance_genes,
         resistance_variants_csv,
         how="left",
         left_on=["locus_tag", "genetic_element", "ref_aa", "alt_aa"],
-        right_on=["locus_tag", "genetic_element", "ref_aa", "alt_aa"],
+        right_on=join_key_columns["aa"],
     )
     return df_resistance_with_impact
 
@@ -210,9 +576,157 @@ def filter_for_known_mutations(
     return df_known_mutations
 
 
+def compare_sample(
+    input_file: Path,
+    output: Path,
+    full_output: Path,
+    catalogue: ResistanceCatalogue,
+    parquet: bool = False,
+    profiler: Optional[StageProfiler] = None,
+) -> None:
+    """
+    Compare the mutations of a single sample to the reference list of AMR mutations
+
+    Parameters
+    ----------
+    input_file : Path
+        Path to the annotated VCF, or its export by GATK VariantsToTable
+    output : Path
+        Output file with only known AMR mutations
+    full_output : Path
+        Output file with all mutations in resistance genes
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+    """
+    with open_variants_table(input_file) as f:
+        compare_lines(f, output, full_output, catalogue, parquet, profiler)
+
+
+def compare_lines(
+    lines: Iterable[str],
+    output: Path,
+    full_output: Path,
+    catalogue: ResistanceCatalogue,
+    parquet: bool = False,
+    profiler: Optional[StageProfiler] = None,
+) -> None:
+    """
+    Compare the mutations in lines of a VariantsToTable export to the reference
+    list of AMR mutations
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the export, starting with the header
+    output : Path
+        Output file with only known AMR mutations
+    full_output : Path
+        Output file with all mutations in resistance genes
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    df_known_resistance_mutations, df_all_mutations_resistance_genes = get_reports(
+        lines, catalogue, profiler
+    )
+    nr_rows = len(df_known_resistance_mutations) + len(
+        df_all_mutations_resistance_genes
+    )
+    with profiler.stage("write_report", nr_rows) as stage:
+        write_report(df_known_resistance_mutations, output, parquet)
+        write_report(df_all_mutations_resistance_genes, full_output, parquet)
+        stage["rows_out"] = nr_rows
+
+
+def get_reports(
+    lines: Iterable[str],
+    catalogue: ResistanceCatalogue,
+    profiler: Optional[StageProfiler] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compare the mutations in lines of a VariantsToTable export to the reference
+    list of AMR mutations, without writing the reports
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of the export, starting with the header
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+
+    Returns
+    -------
+    df_known_resistance_mutations : pandas dataframe
+        Known AMR mutations
+    df_all_mutations_resistance_genes : pandas dataframe
+        All mutations in resistance genes
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    resistance_variants_csv = catalogue.table
+    locus_tag_gene_dict = create_locus_tag_gene_dict(resistance_variants_csv)
+
+    # Read in the input, keeping only consequences in resistance genes. The
+    # consequences of every record are split while reading.
+    with profiler.stage("read_input_file") as stage:
+        df_mutations = read_input_lines(
+            lines, locus_tags=locus_tag_gene_dict, compact=True
+        )
+        stage["rows_out"] = len(df_mutations)
+
+    with profiler.stage("filter_for_resistance_genes", len(df_mutations)) as stage:
+        df_resistance_genes = filter_for_resistance_genes(
+            df_mutations, locus_tag_gene_dict
+        )
+        stage["rows_out"] = len(df_resistance_genes)
+
+    with profiler.stage(
+        "merge_resistance_genes_with_ref", len(df_resistance_genes)
+    ) as stage:
+        df_resistance_with_impact = merge_resistance_genes_with_ref(
+            df_resistance_genes, catalogue
+        )
+        stage["rows_out"] = len(df_resistance_with_impact)
+
+    with profiler.stage(
+        "filter_for_known_mutations", len(df_resistance_with_impact)
+    ) as stage:
+        df_all_mutations_resistance_genes = rename_df_resistance_with_impact(
+            df_resistance_with_impact, dict_col_rename
+        )
+        df_known_resistance_mutations = filter_for_known_mutations(
+            df_all_mutations_resistance_genes
+        )
+        stage["rows_out"] = len(df_known_resistance_mutations)
+
+    # Record which catalogue the reports were made with
+    df_known_resistance_mutations = df_known_resistance_mutations.assign(
+        catalogue_version=catalogue.version
+    )
+    df_all_mutations_resistance_genes = df_all_mutations_resistance_genes.assign(
+        catalogue_version=catalogue.version
+    )
+    return df_known_resistance_mutations, df_all_mutations_resistance_genes
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", help="Input file", required=True, type=Path)
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Annotated VCF, or its export by GATK VariantsToTable",
+        required=True,
+        type=Path,
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -233,33 +747,44 @@ def main() -> None:
         required=True,
         type=Path,
     )
+    parser.add_argument(
+        "--parquet",
+        help="Also write the reports as Parquet, next to the TSV files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    add_profiling_arguments(parser)
     args = parser.parse_args()
 
-    # Read in the reference list of AMR mutations
-    resistance_variants_csv = pd.read_csv(args.resistance_variants_csv)
-
-    # Read in the input file
-    df_mutations = read_input_file(args.input)
-
-    locus_tag_gene_dict = create_locus_tag_gene_dict(resistance_variants_csv)
+    profiler = get_profiler(args, args.output)
 
-    df_resistance_genes = filter_for_resistance_genes(df_mutations, locus_tag_gene_dict)
-
-    df_resistance_with_impact = merge_resistance_genes_with_ref(
-        df_resistance_genes, resistance_variants_csv
-    )
-
-    df_all_mutations_resistance_genes = rename_df_resistance_with_impact(
-        df_resistance_with_impact, dict_col_rename
+    # Read in the reference list of AMR mutations
+    with profiler.stage("load_catalogue") as stage:
+        catalogue = load_catalogue(
+            args.resistance_variants_csv, args.catalogue_cache_dir
+        )
+        stage["rows_out"] = len(catalogue.table)
+
+    compare_sample(
+        args.input,
+        args.output,
+        args.full_output,
+        catalogue,
+        parquet=args.parquet,
+        profiler=profiler,
     )
-
-    df_known_resistance_mutations = filter_for_known_mutations(
-        df_all_mutations_resistance_genes
+    profiler.write(
+        get_profile_path(args.output),
+        script="compare_aa_mutations",
+        input=str(args.input),
+        output=str(args.output),
     )
 
-    df_known_resistance_mutations.to_csv(args.output, sep="\t", index=False)
-    df_all_mutations_resistance_genes.to_csv(args.full_output, sep="\t", index=False)
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from workflow.scripts import compare_aa_mutations, compare_nt_mutations
+from workflow.scripts.resistance_catalogue import ResistanceCatalogue, load_catalogue
+
+manifest_columns = [
+    "sample",
+    "input",
+    "output",
+    "full_output",
+    "resistance_variants_csv",
+]
+# Reference genome to left-normalise INDELs against, only for nucleotide
+# comparisons
+optional_manifest_columns = ["fasta_ref"]
+
+# Compiled catalogues of the current process, set by init_worker
+worker_resistance_variants: Dict[str, ResistanceCatalogue] = {}
+
+
+def read_manifest(manifest: Path) -> List[Dict[str, str]]:
+    """
+    Read manifest of samples to compare
+
+    Parameters
+    ----------
+    manifest : Path
+        Tab separated file with a header and the columns sample, input, output,
+        full_output and resistance_variants_csv, and optionally fasta_ref.
+        full_output can be left empty for nucleotide comparisons.
+
+    Returns
+    -------
+    list_samples : list of dicts
+        One dict per sample with the manifest columns as keys
+    """
+    with open(manifest, "r") as f:
+        list_samples = list(csv.DictReader(f, delimiter="\t"))
+    if list_samples:
+        missing_columns = set(manifest_columns) - set(list_samples[0].keys())
+        if missing_columns:
+            raise ValueError(
+                f"Manifest {manifest} is missing columns: {', '.join(sorted(missing_columns))}"
+            )
+    return list_samples
+
+
+def write_manifest(manifest: Path, list_samples: List[Dict[str, str]]) -> None:
+    """
+    Write manifest of samples to compare
+
+    Parameters
+    ----------
+    manifest : Path
+        Path to output manifest
+    list_samples : list of dicts
+        One dict per sample with (a subset of) the manifest columns as keys
+    """
+    with open(manifest, "w", newline="") as f:
+        writer = csv.DictWriter(
+            f,
+            fieldnames=manifest_columns + optional_manifest_columns,
+            delimiter="\t",
+            restval="",
+        )
+        writer.writeheader()
+        writer.writerows(list_samples)
+
+
+def load_resistance_variants(
+    list_samples: List[Dict[str, str]],
+    cache_dir: Optional[Path] = None,
+) -> Dict[str, ResistanceCatalogue]:
+    """
+    Load every distinct reference CSV of AMR mutations once
+
+    Parameters
+    ----------
+    list_samples : list of dicts
+        Samples from the manifest
+    cache_dir : Path, optional
+        Directory to cache the compiled catalogues in, defaults to the
+        directory of each CSV
+
+    Returns
+    -------
+    dict_resistance_variants : dict
+        Dictionary with path of the reference CSV as key and its compiled catalogue
+        as value
+    """
+    dict_resistance_variants = {}
+    for sample in list_samples:
+        csv_path = sample["resistance_variants_csv"]
+        if csv_path not in dict_resistance_variants:
+            dict_resistance_variants[csv_path] = load_catalogue(
+                Path(csv_path), cache_dir
+            )
+    return dict_resistance_variants
+
+
+def init_worker(dict_resistance_variants: Dict[str, ResistanceCatalogue]) -> None:
+    """
+    Store the compiled reference lists of AMR mutations in a worker process
+
+    Parameters
+    ----------
+    dict_resistance_variants : dict
+        Dictionary with path of the reference CSV as key and its compiled catalogue
+        as value
+    """
+    global worker_resistance_variants
+    worker_resistance_variants = dict_resistance_variants
+
+
+def compare_single_sample(
+    sample: Dict[str, str],
+    mode: str,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    parquet: bool = False,
+) -> str:
+    """
+    Compare mutations of a single sample from the manifest
+
+    Parameters
+    ----------
+    sample : dict
+        Sample from the manifest
+    mode : str
+        Either "aa" for amino acid or "nt" for nucleotide based comparison
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen,
+        only used for nucleotide based comparisons
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV, only used
+        for nucleotide based comparisons
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+
+    Returns
+    -------
+    sample_name : str
+        Name of the compared sample
+    """
+    catalogue = worker_resistance_variants[sample["resistance_variants_csv"]]
+    if mode == "aa":
+        if not sample["full_output"]:
+            raise ValueError(
+                f"No full_output given for sample {sample['sample']} in aa mode"
+            )
+        compare_aa_mutations.compare_sample(
+            Path(sample["input"]),
+            Path(sample["output"]),
+            Path(sample["full_output"]),
+            catalogue,
+            parquet=parquet,
+        )
+    else:
+        compare_nt_mutations.compare_sample(
+            Path(sample["input"]),
+            Path(sample["output"]),
+            catalogue,
+            screen_window=screen_window,
+            min_indel_length=min_indel_length,
+            parquet=parquet,
+            fasta_ref=Path(sample["fasta_ref"]) if sample.get("fasta_ref") else None,
+        )
+    return sample["sample"]
+
+
+def compare_batch(
+    list_samples: List[Dict[str, str]],
+    mode: str,
+    threads: int = 1,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    catalogue_cache_dir: Optional[Path] = None,
+    parquet: bool = False,
+) -> None:
+    """
+    Compare mutations of all samples in the manifest
+
+    Parameters
+    ----------
+    list_samples : list of dicts
+        Samples from the manifest
+    mode : str
+        Either "aa" for amino acid or "nt" for nucleotide based comparison
+    threads : int
+        Number of worker processes. Samples are compared in this process if 1.
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen,
+        only used for nucleotide based comparisons
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV, only used
+        for nucleotide based comparisons
+    catalogue_cache_dir : Path, optional
+        Directory to cache the compiled catalogues in, defaults to the
+        directory of each CSV
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+    """
+    dict_resistance_variants = load_resistance_variants(
+        list_samples, catalogue_cache_dir
+    )
+    if threads <= 1:
+        init_worker(dict_resistance_variants)
+        for sample in list_samples:
+            compare_single_sample(
+                sample, mode, screen_window, min_indel_length, parquet
+            )
+        return
+
+    # The catalogues are pickled once per worker instead of once per sample
+    with ProcessPoolExecutor(
+        max_workers=threads,
+        initializer=init_worker,
+        initargs=(dict_resistance_variants,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                compare_single_sample,
+                sample,
+                mode,
+                screen_window,
+                min_indel_length,
+                parquet,
+            )
+            for sample in list_samples
+        ]
+        for future in futures:
+            # Raises the exception of a failed sample
+            future.result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help="Tab separated manifest with columns sample, input, output, full_output and resistance_variants_csv",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--mode",
+        help="Compare amino acid (aa) or nucleotide (nt) mutations",
+        required=True,
+        choices=["aa", "nt"],
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        help="Number of samples to compare in parallel",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases up- and downstream of tandem repeat regions to screen for large INDELs (nt mode)",
+        default=50,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-indel-length",
+        help="Minimum length of the REF or ALT allele of a possible CNV (nt mode)",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "--parquet",
+        help="Also write the reports as Parquet, next to the TSV files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    list_samples = read_manifest(args.manifest)
+    compare_batch(
+        list_samples,
+        args.mode,
+        args.threads,
+        screen_window=args.screen_window,
+        min_indel_length=args.min_indel_length,
+        catalogue_cache_dir=args.catalogue_cache_dir,
+        parquet=args.parquet,
+    )
+
+
+if __name__ == "__main__":
+    main()
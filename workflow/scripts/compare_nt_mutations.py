@@ -3,10 +3,28 @@
 import argparse
 import re
 from pathlib import Path
-from typing import Dict
+from typing import IO, Dict, Optional, Tuple, Union
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
+from workflow.scripts.allele_normalisation import normalise_alleles
+from workflow.scripts.lookup_join import lookup_join
+from workflow.scripts.report_io import write_report
+from workflow.scripts.resistance_catalogue import (
+    ResistanceCatalogue,
+    join_key_columns,
+    load_catalogue,
+)
+from workflow.scripts.stage_profiler import (
+    StageProfiler,
+    add_profiling_arguments,
+    get_profile_path,
+    get_profiler,
+)
+from workflow.scripts.vcf_reader import open_variants_table
+
 dict_col_rename = {
     "genetic_element": "genetic_element",
     "mutation_name": "mutation_name",
@@ -22,8 +40,12 @@ dict_col_rename = {
 }
 
 
+# Columns with few distinct values, stored as categoricals in compact tables
+compact_columns = ["CHROM", "TYPE", "REF", "ALT", "AF"]
+
+
 def find_exact_matches(
-    df_resistance_variants: pd.DataFrame,
+    df_resistance_variants: Union[pd.DataFrame, ResistanceCatalogue],
     df_mutations: pd.DataFrame,
     dict_col_rename: Dict[str, str],
 ) -> pd.DataFrame:
@@ -32,8 +54,8 @@ def find_exact_matches(
 
     Parameters
     ----------
-    df_resistance_variants : pandas dataframe
-        Reference CSV of AMR mutations
+    df_resistance_variants : pandas dataframe or ResistanceCatalogue
+        Reference CSV of AMR mutations, a catalogue reuses its lookup index
     df_mutations : pandas dataframe
         Input dataframe with mutations
 
@@ -42,11 +64,12 @@ def find_exact_matches(
     df_exact_matches : pandas dataframe
         Dataframe with exact matches between df_resistance_variants and df_mutations
     """
-    df_exact_matches = df_mutations.merge(
+    df_exact_matches = lookup_join(
+        df_mutations,
         df_resistance_variants,
         how="inner",
         left_on=["CHROM", "POS", "REF", "ALT"],
-        right_on=["chrom", "position", "ref_nt", "alt_nt"],
+        right_on=join_key_columns["nt"],
     )
     df_exact_matches_relevant_cols = df_exact_matches[dict_col_rename.keys()]
     df_exact_matches_relevant_cols_renamed = df_exact_matches_relevant_cols.rename(
@@ -56,7 +79,10 @@ def find_exact_matches(
 
 
 def find_large_indels(
-    df_mutations: pd.DataFrame, screen_region: tuple[int, int], genetic_element: str
+    df_mutations: pd.DataFrame,
+    screen_region: tuple[int, int],
+    genetic_element: str,
+    min_indel_length: int = 5,
 ) -> pd.DataFrame:
     """
     Find large indels in screen region
@@ -67,51 +93,187 @@ def find_large_indels(
         Input dataframe with mutations
     screen_region : tuple[int, int]
         Screen region
+    genetic_element : str
+        Name of the genetic element the screen region belongs to
+    min_indel_length : int
+        Minimum length of the REF or ALT allele
 
     Returns
     -------
     df_large_indels : pandas dataframe
         Dataframe with large indels in screen region
     """
-    df_large_indels = df_mutations[
-        (df_mutations["TYPE"] == "INDEL")
-        & (df_mutations["POS"] >= screen_region[0])
-        & (df_mutations["POS"] <= screen_region[1])
-        & (
-            (df_mutations["REF"].apply(lambda x: len(x)) >= 5)
-            | (df_mutations["ALT"].apply(lambda x: len(x)) >= 5)
-        )
-    ].copy()
+    ref_length, alt_length = get_allele_lengths(df_mutations)
+    mask = (
+        (df_mutations["TYPE"] == "INDEL").to_numpy()
+        & ((ref_length >= min_indel_length) | (alt_length >= min_indel_length))
+        & (df_mutations["POS"] >= screen_region[0]).to_numpy()
+        & (df_mutations["POS"] <= screen_region[1]).to_numpy()
+    )
+    df_large_indels = df_mutations[mask].copy()
     df_large_indels["genetic_element"] = genetic_element
-    df_large_indels["mutation_name"] = "-"
-
-    for index, row in df_large_indels.iterrows():
-        if len(row["REF"]) > len(row["ALT"]):
-            mutation_name = f"possible_tandem_repeat_length_{len(row['REF']) - 1}"
-        else:
-            mutation_name = f"possible_tandem_repeat_length_{len(row['ALT']) - 1}"
-        df_large_indels.loc[index, "mutation_name"] = mutation_name
+    df_large_indels["mutation_name"] = name_possible_tandem_repeats(
+        ref_length[mask], alt_length[mask]
+    )
     return df_large_indels
 
 
+def get_allele_lengths(
+    df_mutations: pd.DataFrame,
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Length of the REF and ALT allele of every mutation
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Input dataframe with mutations
+
+    Returns
+    -------
+    ref_length : numpy array
+        Length of the REF allele
+    alt_length : numpy array
+        Length of the ALT allele
+    """
+    ref_length = df_mutations["REF"].str.len().to_numpy(dtype=np.int64)
+    alt_length = df_mutations["ALT"].str.len().to_numpy(dtype=np.int64)
+    return ref_length, alt_length
+
+
+def is_large_indel(
+    df_mutations: pd.DataFrame, min_indel_length: int = 5
+) -> npt.NDArray[np.bool_]:
+    """
+    Select INDELs with a REF or ALT allele of at least min_indel_length
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Input dataframe with mutations
+    min_indel_length : int
+        Minimum length of the REF or ALT allele
+
+    Returns
+    -------
+    mask : numpy array
+        True for every large INDEL in df_mutations
+    """
+    ref_length, alt_length = get_allele_lengths(df_mutations)
+    is_indel: npt.NDArray[np.bool_] = (df_mutations["TYPE"] == "INDEL").to_numpy()
+    return is_indel & (
+        (ref_length >= min_indel_length) | (alt_length >= min_indel_length)
+    )
+
+
+def name_possible_tandem_repeats(
+    ref_length: npt.NDArray[np.int64], alt_length: npt.NDArray[np.int64]
+) -> npt.NDArray[np.object_]:
+    """
+    Name large INDELs after the length of their longest allele
+
+    Parameters
+    ----------
+    ref_length : numpy array
+        Length of the REF allele of every INDEL
+    alt_length : numpy array
+        Length of the ALT allele of every INDEL
+
+    Returns
+    -------
+    mutation_names : numpy array
+        possible_tandem_repeat_length_N for every INDEL, with N the length of
+        the longest allele minus the shared first base
+    """
+    repeat_length = np.where(ref_length > alt_length, ref_length, alt_length) - 1
+    # Format every distinct length once instead of once per INDEL
+    unique_lengths, inverse = np.unique(repeat_length, return_inverse=True)
+    unique_names = np.array(
+        [f"possible_tandem_repeat_length_{length}" for length in unique_lengths],
+        dtype=object,
+    )
+    return unique_names[inverse]
+
+
 def screen_for_possible_cnv_in_known_regions(
-    df_resistance_variants: pd.DataFrame,
+    df_resistance_variants: Union[pd.DataFrame, ResistanceCatalogue],
     df_mutations: pd.DataFrame,
     dict_col_rename: Dict[str, str],
+    screen_window: int = 50,
+    min_indel_length: int = 5,
 ) -> pd.DataFrame:
     """
     Screen for possible CNV in known regions
+
+    The large INDELs are sorted by position per chromosome once, after which
+    the INDELs around every tandem repeat region are found with a binary
+    search instead of a scan over all mutations.
+
+    Parameters
+    ----------
+    df_resistance_variants : pandas dataframe or ResistanceCatalogue
+        Reference list of AMR mutations
+    df_mutations : pandas dataframe
+        Input dataframe with mutations
+    dict_col_rename : dict
+        Dictionary with columns to keep as keys and their new names as values
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+
+    Returns
+    -------
+    df_possible_cnvs : pandas dataframe
+        Dataframe with large INDELs in tandem repeat regions
     """
+    if isinstance(df_resistance_variants, ResistanceCatalogue):
+        df_resistance_variants = df_resistance_variants.table
     df_resistance_variants_tandem_repeat = df_resistance_variants[
         df_resistance_variants["comparison_type"] == "tandem_repeat"
     ]
-    list_df_possible_cnvs = []
-    for index, row in df_resistance_variants_tandem_repeat.iterrows():
-        screen_region = (row["position"] - 50, row["position"] + 50)
-        list_df_possible_cnvs.append(
-            find_large_indels(df_mutations, screen_region, row["genetic_element"])
-        )
-    df_possible_cnvs = pd.concat(list_df_possible_cnvs).drop_duplicates()
+
+    df_large_indels = df_mutations[is_large_indel(df_mutations, min_indel_length)]
+    # Per chromosome: positions of the large INDELs in sorted order, and their
+    # row numbers in df_large_indels. The stable sort keeps INDELs at the same
+    # position in input order.
+    dict_chrom_indels = {}
+    for chrom, row_numbers in pd.Series(
+        np.arange(len(df_large_indels)), index=df_large_indels["CHROM"].to_numpy()
+    ).groupby(level=0):
+        row_numbers = row_numbers.to_numpy()
+        positions = df_large_indels["POS"].to_numpy()[row_numbers]
+        order = np.argsort(positions, kind="stable")
+        dict_chrom_indels[chrom] = (positions[order], row_numbers[order])
+
+    list_row_numbers = []
+    list_genetic_elements = []
+    for chrom, position, genetic_element in zip(
+        df_resistance_variants_tandem_repeat["chrom"],
+        df_resistance_variants_tandem_repeat["position"],
+        df_resistance_variants_tandem_repeat["genetic_element"],
+    ):
+        if chrom not in dict_chrom_indels:
+            continue
+        positions, row_numbers = dict_chrom_indels[chrom]
+        start = np.searchsorted(positions, position - screen_window, side="left")
+        end = np.searchsorted(positions, position + screen_window, side="right")
+        # Report hits of a region in input order, as a scan over df_mutations would
+        hits = np.sort(row_numbers[start:end])
+        list_row_numbers.append(hits)
+        list_genetic_elements.extend([genetic_element] * len(hits))
+
+    if list_row_numbers:
+        row_numbers = np.concatenate(list_row_numbers)
+    else:
+        row_numbers = np.array([], dtype=np.intp)
+    df_possible_cnvs = df_large_indels.take(row_numbers)
+    df_possible_cnvs["genetic_element"] = np.array(list_genetic_elements, dtype=object)
+    df_possible_cnvs["mutation_name"] = name_possible_tandem_repeats(
+        *get_allele_lengths(df_possible_cnvs)
+    )
+
+    df_possible_cnvs = df_possible_cnvs.drop_duplicates()
     df_possible_cnvs["comparison_type"] = "tandem_repeat"
     df_possible_cnvs["impact"] = "unknown"
 
@@ -160,9 +322,246 @@ def combine_exact_matches_and_possible_cnvs(
     return df_output
 
 
+def compare_sample(
+    input_file: Path,
+    output: Path,
+    catalogue: ResistanceCatalogue,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    parquet: bool = False,
+    fasta_ref: Optional[Path] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> None:
+    """
+    Compare the mutations of a single sample to the reference list of AMR mutations
+
+    Parameters
+    ----------
+    input_file : Path
+        Path to the annotated VCF, or its export by GATK VariantsToTable
+    output : Path
+        Output file with only known AMR mutations
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+    fasta_ref : Path, optional
+        Reference genome to left-normalise INDELs against, see
+        compare_mutations
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    with profiler.stage("read_input_file") as stage:
+        with open_variants_table(input_file) as f:
+            df_mutations = read_mutations(f, compact=True)
+        stage["rows_out"] = len(df_mutations)
+    compare_mutations(
+        df_mutations,
+        output,
+        catalogue,
+        screen_window=screen_window,
+        min_indel_length=min_indel_length,
+        parquet=parquet,
+        fasta_ref=fasta_ref,
+        profiler=profiler,
+    )
+
+
+def infer_numeric_categories(values: pd.Series) -> pd.Series:
+    """
+    Convert a categorical column of numbers to the numeric type read_csv would
+    infer for it, columns with other values stay categorical
+
+    Parameters
+    ----------
+    values : pandas series
+        Categorical column read from a table
+
+    Returns
+    -------
+    values : pandas series
+        int64 or float64 column if all values are numbers, otherwise values
+    """
+    categories = pd.to_numeric(values.cat.categories, errors="coerce")
+    if categories.isnull().any():
+        return values
+    codes = values.cat.codes.to_numpy()
+    if (codes < 0).any() or categories.dtype.kind == "f":
+        # Missing values make read_csv infer floats
+        numbers = np.append(categories.to_numpy(dtype=np.float64), np.nan)
+    else:
+        numbers = categories.to_numpy()
+    return pd.Series(numbers[codes], index=values.index, name=values.name)
+
+
+def read_mutations(table: Union[IO[str], Path], compact: bool = False) -> pd.DataFrame:
+    """
+    Read a VariantsToTable export into a dataframe
+
+    Parameters
+    ----------
+    table : file object or Path
+        Tab separated export with a header
+    compact : bool
+        Skip BCSQ, which the nucleotide based comparison does not use, store
+        positions as int32 and the columns with few distinct values as
+        categoricals instead of one string per row. Allele frequencies are
+        stored as numbers when they are all numeric, like read_csv does, and
+        as categoricals otherwise.
+
+    Returns
+    -------
+    df_mutations : pandas dataframe
+    """
+    if not compact:
+        # In rare cases, BCSQ can be a column of only NA which will otherwise be read in as a float
+        return pd.read_csv(table, sep="\t", dtype={"BCSQ": object})
+    df_mutations = pd.read_csv(
+        table,
+        sep="\t",
+        usecols=lambda col: col != "BCSQ",
+        dtype={**dict.fromkeys(compact_columns, "category"), "POS": np.int32},
+    )
+    if "AF" in df_mutations.columns:
+        df_mutations["AF"] = infer_numeric_categories(df_mutations["AF"])
+    return df_mutations
+
+
+def compare_mutations(
+    df_mutations: pd.DataFrame,
+    output: Path,
+    catalogue: ResistanceCatalogue,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    parquet: bool = False,
+    fasta_ref: Optional[Path] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> None:
+    """
+    Compare mutations to the reference list of AMR mutations
+
+    Multi-allelic records are first split into one mutation per alternate
+    allele, so each allele can match the reference list on its own. If
+    fasta_ref is given, INDELs are also left-normalised, so an INDEL in a
+    tandem repeat matches the reference list however the variant caller placed
+    it. See allele_normalisation.normalise_alleles.
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Input dataframe with mutations
+    output : Path
+        Output file with only known AMR mutations
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+    parquet : bool
+        Also write the reports as Parquet, next to the TSV files
+    fasta_ref : Path, optional
+        Reference genome the variants were called against
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    df_output = get_report(
+        df_mutations,
+        catalogue,
+        screen_window=screen_window,
+        min_indel_length=min_indel_length,
+        fasta_ref=fasta_ref,
+        profiler=profiler,
+    )
+    with profiler.stage("write_report", len(df_output)) as stage:
+        write_report(df_output, output, parquet)
+        stage["rows_out"] = len(df_output)
+
+
+def get_report(
+    df_mutations: pd.DataFrame,
+    catalogue: ResistanceCatalogue,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    fasta_ref: Optional[Path] = None,
+    sequences: Optional[Dict[str, npt.NDArray[np.bytes_]]] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> pd.DataFrame:
+    """
+    Compare mutations to the reference list of AMR mutations, without writing
+    the report
+
+    Parameters
+    ----------
+    df_mutations : pandas dataframe
+        Input dataframe with mutations
+    catalogue : ResistanceCatalogue
+        Compiled reference list of AMR mutations
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+    fasta_ref : Path, optional
+        Reference genome the variants were called against
+    sequences : dict, optional
+        Reference sequences that were already read, used instead of fasta_ref
+    profiler : StageProfiler, optional
+        Profiler that records the stages of the comparison
+
+    Returns
+    -------
+    df_output : pandas dataframe
+        Exact matches and possible CNVs, see compare_mutations
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    with profiler.stage("normalise_alleles", len(df_mutations)) as stage:
+        df_mutations = normalise_alleles(df_mutations, fasta_ref, sequences)
+        stage["rows_out"] = len(df_mutations)
+
+    with profiler.stage("find_exact_matches", len(df_mutations)) as stage:
+        df_exact_matches = find_exact_matches(catalogue, df_mutations, dict_col_rename)
+        stage["rows_out"] = len(df_exact_matches)
+
+    with profiler.stage(
+        "screen_for_possible_cnv_in_known_regions", len(df_mutations)
+    ) as stage:
+        df_possible_cnvs = screen_for_possible_cnv_in_known_regions(
+            catalogue,
+            df_mutations,
+            dict_col_rename,
+            screen_window=screen_window,
+            min_indel_length=min_indel_length,
+        )
+        stage["rows_out"] = len(df_possible_cnvs)
+
+    with profiler.stage(
+        "combine_exact_matches_and_possible_cnvs",
+        len(df_exact_matches) + len(df_possible_cnvs),
+    ) as stage:
+        df_output = combine_exact_matches_and_possible_cnvs(
+            df_exact_matches, df_possible_cnvs
+        )
+        stage["rows_out"] = len(df_output)
+
+    # Record which catalogue the report was made with
+    return df_output.assign(catalogue_version=catalogue.version)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--input", help="Input file", required=True, type=Path)
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Annotated VCF, or its export by GATK VariantsToTable",
+        required=True,
+        type=Path,
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -177,29 +576,64 @@ def main() -> None:
         required=True,
         type=Path,
     )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases up- and downstream of tandem repeat regions to screen for large INDELs",
+        default=50,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-indel-length",
+        help="Minimum length of the REF or ALT allele of a possible CNV",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "--parquet",
+        help="Also write the report as Parquet, next to the TSV file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--fasta-ref",
+        help="Reference genome to left-normalise INDELs against",
+        default=None,
+        type=Path,
+    )
+    add_profiling_arguments(parser)
     args = parser.parse_args()
 
-    # Read in the reference list of AMR mutations
-    resistance_variants_csv = pd.read_csv(args.resistance_variants_csv)
-
-    # Read in the input file
-    # In rare cases, BCSQ can be a column of only NA which will otherwise be read in as a float
-    df_mutations = pd.read_csv(args.input, sep="\t", dtype={"BCSQ": object})
-
-    df_exact_matches = find_exact_matches(
-        resistance_variants_csv, df_mutations, dict_col_rename
-    )
+    profiler = get_profiler(args, args.output)
 
-    df_possible_cnvs = screen_for_possible_cnv_in_known_regions(
-        resistance_variants_csv, df_mutations, dict_col_rename
+    # Read in the reference list of AMR mutations
+    with profiler.stage("load_catalogue") as stage:
+        catalogue = load_catalogue(
+            args.resistance_variants_csv, args.catalogue_cache_dir
+        )
+        stage["rows_out"] = len(catalogue.table)
+
+    compare_sample(
+        args.input,
+        args.output,
+        catalogue,
+        screen_window=args.screen_window,
+        min_indel_length=args.min_indel_length,
+        parquet=args.parquet,
+        fasta_ref=args.fasta_ref,
+        profiler=profiler,
     )
-
-    df_output = combine_exact_matches_and_possible_cnvs(
-        df_exact_matches, df_possible_cnvs
+    profiler.write(
+        get_profile_path(args.output),
+        script="compare_nt_mutations",
+        input=str(args.input),
+        output=str(args.output),
     )
 
-    df_output.to_csv(args.output, sep="\t", index=False)
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+from typing import List, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from workflow.scripts.resistance_catalogue import ResistanceCatalogue
+
+
+def build_key_index(df: pd.DataFrame, columns: List[str]) -> pd.MultiIndex:
+    """
+    Build an index from the key columns of df to its row positions
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        Dataframe to index
+    columns : list of str
+        Key columns
+
+    Returns
+    -------
+    key_index : pandas MultiIndex
+        Index with one entry per row of df, in the same order
+    """
+    return pd.MultiIndex.from_arrays([df[col] for col in columns])
+
+
+def lookup_positions(
+    left: pd.DataFrame, left_on: List[str], key_index: pd.MultiIndex
+) -> npt.NDArray[np.intp]:
+    """
+    Look up the key of every row of left in key_index
+
+    Rows are first narrowed down one key column at a time, starting with the
+    column with the most distinct values in key_index, so only rows that can
+    match are looked up as a whole.
+
+    Parameters
+    ----------
+    left : pandas dataframe
+        Dataframe with observed mutations
+    left_on : list of str
+        Key columns in left, in the same order as the levels of key_index
+    key_index : pandas MultiIndex
+        Unique index on the key columns of the reference
+
+    Returns
+    -------
+    positions : numpy array
+        Position in key_index for every row of left, -1 for rows without match
+    """
+    positions = np.full(len(left), -1, dtype=np.intp)
+    candidates = np.arange(len(left))
+    level_order = sorted(
+        range(len(left_on)), key=lambda level: -len(key_index.levels[level])
+    )
+    for level in level_order:
+        values = left[left_on[level]].to_numpy()[candidates]
+        candidates = candidates[
+            pd.Series(values).isin(key_index.levels[level]).to_numpy()
+        ]
+        if len(candidates) == 0:
+            return positions
+    positions[candidates] = key_index.get_indexer(
+        pd.MultiIndex.from_arrays([left[col].to_numpy()[candidates] for col in left_on])
+    )
+    return positions
+
+
+def lookup_join(
+    left: pd.DataFrame,
+    right: Union[pd.DataFrame, ResistanceCatalogue],
+    left_on: List[str],
+    right_on: List[str],
+    how: str = "left",
+) -> pd.DataFrame:
+    """
+    Join left to right by looking up the keys of left in an index of right
+
+    Gives the same result as left.merge(right, how=how, left_on=left_on,
+    right_on=right_on) for how="left" and how="inner". When right is a
+    ResistanceCatalogue the index on right is only built once per catalogue,
+    instead of once per call as DataFrame.merge does. Falls back to
+    DataFrame.merge when left is empty, when the keys of right are not unique
+    or contain missing values, or when the non-key column names of left and
+    right overlap.
+
+    Parameters
+    ----------
+    left : pandas dataframe
+        Dataframe with observed mutations
+    right : pandas dataframe or ResistanceCatalogue
+        Reference list of AMR mutations
+    left_on : list of str
+        Key columns in left
+    right_on : list of str
+        Key columns in right, in the same order as left_on
+    how : str
+        "left" or "inner"
+
+    Returns
+    -------
+    df_joined : pandas dataframe
+        Joined dataframe with a fresh RangeIndex
+    """
+    if how not in ("left", "inner"):
+        raise ValueError(f"Unsupported join type: {how}")
+
+    if isinstance(right, ResistanceCatalogue):
+        right_table = right.table
+        key_index: Optional[pd.MultiIndex] = right.key_index(right_on)
+    else:
+        right_table = right
+        key_index = None
+
+    # Columns with the same name in left_on and right_on are only kept once
+    shared_keys = [
+        right_col
+        for left_col, right_col in zip(left_on, right_on)
+        if left_col == right_col
+    ]
+    right_columns = [col for col in right_table.columns if col not in shared_keys]
+    overlapping_columns = set(left.columns) & set(right_columns)
+
+    if key_index is None:
+        key_index = build_key_index(right_table, right_on)
+    if (
+        left.empty
+        or overlapping_columns
+        or not key_index.is_unique
+        or right_table[right_on].isnull().values.any()
+    ):
+        return left.merge(right_table, how=how, left_on=left_on, right_on=right_on)
+
+    indexer = lookup_positions(left, left_on, key_index)
+
+    if how == "inner":
+        found = indexer >= 0
+        if not found.any():
+            # Let DataFrame.merge decide the index and dtypes of an empty result
+            return left.merge(right_table, how=how, left_on=left_on, right_on=right_on)
+        # DataFrame.merge groups the rows of an inner join by key, in order of
+        # first appearance of the key in left. A stable sort on the factorized
+        # keys reproduces that order.
+        order = np.argsort(pd.factorize(indexer[found])[0], kind="stable")
+        df_left = left[found].take(order)
+        df_right = right_table[right_columns].take(indexer[found][order])
+    else:
+        df_left = left
+        # -1 is not in the RangeIndex of right_table, so unmatched rows become NaN
+        df_right = right_table[right_columns].reset_index(drop=True).reindex(indexer)
+
+    df_joined = pd.concat(
+        [
+            df_left.reset_index(drop=True),
+            df_right.reset_index(drop=True),
+        ],
+        axis=1,
+    )
+    return df_joined
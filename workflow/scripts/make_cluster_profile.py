@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+# Submit commands by scheduler. Every job requests the threads, memory and run
+# time of its rule, which the rules take from pipeline_parameters.yaml. Group
+# jobs request what their jobs need to run in the order Snakemake runs them:
+# the summed run time of jobs that run one after the other, and the summed
+# threads and memory of jobs that run at the same time.
+submit_commands = {
+    "slurm": (
+        "sbatch --parsable --job-name=apollo.{{name}}.{{jobid}} "
+        "--cpus-per-task={{threads}} --mem={{resources.mem_gb}}G "
+        "--time={{resources.runtime}}{queue}"
+    ),
+    "lsf": (
+        "bsub -J apollo.{{name}}.{{jobid}} -n {{threads}} "
+        '-R "span[hosts=1] rusage[mem={{resources.mem_gb}}G]" '
+        "-M {{resources.mem_gb}}G -W {{resources.runtime}}{queue}"
+    ),
+}
+queue_options = {"slurm": " --partition={}", "lsf": " -q {}"}
+
+# Group of the short steps of a sample, see get_sample_group in the Snakefile
+sample_group = "sample"
+
+
+def make_profile(
+    parameters: Dict[str, Any],
+    scheduler: str = "slurm",
+    queue: Optional[str] = None,
+    jobs: int = 100,
+    samples_per_job: int = 1,
+) -> Dict[str, Any]:
+    """
+    Make a Snakemake profile that submits jobs to a cluster
+
+    Parameters
+    ----------
+    parameters : dict
+        Contents of config/pipeline_parameters.yaml
+    scheduler : str
+        "slurm" or "lsf"
+    queue : str, optional
+        Partition (SLURM) or queue (LSF) to submit to, the default of the
+        cluster if None
+    jobs : int
+        Maximum number of jobs submitted at the same time
+    samples_per_job : int
+        Number of samples whose short steps are submitted as one job, if
+        group_sample_jobs is enabled
+
+    Returns
+    -------
+    profile : dict
+        Contents of the config.yaml of the profile
+    """
+    if scheduler not in submit_commands:
+        raise ValueError(
+            f"Unknown scheduler {scheduler}, use one of {', '.join(submit_commands)}"
+        )
+    if samples_per_job < 1:
+        raise ValueError("samples_per_job should be at least 1")
+    for section in ["threads", "mem_gb", "runtime_min"]:
+        if "other" not in parameters.get(section, {}):
+            raise ValueError(f"Pipeline parameters have no {section}: other")
+
+    queue_option = "" if queue is None else queue_options[scheduler].format(queue)
+    profile: Dict[str, Any] = {
+        "cluster": submit_commands[scheduler].format(queue=queue_option),
+        "jobs": jobs,
+        # Rules without resources of their own get those of "other"
+        "default-resources": [
+            f"mem_gb={parameters['mem_gb']['other']}",
+            f"runtime={parameters['runtime_min']['other']}",
+        ],
+        "latency-wait": 60,
+    }
+    if parameters.get("group_sample_jobs") and samples_per_job > 1:
+        profile["group-components"] = [f"{sample_group}={samples_per_job}"]
+    return profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Write a Snakemake profile that submits the jobs of the pipeline to a SLURM or LSF cluster"
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory of the profile, passed to snakemake --profile",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--parameters",
+        help="Pipeline parameters to take the resources from",
+        default=Path(__file__).parents[2].joinpath("config/pipeline_parameters.yaml"),
+        type=Path,
+    )
+    parser.add_argument(
+        "--scheduler",
+        help="Cluster scheduler",
+        default="slurm",
+        choices=list(submit_commands),
+    )
+    parser.add_argument(
+        "--queue",
+        help="Partition (SLURM) or queue (LSF) to submit to",
+        default=None,
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Maximum number of jobs submitted at the same time",
+        default=100,
+        type=int,
+    )
+    parser.add_argument(
+        "--samples-per-job",
+        help="Number of samples whose short steps are submitted as one job",
+        default=1,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    with open(args.parameters) as f:
+        parameters = yaml.safe_load(f)
+    profile = make_profile(
+        parameters, args.scheduler, args.queue, args.jobs, args.samples_per_job
+    )
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    with open(args.output_dir.joinpath("config.yaml"), "w") as f:
+        yaml.safe_dump(profile, f, sort_keys=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Collection, Dict, List, Tuple
+from urllib.parse import unquote
+
+from workflow.scripts.resistance_catalogue import read_resistance_variants_csv
+
+# GFF attributes that can hold the locus tag of a feature
+locus_tag_attributes = ["locus_tag", "Name", "gene", "ID"]
+
+
+def parse_gff_attributes(attributes: str) -> Dict[str, str]:
+    """
+    Split the attributes column of a GFF3 line into a dictionary
+    """
+    dict_attributes = {}
+    for entry in attributes.strip().split(";"):
+        key, separator, value = entry.partition("=")
+        if separator:
+            dict_attributes[key.strip()] = unquote(value.strip())
+    return dict_attributes
+
+
+def find_locus_tag_regions(
+    gff_path: Path, locus_tags: Collection[str]
+) -> Dict[str, Tuple[str, int, int]]:
+    """
+    Find the region spanned by all GFF features of each locus tag
+
+    A feature belongs to a locus tag if its locus_tag, Name, gene or ID
+    attribute is the locus tag, ignoring a gene- or gene: prefix of the ID.
+
+    Parameters
+    ----------
+    gff_path : Path
+        Reference GFF3
+    locus_tags : collection of str
+        Locus tags to look up
+
+    Returns
+    -------
+    dict_regions : dict
+        Locus tag as key and (chrom, start, end) as value, with 1-based
+        inclusive coordinates
+    """
+    locus_tags = set(locus_tags)
+    dict_regions: Dict[str, Tuple[str, int, int]] = {}
+    with open(gff_path, "r") as f:
+        for line in f:
+            if line.startswith("##FASTA"):
+                break
+            if line.startswith("#") or not line.strip():
+                continue
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) < 9:
+                continue
+            dict_attributes = parse_gff_attributes(columns[8])
+            matched_tags = set()
+            for attribute in locus_tag_attributes:
+                value = dict_attributes.get(attribute, "")
+                if attribute == "ID":
+                    for prefix in ("gene:", "gene-"):
+                        if value.startswith(prefix):
+                            value = value[len(prefix) :]
+                if value in locus_tags:
+                    matched_tags.add(value)
+            for locus_tag in matched_tags:
+                chrom, start, end = columns[0], int(columns[3]), int(columns[4])
+                if locus_tag in dict_regions:
+                    known_chrom, known_start, known_end = dict_regions[locus_tag]
+                    if known_chrom != chrom:
+                        raise ValueError(
+                            f"Locus tag {locus_tag} is on more than one chromosome in {gff_path}"
+                        )
+                    start, end = min(start, known_start), max(end, known_end)
+                dict_regions[locus_tag] = (chrom, start, end)
+    return dict_regions
+
+
+def merge_regions(regions: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    """
+    Sort regions and merge the ones that overlap or touch
+
+    Parameters
+    ----------
+    regions : list of tuples
+        (chrom, start, end) with 0-based, half-open coordinates
+
+    Returns
+    -------
+    merged_regions : list of tuples
+        Sorted, non-overlapping (chrom, start, end)
+    """
+    merged_regions: List[Tuple[str, int, int]] = []
+    for chrom, start, end in sorted(regions):
+        if merged_regions and merged_regions[-1][0] == chrom:
+            last_chrom, last_start, last_end = merged_regions[-1]
+            if start <= last_end:
+                merged_regions[-1] = (chrom, last_start, max(end, last_end))
+                continue
+        merged_regions.append((chrom, start, end))
+    return merged_regions
+
+
+def make_target_regions(
+    gff_path: Path,
+    list_resistance_variants_csv: List[Path],
+    padding: int = 1000,
+    screen_window: int = 50,
+) -> List[Tuple[str, int, int]]:
+    """
+    Make the regions to annotate from the genes and positions in reference lists
+
+    Parameters
+    ----------
+    gff_path : Path
+        Reference GFF3, used to find the coordinates of the locus tags in amino
+        acid based lists
+    list_resistance_variants_csv : list of Path
+        Amino acid and/or nucleotide based reference CSVs of AMR mutations
+    padding : int
+        Number of bases added on both sides of every region
+    screen_window : int
+        Number of bases screened for large INDELs around nucleotide based
+        mutations, added on top of padding
+
+    Returns
+    -------
+    regions : list of tuples
+        Sorted, merged (chrom, start, end) with 0-based, half-open coordinates
+    """
+    locus_tags = set()
+    regions = []
+    for csv_path in list_resistance_variants_csv:
+        kind, df_catalogue = read_resistance_variants_csv(csv_path)
+        if kind == "aa":
+            locus_tags.update(df_catalogue["locus_tag"])
+        else:
+            for chrom, position, ref_nt in zip(
+                df_catalogue["chrom"], df_catalogue["position"], df_catalogue["ref_nt"]
+            ):
+                regions.append(
+                    (
+                        chrom,
+                        position - 1 - screen_window - padding,
+                        position - 1 + len(ref_nt) + screen_window + padding,
+                    )
+                )
+
+    if locus_tags:
+        dict_regions = find_locus_tag_regions(gff_path, locus_tags)
+        missing_locus_tags = sorted(locus_tags - set(dict_regions))
+        if missing_locus_tags:
+            # bcftools csq cannot annotate these either, so the results do not change
+            print(
+                f"Locus tags not found in {gff_path}: {', '.join(missing_locus_tags)}",
+                file=sys.stderr,
+            )
+        for chrom, start, end in dict_regions.values():
+            regions.append((chrom, start - 1 - padding, end + padding))
+
+    return merge_regions([(chrom, max(start, 0), end) for chrom, start, end in regions])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Make a BED file with the regions around the genes and positions in reference lists of AMR mutations"
+    )
+    parser.add_argument("-g", "--gff", help="Reference GFF3", required=True, type=Path)
+    parser.add_argument(
+        "-r",
+        "--resistance_variants_csv",
+        help="Reference CSV(s) of AMR mutations",
+        required=True,
+        nargs="+",
+        type=Path,
+    )
+    parser.add_argument(
+        "-o", "--output", help="Output BED file", required=True, type=Path
+    )
+    parser.add_argument(
+        "--padding",
+        help="Number of bases added on both sides of every region",
+        default=1000,
+        type=int,
+    )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases screened for large INDELs around nucleotide based mutations",
+        default=50,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    regions = make_target_regions(
+        args.gff, args.resistance_variants_csv, args.padding, args.screen_window
+    )
+    with open(args.output, "w") as f:
+        for chrom, start, end in regions:
+            f.write(f"{chrom}\t{start}\t{end}\n")
+
+
+if __name__ == "__main__":
+    main()
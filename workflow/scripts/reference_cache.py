@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Collection, Iterator, List, Optional, Tuple
+
+# Layout of the cache directory
+references_dir = "references"
+catalogues_dir = "catalogues"
+lock_file = ".lock"
+
+
+@contextlib.contextmanager
+def cache_lock(cache_dir: Path, shared: bool = False) -> Iterator[None]:
+    """
+    Hold a lock on the cache directory
+
+    Uses POSIX record locks, which are also honoured by other hosts on NFS
+    mounts with a lock daemon. Readers take a shared lock, so an entry is
+    never evicted while it is being restored.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+    shared : bool
+        Take a shared instead of an exclusive lock
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_dir.joinpath(lock_file), "a+") as f:
+        fcntl.lockf(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def get_entry_path(cache_dir: Path, reference_key: str) -> Path:
+    """
+    Location of the cached files of a reference
+    """
+    return cache_dir.joinpath(references_dir, reference_key)
+
+
+def get_catalogue_cache_dir(cache_dir: Path) -> Path:
+    """
+    Location of the compiled catalogues, see resistance_catalogue.load_catalogue
+    """
+    return cache_dir.joinpath(catalogues_dir)
+
+
+def is_cached(cache_dir: Path, reference_key: str, filenames: Collection[str]) -> bool:
+    """
+    Check if all files of a reference are in the cache
+
+    Entries are moved into place after all their files are written, so an
+    entry that exists is complete.
+    """
+    entry_path = get_entry_path(cache_dir, reference_key)
+    return all(entry_path.joinpath(filename).is_file() for filename in filenames)
+
+
+def get_size(path: Path) -> int:
+    """
+    Size in bytes of a file, or of all files in a directory
+    """
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return path.stat().st_size
+
+
+def list_entries(cache_dir: Path) -> List[Tuple[float, int, Path]]:
+    """
+    List the cached references and compiled catalogues
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+
+    Returns
+    -------
+    list_entries : list of tuples
+        (last use, size in bytes, path) of every entry, least recently used
+        first. The last use is the modification time of the entry.
+    """
+    paths: List[Path] = []
+    if cache_dir.joinpath(references_dir).is_dir():
+        paths.extend(
+            path
+            for path in cache_dir.joinpath(references_dir).iterdir()
+            if not path.name.startswith(".")
+        )
+    if cache_dir.joinpath(catalogues_dir).is_dir():
+        paths.extend(cache_dir.joinpath(catalogues_dir).glob("*.idx"))
+    return sorted((path.stat().st_mtime, get_size(path), path) for path in paths)
+
+
+def evict_entries(
+    cache_dir: Path, max_size: int, keep: Collection[Path] = ()
+) -> List[Path]:
+    """
+    Remove the least recently used entries until the cache fits in max_size
+
+    Must be called while holding the exclusive lock.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+    max_size : int
+        Maximum total size of the entries in bytes
+    keep : collection of Path
+        Entries that are never removed, for example the one just stored
+
+    Returns
+    -------
+    evicted : list of Path
+        Removed entries
+    """
+    # Only a store holding the lock writes temporary entries, so any left are
+    # from an interrupted run
+    if cache_dir.joinpath(references_dir).is_dir():
+        for path in cache_dir.joinpath(references_dir).glob(".*"):
+            shutil.rmtree(path, ignore_errors=True)
+
+    entries = list_entries(cache_dir)
+    total_size = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, path in entries:
+        if total_size <= max_size:
+            break
+        if path in keep:
+            continue
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+        total_size -= size
+        evicted.append(path)
+    return evicted
+
+
+def store_reference(
+    cache_dir: Path, reference_key: str, files: Collection[Path], max_size: int
+) -> Path:
+    """
+    Add the prepared files of a reference to the cache
+
+    The files are copied to a temporary directory in the cache, which is
+    renamed to the entry when complete. If the entry already exists, only its
+    last use is updated. Least recently used entries are evicted afterwards.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+    reference_key : str
+        Content-based key of the reference, see reference_key.get_reference_key
+    files : collection of Path
+        Prepared reference and index files, stored under their own name
+    max_size : int
+        Maximum total size of the cache in bytes
+
+    Returns
+    -------
+    entry_path : Path
+        Directory with the cached files
+    """
+    entry_path = get_entry_path(cache_dir, reference_key)
+    with cache_lock(cache_dir):
+        if not entry_path.is_dir():
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = Path(
+                tempfile.mkdtemp(dir=entry_path.parent, prefix=f".{reference_key}.")
+            )
+            try:
+                for path in files:
+                    shutil.copyfile(path, tmp_path.joinpath(path.name))
+                os.rename(tmp_path, entry_path)
+            except BaseException:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+        os.utime(entry_path)
+        for path in evict_entries(cache_dir, max_size, keep=[entry_path]):
+            print(f"Evicted {path} from the cache", file=sys.stderr)
+    return entry_path
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    """
+    Hard link source to destination, or copy it if linking is not possible
+    """
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def restore_reference(
+    cache_dir: Path, reference_key: str, filenames: Collection[str], output_dir: Path
+) -> None:
+    """
+    Make the cached files of a reference available in output_dir
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+    reference_key : str
+        Content-based key of the reference
+    filenames : collection of str
+        Names of the files to restore
+    output_dir : Path
+        Directory to restore the files to
+    """
+    entry_path = get_entry_path(cache_dir, reference_key)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with cache_lock(cache_dir, shared=True):
+        if not is_cached(cache_dir, reference_key, filenames):
+            raise ValueError(
+                f"Reference {reference_key} is not (completely) in cache {cache_dir}"
+            )
+        for filename in filenames:
+            link_or_copy(entry_path.joinpath(filename), output_dir.joinpath(filename))
+        os.utime(entry_path)
+
+
+def prepare_reference(reference: Path, reference_gff: Path, output_dir: Path) -> None:
+    """
+    Prepare the files of a reference from the original reference and GFF, as
+    copy_ref, copy_ref_gff and samtools_index_ref do in the pipeline
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(reference, output_dir.joinpath("ref.fasta"))
+    shutil.copyfile(reference_gff, output_dir.joinpath("ref.gff"))
+    subprocess.run(["samtools", "faidx", output_dir.joinpath("ref.fasta")], check=True)
+
+
+def restore_or_prepare_reference(
+    cache_dir: Path,
+    reference_key: str,
+    filenames: Collection[str],
+    output_dir: Path,
+    reference: Optional[Path] = None,
+    reference_gff: Optional[Path] = None,
+) -> bool:
+    """
+    Restore the cached files of a reference, or prepare them from the original
+    reference and GFF if the entry is no longer in the cache
+
+    Entries can be evicted after a run decided to restore them, by another run
+    sharing the cache or by a reference the same run stored, so the run can
+    not rely on the entry still being there.
+
+    Parameters
+    ----------
+    cache_dir : Path
+        Cache directory
+    reference_key : str
+        Content-based key of the reference
+    filenames : collection of str
+        Names of the files to restore
+    output_dir : Path
+        Directory to restore the files to
+    reference : Path, optional
+        Original reference genome to prepare the files from
+    reference_gff : Path, optional
+        Original reference GFF to prepare the files from
+
+    Returns
+    -------
+    restored : bool
+        True if the files were restored from the cache, False if they were
+        prepared from the original files
+    """
+    try:
+        restore_reference(cache_dir, reference_key, filenames, output_dir)
+    except ValueError:
+        if reference is None or reference_gff is None:
+            raise
+        print(
+            f"Reference {reference_key} is no longer in cache {cache_dir}, "
+            f"preparing it from {reference} and {reference_gff}",
+            file=sys.stderr,
+        )
+        prepare_reference(reference, reference_gff, output_dir)
+        return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Store or restore prepared references in a cache shared by pipeline runs"
+    )
+    parser.add_argument(
+        "action",
+        help="Add files to the cache (store), copy them from the cache (restore) or only evict least recently used entries (evict)",
+        choices=["store", "restore", "evict"],
+    )
+    parser.add_argument(
+        "-c", "--cache-dir", help="Cache directory", required=True, type=Path
+    )
+    parser.add_argument(
+        "-k", "--reference-key", help="Content-based key of the reference", type=str
+    )
+    parser.add_argument(
+        "-f",
+        "--files",
+        help="Files to store, or names of the files to restore",
+        nargs="*",
+        default=[],
+    )
+    parser.add_argument(
+        "-o", "--output-dir", help="Directory to restore files to", type=Path
+    )
+    parser.add_argument(
+        "--fallback-reference",
+        help="Original reference genome to prepare the files from if the reference is no longer in the cache",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--fallback-gff",
+        help="Original reference GFF to prepare the files from if the reference is no longer in the cache",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--max-size-gb",
+        help="Maximum size of the cache in GB",
+        default=50,
+        type=float,
+    )
+    args = parser.parse_args()
+
+    max_size = int(args.max_size_gb * 1e9)
+    if args.action == "evict":
+        with cache_lock(args.cache_dir):
+            for path in evict_entries(args.cache_dir, max_size):
+                print(f"Evicted {path} from the cache", file=sys.stderr)
+        return
+    if args.reference_key is None or not args.files:
+        parser.error(f"{args.action} requires --reference-key and --files")
+    if args.action == "store":
+        store_reference(
+            args.cache_dir,
+            args.reference_key,
+            [Path(path) for path in args.files],
+            max_size,
+        )
+    else:
+        if args.output_dir is None:
+            parser.error("restore requires --output-dir")
+        restore_or_prepare_reference(
+            args.cache_dir,
+            args.reference_key,
+            args.files,
+            args.output_dir,
+            args.fallback_reference,
+            args.fallback_gff,
+        )
+
+
+if __name__ == "__main__":
+    main()
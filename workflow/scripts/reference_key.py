@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+from pathlib import Path
+from typing import Dict, Tuple
+
+from workflow.scripts.resistance_catalogue import hash_file
+
+# Number of hexadecimal characters of the SHA-256 used as key
+key_length = 16
+
+
+def get_reference_key(reference: Path, reference_gff: Path) -> str:
+    """
+    Content-based key of a reference genome and its annotation
+
+    Samples with the same key can share the prepared reference and its
+    indexes, even if the reference files are at different paths.
+
+    Parameters
+    ----------
+    reference : Path
+        Reference genome (FASTA)
+    reference_gff : Path
+        Reference annotation (GFF3)
+
+    Returns
+    -------
+    reference_key : str
+        Hexadecimal key of key_length characters
+    """
+    sha256 = hashlib.sha256()
+    for path in (reference, reference_gff):
+        sha256.update(hash_file(path).encode())
+    return sha256.hexdigest()[:key_length]
+
+
+def get_reference_keys(samples: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+    """
+    Content-based key of the reference of every sample that has one
+
+    Every distinct pair of reference paths is only hashed once.
+
+    Parameters
+    ----------
+    samples : dict
+        Sample sheet, with sample names as keys and dictionaries with at
+        least reference and reference_gff as values for samples to type
+
+    Returns
+    -------
+    dict_reference_keys : dict
+        Sample name as key and reference key as value
+    """
+    dict_path_keys: Dict[Tuple[str, str], str] = {}
+    dict_reference_keys = {}
+    for sample, sample_info in samples.items():
+        if "reference" not in sample_info or "reference_gff" not in sample_info:
+            continue
+        paths = (str(sample_info["reference"]), str(sample_info["reference_gff"]))
+        if paths not in dict_path_keys:
+            dict_path_keys[paths] = get_reference_key(Path(paths[0]), Path(paths[1]))
+        dict_reference_keys[sample] = dict_path_keys[paths]
+    return dict_reference_keys
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Print the content-based key of a reference genome and its annotation"
+    )
+    parser.add_argument(
+        "-r", "--reference", help="Reference genome", required=True, type=Path
+    )
+    parser.add_argument(
+        "-g", "--reference_gff", help="Reference annotation", required=True, type=Path
+    )
+    args = parser.parse_args()
+
+    print(get_reference_key(args.reference, args.reference_gff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import argparse
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Optional, Union
+
+# pandas is imported where it is used, so reading the paths of reports does
+# not pay for its import
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Arrow types of the report columns, by name. Columns that are not listed
+# are stored as strings.
+categorical_columns = [
+    "genetic_element",
+    "impact",
+    "drug",
+    "chromosome",
+    "type_of_variant",
+    "type_of_consequence",
+    "locus_tag",
+    "comparison_type",
+    "catalogue_version",
+]
+int32_columns = ["position", "depth"]
+float_list_columns = ["allele_frequency"]
+
+parquet_suffix = ".parquet"
+
+
+def is_parquet(path: Union[str, Path]) -> bool:
+    """
+    Check if a report path is a Parquet instead of a tab separated file
+    """
+    return str(path).endswith(parquet_suffix)
+
+
+def get_parquet_path(path: Union[str, Path]) -> Path:
+    """
+    Path of the Parquet version of a tab separated report
+
+    The .tsv suffix is replaced, so sample.aa.full.tsv becomes
+    sample.aa.full.parquet.
+    """
+    return Path(path).with_suffix(parquet_suffix)
+
+
+def import_pyarrow() -> Any:
+    """
+    Import pyarrow, which is only needed for Parquet reports
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Reading or writing Parquet reports requires pyarrow, install it or use TSV reports"
+        ) from e
+    return pyarrow
+
+
+def parse_float_list(value: object) -> Optional[List[float]]:
+    """
+    Parse a comma separated list of floats, such as the AF of a multi-allelic
+    variant. Missing and unparsable values become None.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Lists read from Parquet reports are numpy arrays
+    if isinstance(value, (list, np.ndarray)):
+        return [float(item) for item in value]
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    try:
+        return [float(item) for item in str(value).split(",")]
+    except ValueError:
+        return None
+
+
+def to_arrow_table(df: "pd.DataFrame") -> Any:
+    """
+    Convert a report to an Arrow table with an explicit schema
+
+    Positions and depths are stored as int32, allele frequencies as lists of
+    floats (one per alternate allele) and columns with few distinct values,
+    such as genes and drugs, as dictionary encoded strings. Values that do not
+    fit the type of their column, such as the "-" placeholder of combined
+    reports in numeric columns, are stored as nulls.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        Report with the columns written by the comparison scripts
+
+    Returns
+    -------
+    table : pyarrow Table
+    """
+    import pandas as pd
+
+    pa = import_pyarrow()
+    arrays = []
+    fields = []
+    for col in df.columns:
+        values = df[col]
+        if col in int32_columns:
+            numbers = pd.to_numeric(values, errors="coerce")
+            arrow_type = pa.int32()
+            array = pa.array(numbers.astype("Int32"), type=arrow_type)
+        elif col in float_list_columns:
+            arrow_type = pa.list_(pa.float64())
+            array = pa.array([parse_float_list(value) for value in values], arrow_type)
+        else:
+            strings = values.astype(object).where(values.notnull(), None)
+            strings = strings.map(lambda value: value if value is None else str(value))
+            if col in categorical_columns:
+                arrow_type = pa.dictionary(pa.int32(), pa.string())
+                array = pa.array(strings, type=pa.string()).dictionary_encode()
+            else:
+                arrow_type = pa.string()
+                array = pa.array(strings, type=arrow_type)
+        arrays.append(array)
+        fields.append(pa.field(col, arrow_type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def write_report(df: "pd.DataFrame", output: Path, parquet: bool = False) -> None:
+    """
+    Write a report, as Parquet if output ends with .parquet, otherwise as TSV
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        Report to write
+    output : Path
+        Output file
+    parquet : bool
+        Also write a Parquet version of a TSV report, see get_parquet_path
+    """
+    if is_parquet(output):
+        import_pyarrow().parquet.write_table(to_arrow_table(df), output)
+        return
+    df.to_csv(output, sep="\t", index=False)
+    if parquet:
+        write_report(df, get_parquet_path(output))
+
+
+def read_report(path: Path) -> "pd.DataFrame":
+    """
+    Read a report written by write_report
+
+    Dictionary encoded columns of Parquet reports are returned as categoricals
+    and allele frequencies as numpy arrays of floats.
+
+    Parameters
+    ----------
+    path : Path
+        Parquet or tab separated report
+
+    Returns
+    -------
+    df_report : pandas dataframe
+    """
+    import pandas as pd
+
+    if is_parquet(path):
+        return import_pyarrow().parquet.read_table(path).to_pandas()
+    return pd.read_csv(path, sep="\t")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert a tab separated resistance report to Parquet"
+    )
+    parser.add_argument("-i", "--input", help="TSV report", required=True, type=Path)
+    parser.add_argument(
+        "-o", "--output", help="Parquet report", required=True, type=Path
+    )
+    args = parser.parse_args()
+
+    write_report(read_report(args.input), args.output)
+
+
+if __name__ == "__main__":
+    main()
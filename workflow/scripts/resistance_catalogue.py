@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Bump when the layout of ResistanceCatalogue changes, so old cache files are rebuilt
+CATALOGUE_FORMAT_VERSION = 2
+
+# Number of hexadecimal characters of the content hash used as catalogue version
+version_length = 16
+
+aa_key_columns = ["locus_tag", "ref_aa", "alt_aa"]
+nt_key_columns = ["chrom", "position", "ref_nt", "alt_nt"]
+
+# Errors unpickling a cache written by another environment or cut off while it
+# was written, the catalogue is compiled again after them
+cache_read_errors = (
+    pickle.UnpicklingError,
+    EOFError,
+    AttributeError,
+    ImportError,
+    OSError,
+)
+
+# Columns the comparisons join the observed mutations on, their key indexes are
+# built when compiling so cached catalogues include them
+join_key_columns = {
+    "aa": ["locus_tag", "genetic_element", "ref_aa", "alt_aa"],
+    "nt": nt_key_columns,
+}
+
+required_columns = {
+    "aa": ["genetic_element", "locus_tag", "ref_aa", "alt_aa", "impact"],
+    "nt": [
+        "genetic_element",
+        "mutation_name",
+        "chrom",
+        "position",
+        "ref_nt",
+        "alt_nt",
+        "comparison_type",
+        "impact",
+    ],
+}
+
+
+@dataclass
+class ResistanceCatalogue:
+    """
+    Validated reference list of AMR mutations
+
+    Attributes
+    ----------
+    kind : str
+        "aa" for amino acid or "nt" for nucleotide based catalogues
+    table : pandas dataframe
+        Normalised contents of the reference CSV
+    content_hash : str
+        SHA-256 of the reference CSV the catalogue was compiled from
+    key_indexes : dict
+        Vectorised indexes on table, built by key_index, the one on
+        join_key_columns already when compiling
+    """
+
+    kind: str
+    table: pd.DataFrame
+    content_hash: str
+    key_indexes: Dict[Tuple[str, ...], pd.MultiIndex] = field(
+        default_factory=dict, repr=False
+    )
+    format_version: int = CATALOGUE_FORMAT_VERSION
+    pandas_version: str = pd.__version__
+
+    @property
+    def version(self) -> str:
+        """
+        Version of the catalogue recorded in the reports, derived from the
+        contents of its reference CSV
+        """
+        return self.content_hash[:version_length]
+
+    def key_index(self, columns: List[str]) -> pd.MultiIndex:
+        """
+        Return an index from the given columns of table to its row positions
+
+        The index is built on first use and reused for every later lookup.
+        """
+        key = tuple(columns)
+        if key not in self.key_indexes:
+            self.key_indexes[key] = pd.MultiIndex.from_arrays(
+                [self.table[col] for col in columns]
+            )
+        return self.key_indexes[key]
+
+
+def hash_file(path: Path) -> str:
+    """
+    Calculate SHA-256 of a file
+
+    Parameters
+    ----------
+    path : Path
+        File to hash
+
+    Returns
+    -------
+    content_hash : str
+        Hexadecimal SHA-256 of the file contents
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_catalogue_version(csv_paths: Sequence[Path]) -> str:
+    """
+    Version of the catalogues compiled from one or more reference CSVs
+
+    Parameters
+    ----------
+    csv_paths : sequence of Path
+        Reference CSVs of AMR mutations, such as the amino acid and nucleotide
+        based lists of a species
+
+    Returns
+    -------
+    catalogue_version : str
+        Versions (see ResistanceCatalogue.version) of the CSVs, comma
+        separated in the given order
+    """
+    return ",".join(hash_file(path)[:version_length] for path in csv_paths)
+
+
+def read_resistance_variants_csv(csv_path: Path) -> Tuple[str, pd.DataFrame]:
+    """
+    Read, validate and normalise a reference CSV of AMR mutations
+
+    Parameters
+    ----------
+    csv_path : Path
+        Reference CSV of AMR mutations
+
+    Returns
+    -------
+    kind : str
+        "aa" for amino acid or "nt" for nucleotide based catalogues
+    df_catalogue : pandas dataframe
+        Contents of the reference CSV, with whitespace stripped from column
+        names and key columns
+    """
+    # utf-8-sig drops the byte order mark some spreadsheet programs write
+    df_catalogue = pd.read_csv(csv_path, encoding="utf-8-sig")
+    df_catalogue.columns = df_catalogue.columns.str.strip()
+
+    kind = "aa" if "locus_tag" in df_catalogue.columns else "nt"
+    missing_columns = [
+        col for col in required_columns[kind] if col not in df_catalogue.columns
+    ]
+    if missing_columns:
+        raise ValueError(
+            f"Reference CSV {csv_path} is missing columns: {', '.join(missing_columns)}"
+        )
+
+    key_columns = aa_key_columns if kind == "aa" else nt_key_columns
+    for col in key_columns:
+        if col == "position":
+            if not pd.api.types.is_integer_dtype(df_catalogue[col]):
+                raise ValueError(
+                    f"Column position in reference CSV {csv_path} should only contain integers"
+                )
+        elif df_catalogue[col].isnull().any():
+            raise ValueError(
+                f"Column {col} in reference CSV {csv_path} has empty values"
+            )
+        else:
+            df_catalogue[col] = df_catalogue[col].astype(str).str.strip()
+    return kind, df_catalogue
+
+
+def compile_catalogue(csv_path: Path) -> ResistanceCatalogue:
+    """
+    Compile a reference CSV of AMR mutations into a catalogue
+
+    Parameters
+    ----------
+    csv_path : Path
+        Reference CSV of AMR mutations
+
+    Returns
+    -------
+    catalogue : ResistanceCatalogue
+    """
+    content_hash = hash_file(csv_path)
+    kind, df_catalogue = read_resistance_variants_csv(csv_path)
+    catalogue = ResistanceCatalogue(
+        kind=kind, table=df_catalogue, content_hash=content_hash
+    )
+    catalogue.key_index(join_key_columns[kind])
+    return catalogue
+
+
+def get_cache_path(
+    csv_path: Path, cache_dir: Optional[Path] = None, content_hash: str = ""
+) -> Path:
+    """
+    Location of the compiled catalogue, next to the CSV unless cache_dir is given
+
+    A cache_dir can be shared by CSVs with the same name, so catalogues in it
+    are named after the content hash of the CSV if it is given. Catalogues are
+    pickled pandas objects, so every pandas version has its own cache file.
+    """
+    suffix = f".pandas-{pd.__version__}.idx"
+    if cache_dir is None:
+        return csv_path.parent.joinpath(f"{csv_path.name}{suffix}")
+    if content_hash:
+        return cache_dir.joinpath(f"{content_hash}{suffix}")
+    return cache_dir.joinpath(f"{csv_path.name}{suffix}")
+
+
+def load_catalogue(
+    csv_path: Path, cache_dir: Optional[Path] = None
+) -> ResistanceCatalogue:
+    """
+    Load a compiled catalogue, compiling and caching it if needed
+
+    The cached catalogue is only used if it was compiled from a CSV with the
+    same content hash by the same pandas version. A cache that cannot be
+    unpickled, such as one written by another environment sharing the cache
+    directory, is recompiled. Failing to write the cache, for example
+    because the CSV is in a read-only location, is not an error.
+
+    Parameters
+    ----------
+    csv_path : Path
+        Reference CSV of AMR mutations
+    cache_dir : Path, optional
+        Directory to cache the compiled catalogue in, defaults to the directory
+        of the CSV
+
+    Returns
+    -------
+    catalogue : ResistanceCatalogue
+    """
+    csv_path = Path(csv_path)
+    content_hash = hash_file(csv_path)
+    cache_path = get_cache_path(csv_path, cache_dir, content_hash)
+    try:
+        with open(cache_path, "rb") as f:
+            catalogue = pickle.load(f)
+        if (
+            isinstance(catalogue, ResistanceCatalogue)
+            and catalogue.format_version == CATALOGUE_FORMAT_VERSION
+            and catalogue.content_hash == content_hash
+            and catalogue.pandas_version == pd.__version__
+        ):
+            if cache_dir is not None:
+                # The modification time marks the last use for LRU eviction
+                with contextlib.suppress(OSError):
+                    os.utime(cache_path)
+            return catalogue
+    except FileNotFoundError:
+        pass
+    except cache_read_errors as e:
+        print(
+            f"Could not read cached catalogue {cache_path}, compiling {csv_path} again: {e!r}",
+            file=sys.stderr,
+        )
+
+    catalogue = compile_catalogue(csv_path)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent jobs never read a partial cache
+        with tempfile.NamedTemporaryFile(
+            dir=cache_path.parent, prefix=f".{cache_path.name}.", delete=False
+        ) as tmp:
+            pickle.dump(catalogue, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp.name, cache_path)
+    except OSError:
+        pass
+    return catalogue
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Validate reference CSVs of AMR mutations and cache their compiled index"
+    )
+    parser.add_argument(
+        "resistance_variants_csv",
+        help="Reference CSV(s) of AMR mutations",
+        nargs="+",
+        type=Path,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory to write the compiled catalogues to, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    for csv_path in args.resistance_variants_csv:
+        catalogue = load_catalogue(csv_path, args.cache_dir)
+        print(
+            f"{csv_path}\t{catalogue.kind}\t{len(catalogue.table)} mutations\t{catalogue.content_hash}"
+        )
+
+
+if __name__ == "__main__":
+    # Run main from the importable module, so pickled catalogues do not refer to __main__
+    from workflow.scripts.resistance_catalogue import main as catalogue_main
+
+    catalogue_main()
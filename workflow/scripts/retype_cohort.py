@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from workflow.scripts.cohort_store import add_sample, connect
+from workflow.scripts.combine_aa_nt_reports import combine_reports
+from workflow.scripts.compare_mutations_batch import compare_batch
+from workflow.scripts.resistance_catalogue import get_catalogue_version
+
+species_choices = ["afumigatus", "cauris"]
+
+
+def get_samples_to_retype(
+    database: Path,
+    species: str,
+    catalogue_version: str,
+    retype_all: bool = False,
+) -> List[Dict[str, str]]:
+    """
+    Samples of a species in the cohort store that were typed with another
+    catalogue
+
+    Only samples with a stored annotated VCF can be re-typed.
+
+    Parameters
+    ----------
+    database : Path
+        SQLite database of the cohort store
+    species : str
+        Species (typing) of the samples, one of species_choices
+    catalogue_version : str
+        Version of the new catalogue, see
+        resistance_catalogue.get_catalogue_version
+    retype_all : bool
+        Also include samples that were typed with the new catalogue
+
+    Returns
+    -------
+    list_samples : list of dicts
+        Dicts with the sample name and the path of its stored annotated VCF
+    """
+    con = connect(database)
+    try:
+        rows = con.execute(
+            "SELECT sample, variants, catalogue_version FROM samples "
+            "WHERE species = ? AND variants IS NOT NULL ORDER BY sample",
+            (species,),
+        ).fetchall()
+    finally:
+        con.close()
+    return [
+        {"sample": sample, "variants": variants}
+        for sample, variants, sample_catalogue_version in rows
+        if retype_all or sample_catalogue_version != catalogue_version
+    ]
+
+
+def retype_cohort(
+    database: Path,
+    species: str,
+    output_dir: Path,
+    aa_resistance_variants_csv: Path,
+    nt_resistance_variants_csv: Optional[Path] = None,
+    threads: int = 1,
+    screen_window: int = 50,
+    min_indel_length: int = 5,
+    catalogue_cache_dir: Optional[Path] = None,
+    retype_all: bool = False,
+    fasta_ref: Optional[Path] = None,
+) -> pd.DataFrame:
+    """
+    Compare the stored annotated variants of a cohort to new reference CSVs
+
+    Only the catalogue join is repeated: the annotated VCFs stored in the
+    cohort store are read instead of annotating the samples again. The reports
+    are written to output_dir with the same layout as the pipeline output, and
+    replace the earlier reports of the samples in the cohort store.
+
+    Parameters
+    ----------
+    database : Path
+        SQLite database of the cohort store
+    species : str
+        Species (typing) of the samples to re-type, one of species_choices
+    output_dir : Path
+        Directory to write the new reports to
+    aa_resistance_variants_csv : Path
+        Reference CSV of amino acid based AMR mutations
+    nt_resistance_variants_csv : Path, optional
+        Reference CSV of nucleotide based AMR mutations, required for
+        afumigatus
+    threads : int
+        Number of worker processes used for the comparisons
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+    catalogue_cache_dir : Path, optional
+        Directory to cache the compiled catalogues in, defaults to the
+        directory of each CSV
+    retype_all : bool
+        Also re-type samples that were typed with the same catalogue
+    fasta_ref : Path, optional
+        Reference genome of the samples, to left-normalise INDELs against in
+        the nucleotide based comparison
+
+    Returns
+    -------
+    df_status : pandas dataframe
+        sample, species and status (see cohort_store.add_sample) of every
+        re-typed sample
+    """
+    if species not in species_choices:
+        raise ValueError(
+            f"Unknown species {species}, choose from {', '.join(species_choices)}"
+        )
+    if species == "afumigatus" and nt_resistance_variants_csv is None:
+        raise ValueError("Re-typing afumigatus requires a nucleotide based CSV")
+    resistance_variants_csvs = [aa_resistance_variants_csv]
+    if species == "afumigatus" and nt_resistance_variants_csv is not None:
+        resistance_variants_csvs.append(nt_resistance_variants_csv)
+
+    list_samples = get_samples_to_retype(
+        database,
+        species,
+        get_catalogue_version(resistance_variants_csvs),
+        retype_all,
+    )
+    if not list_samples:
+        return pd.DataFrame(columns=["sample", "species", "status"])
+
+    typing_dir = output_dir.joinpath(f"{species}_typing", "resistance_mutations")
+    if species == "afumigatus":
+        aa_dir, nt_dir = typing_dir.joinpath("aa"), typing_dir.joinpath("nt")
+        aa_output, aa_full_output = "{sample}.aa.tsv", "{sample}.aa.full.tsv"
+    else:
+        aa_dir, nt_dir = typing_dir, None
+        aa_output, aa_full_output = "{sample}.tsv", "{sample}.full.tsv"
+
+    aa_dir.mkdir(parents=True, exist_ok=True)
+    compare_batch(
+        [
+            {
+                "sample": s["sample"],
+                "input": s["variants"],
+                "output": str(aa_dir.joinpath(aa_output.format(**s))),
+                "full_output": str(aa_dir.joinpath(aa_full_output.format(**s))),
+                "resistance_variants_csv": str(aa_resistance_variants_csv),
+            }
+            for s in list_samples
+        ],
+        "aa",
+        threads=threads,
+        catalogue_cache_dir=catalogue_cache_dir,
+    )
+    if nt_dir is not None:
+        nt_dir.mkdir(parents=True, exist_ok=True)
+        compare_batch(
+            [
+                {
+                    "sample": s["sample"],
+                    "input": s["variants"],
+                    "output": str(nt_dir.joinpath(f"{s['sample']}.nt.tsv")),
+                    "full_output": "",
+                    "resistance_variants_csv": str(nt_resistance_variants_csv),
+                    "fasta_ref": str(fasta_ref) if fasta_ref is not None else "",
+                }
+                for s in list_samples
+            ],
+            "nt",
+            threads=threads,
+            screen_window=screen_window,
+            min_indel_length=min_indel_length,
+            catalogue_cache_dir=catalogue_cache_dir,
+        )
+
+    statuses = []
+    con = connect(database)
+    try:
+        for s in list_samples:
+            if nt_dir is None:
+                report = aa_dir.joinpath(aa_full_output.format(**s))
+            else:
+                nt_report = nt_dir.joinpath(f"{s['sample']}.nt.tsv")
+                combine_reports(
+                    aa_dir.joinpath(aa_output.format(**s)),
+                    nt_report,
+                    typing_dir.joinpath(f"{s['sample']}.combined.tsv"),
+                )
+                report = typing_dir.joinpath(f"{s['sample']}.combined.full.tsv")
+                combine_reports(
+                    aa_dir.joinpath(aa_full_output.format(**s)), nt_report, report
+                )
+            # The stored annotated VCF is kept
+            statuses.append(
+                add_sample(
+                    con,
+                    s["sample"],
+                    species,
+                    report,
+                    resistance_variants_csvs=resistance_variants_csvs,
+                )
+            )
+    finally:
+        con.close()
+    return pd.DataFrame(
+        {
+            "sample": [s["sample"] for s in list_samples],
+            "species": species,
+            "status": statuses,
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Re-type the samples in a cohort store with new reference CSVs of AMR mutations, using their stored annotated variants"
+    )
+    parser.add_argument(
+        "-d", "--database", help="SQLite database", required=True, type=Path
+    )
+    parser.add_argument(
+        "-s",
+        "--species",
+        help="Species of the samples to re-type",
+        required=True,
+        choices=species_choices,
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory to write the new reports to",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--aa-resistance-variants-csv",
+        help="Reference CSV of amino acid based AMR mutations",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--nt-resistance-variants-csv",
+        help="Reference CSV of nucleotide based AMR mutations (afumigatus)",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "-t", "--threads", help="Number of worker processes", default=1, type=int
+    )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases up- and downstream of tandem repeat regions to screen for large INDELs",
+        default=50,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-indel-length",
+        help="Minimum length of the REF or ALT allele of a possible CNV",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--all",
+        help="Also re-type samples that were typed with the same reference CSVs",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fasta-ref",
+        help="Reference genome of the samples, to left-normalise INDELs against (afumigatus)",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    df_status = retype_cohort(
+        args.database,
+        args.species,
+        args.output_dir,
+        args.aa_resistance_variants_csv,
+        args.nt_resistance_variants_csv,
+        threads=args.threads,
+        screen_window=args.screen_window,
+        min_indel_length=args.min_indel_length,
+        catalogue_cache_dir=args.catalogue_cache_dir,
+        retype_all=args.all,
+        fasta_ref=args.fasta_ref,
+    )
+    print(f"Re-typed {len(df_status)} {args.species} samples", file=sys.stderr)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    df_status.to_csv(
+        args.output_dir.joinpath("retyped_samples.tsv"), sep="\t", index=False
+    )
+
+
+if __name__ == "__main__":
+    main()
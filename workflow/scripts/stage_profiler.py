@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import argparse
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# Environment variable that turns on stage profiling without changing the
+# command: "1" records the stages, "cprofile" also dumps a cProfile per stage
+profile_env_var = "APOLLO_PROFILE_STAGES"
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak resident memory of the process to its current resident
+    memory, so the peak of the next stage can be measured
+
+    Returns
+    -------
+    reset : bool
+        True if the peak was reset, which is only possible on Linux
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Peak resident memory of the process in MB, since the last reset_peak_rss
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return max_rss / 2**20
+    return max_rss / 2**10
+
+
+class StageProfiler:
+    """
+    Record the wall time, number of rows and memory of the named stages of a
+    script
+
+    The peak memory of a stage is its peak resident memory, measured by
+    resetting the peak of the process before every stage. Where that is not
+    possible (outside Linux), it is the peak of the process up to the end of
+    the stage. A disabled profiler only hands out the records of the stages, so
+    the stages can be marked in code that usually runs without profiling.
+
+    Parameters
+    ----------
+    enabled : bool
+        Record the stages
+    cprofile_prefix : Path, optional
+        Also profile every stage with cProfile, and dump the statistics to
+        <cprofile_prefix>.<stage>.prof
+    """
+
+    def __init__(
+        self, enabled: bool = True, cprofile_prefix: Optional[Path] = None
+    ) -> None:
+        self.enabled = enabled
+        self.cprofile_prefix = cprofile_prefix
+        self.stages: List[Dict[str, Any]] = []
+        self.start = time.perf_counter()
+        # Peak of the process before the first reset, such as while importing
+        self.peak_rss_mb = get_peak_rss_mb()
+
+    @contextmanager
+    def stage(
+        self, name: str, rows_in: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Record a stage
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage
+        rows_in : int, optional
+            Number of rows the stage starts with
+
+        Yields
+        ------
+        record : dict
+            Record of the stage, set its "rows_out" to the number of rows the
+            stage results in
+        """
+        record: Dict[str, Any] = {"name": name, "rows_in": rows_in, "rows_out": None}
+        if not self.enabled:
+            yield record
+            return
+        profile = None if self.cprofile_prefix is None else cProfile.Profile()
+        per_stage = reset_peak_rss()
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            record["wall_time_s"] = round(time.perf_counter() - start, 6)
+            peak_rss_mb = get_peak_rss_mb()
+            self.peak_rss_mb = max(self.peak_rss_mb, peak_rss_mb)
+            record["peak_rss_mb"] = round(peak_rss_mb, 3)
+            record["peak_rss_per_stage"] = per_stage
+            if profile is not None:
+                cprofile_path = Path(f"{self.cprofile_prefix}.{name}.prof")
+                profile.dump_stats(cprofile_path)
+                record["cprofile"] = str(cprofile_path)
+            self.stages.append(record)
+
+    def to_dict(self, **metadata: Any) -> Dict[str, Any]:
+        """
+        Recorded stages, with the total wall time and peak memory of the
+        process and the metadata, such as the input and output of the script
+        """
+        return {
+            **metadata,
+            "wall_time_s": round(time.perf_counter() - self.start, 6),
+            "peak_rss_mb": round(max(self.peak_rss_mb, get_peak_rss_mb()), 3),
+            "stages": self.stages,
+        }
+
+    def write(self, path: Path, **metadata: Any) -> None:
+        """
+        Write the recorded stages as JSON, if the profiler is enabled
+        """
+        if not self.enabled:
+            return
+        with open(path, "w") as f:
+            json.dump(self.to_dict(**metadata), f, indent=2)
+            f.write("\n")
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the --profile-stages and --cprofile options to a script
+    """
+    parser.add_argument(
+        "--profile-stages",
+        help=f"Write the wall time, rows and peak memory of every stage as JSON next to the output, also enabled by {profile_env_var}=1",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cprofile",
+        help=f"Also dump a cProfile of every stage next to the output, also enabled by {profile_env_var}=cprofile",
+        action="store_true",
+    )
+
+
+def get_profiler(args: argparse.Namespace, output: Path) -> StageProfiler:
+    """
+    Profiler of a script, enabled by its options or the environment variable
+
+    Parameters
+    ----------
+    args : argparse namespace
+        Parsed options, see add_profiling_arguments
+    output : Path
+        Output of the script, the cProfile dumps are written next to it
+
+    Returns
+    -------
+    profiler : StageProfiler
+    """
+    env_value = os.environ.get(profile_env_var, "").strip().lower()
+    cprofile = args.cprofile or env_value == "cprofile"
+    enabled = args.profile_stages or cprofile or env_value not in ["", "0"]
+    return StageProfiler(
+        enabled, cprofile_prefix=get_profile_path(output, "") if cprofile else None
+    )
+
+
+def get_profile_path(output: Path, suffix: str = ".profile.json") -> Path:
+    """
+    Path next to the output of a script, with the suffix of the output replaced
+    """
+    return output.with_name(output.name.rsplit(".", 1)[0] + suffix)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+import argparse
+import math
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Columns of the benchmark files Snakemake writes, the memory and I/O columns
+# are in MB
+benchmark_columns = ["s", "max_rss", "io_in", "io_out", "cpu_time"]
+
+# Rules of a species start with its name, other rules are matched to a species
+# by their sample or reference
+species_prefixes = ["afumigatus", "cauris"]
+species_rules = {"combine_auriclas": "cauris"}
+
+
+def get_species(rule: str, name: str, species_by_name: Dict[str, str]) -> str:
+    """
+    Species of a benchmarked job, "shared" if it is not specific to one
+    """
+    for prefix in species_prefixes:
+        if rule.startswith(f"{prefix}_"):
+            return prefix
+    if rule in species_rules:
+        return species_rules[rule]
+    return species_by_name.get(name, "shared")
+
+
+def read_benchmarks(
+    benchmark_dir: Path, species_by_name: Optional[Dict[str, str]] = None
+) -> pd.DataFrame:
+    """
+    Read the benchmark files of all jobs
+
+    Parameters
+    ----------
+    benchmark_dir : Path
+        Directory with a subdirectory per rule, with a benchmark file per job
+        named after its sample, reference or batch
+    species_by_name : dict, optional
+        Species of every sample and reference
+
+    Returns
+    -------
+    df_benchmarks : pandas dataframe
+        One row per run of a job, with the columns rule, name, species and
+        benchmark_columns
+    """
+    species_by_name = species_by_name or {}
+    list_benchmarks = []
+    for path in sorted(benchmark_dir.glob("*/*.tsv")):
+        df = pd.read_csv(path, sep="\t", na_values=["-", "NA"])
+        missing = set(benchmark_columns) - set(df.columns)
+        if missing:
+            raise ValueError(
+                f"Benchmark file {path} has no column(s) {', '.join(sorted(missing))}"
+            )
+        df = df[benchmark_columns].astype(float)
+        rule, name = path.parent.name, path.stem
+        df.insert(0, "species", get_species(rule, name, species_by_name))
+        df.insert(0, "name", name)
+        df.insert(0, "rule", rule)
+        list_benchmarks.append(df)
+    if not list_benchmarks:
+        df_empty = pd.DataFrame(columns=["rule", "name", "species", *benchmark_columns])
+        return df_empty.astype({column: float for column in benchmark_columns})
+    return pd.concat(list_benchmarks, ignore_index=True)
+
+
+def summarize(
+    df_benchmarks: pd.DataFrame, by: List[str], percentile: float = 95
+) -> pd.DataFrame:
+    """
+    Wall time, peak memory and I/O of groups of jobs
+
+    Parameters
+    ----------
+    df_benchmarks : pandas dataframe
+        Benchmarks as read by read_benchmarks
+    by : list of str
+        Columns to group the jobs by, such as ["species", "rule"]
+    percentile : float
+        Percentile reported next to the median and maximum
+
+    Returns
+    -------
+    df_summary : pandas dataframe
+        Number of jobs, total, median, percentile and maximum wall time in
+        seconds, median, percentile and maximum of the peak memory in MB, and
+        total I/O in MB per group
+    """
+    quantile = percentile / 100
+    pct = f"p{percentile:g}"
+    groups = df_benchmarks.groupby(by, sort=True)
+    df_summary = pd.DataFrame(
+        {
+            "jobs": groups.size(),
+            "wall_time_s_total": groups["s"].sum(),
+            "wall_time_s_median": groups["s"].median(),
+            f"wall_time_s_{pct}": groups["s"].quantile(quantile),
+            "wall_time_s_max": groups["s"].max(),
+            "max_rss_mb_median": groups["max_rss"].median(),
+            f"max_rss_mb_{pct}": groups["max_rss"].quantile(quantile),
+            "max_rss_mb_max": groups["max_rss"].max(),
+            "io_in_mb_total": groups["io_in"].sum(),
+            "io_out_mb_total": groups["io_out"].sum(),
+        }
+    )
+    return df_summary.reset_index().round(2)
+
+
+def round_up(value: float, minimum: int = 1) -> Optional[int]:
+    """
+    Round up to a whole number of at least minimum, None for missing values
+    """
+    if pd.isna(value):
+        return None
+    return max(minimum, math.ceil(value))
+
+
+def suggest_resources(
+    df_benchmarks: pd.DataFrame,
+    df_requested: Optional[pd.DataFrame] = None,
+    percentile: float = 95,
+    headroom: float = 1.2,
+) -> pd.DataFrame:
+    """
+    Suggest the memory, threads and run time of every rule from its jobs
+
+    Memory and run time are the percentile of the jobs times headroom,
+    rounded up to whole GB and minutes. Threads are the percentile of the
+    average number of busy cores (CPU time divided by wall time), rounded up.
+
+    Parameters
+    ----------
+    df_benchmarks : pandas dataframe
+        Benchmarks as read by read_benchmarks
+    df_requested : pandas dataframe, optional
+        Resources the rules request, with the columns rule, threads, mem_gb
+        and runtime, added to the suggestions for comparison
+    percentile : float
+        Percentile of the jobs the suggestions should fit
+    headroom : float
+        Factor the memory and run time are multiplied with
+
+    Returns
+    -------
+    df_suggestions : pandas dataframe
+        Suggested and, if df_requested is given, requested resources per rule
+    """
+    quantile = percentile / 100
+    df = df_benchmarks.copy()
+    wall_time = df["s"].where(df["s"] > 0)
+    df["cores"] = df["cpu_time"] / wall_time
+    groups = df.groupby("rule", sort=True)
+    df_suggestions = pd.DataFrame(
+        {
+            "jobs": groups.size(),
+            "suggested_threads": groups["cores"].quantile(quantile).map(round_up),
+            "suggested_mem_gb": (
+                groups["max_rss"].quantile(quantile) * headroom / 1024
+            ).map(round_up),
+            "suggested_runtime_min": (
+                groups["s"].quantile(quantile) * headroom / 60
+            ).map(round_up),
+        }
+    )
+    df_suggestions = df_suggestions.rename_axis("rule").reset_index()
+    if df_requested is not None:
+        df_requested = df_requested.rename(
+            columns={
+                "threads": "requested_threads",
+                "mem_gb": "requested_mem_gb",
+                "runtime": "requested_runtime_min",
+            }
+        )
+        # Merging into an empty dataframe does not keep the order of the columns
+        columns = [*df_suggestions.columns, *df_requested.columns.drop("rule")]
+        df_suggestions = df_suggestions.merge(df_requested, on="rule", how="left")[
+            columns
+        ]
+    # Whole numbers with missing values stay whole numbers
+    for column in df_suggestions.columns:
+        if column.startswith(("suggested_", "requested_")):
+            df_suggestions[column] = df_suggestions[column].astype("Int64")
+    return df_suggestions
+
+
+def write_html(tables: Dict[str, pd.DataFrame], output: Path) -> None:
+    """
+    Write tables to a single HTML page, with the key of each as its heading
+    """
+    sections = [
+        f"<h2>{title}</h2>\n{df.to_html(index=False, na_rep='', border=0)}"
+        for title, df in tables.items()
+    ]
+    with open(output, "w") as f:
+        f.write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n"
+            "<title>Benchmark report</title>\n<style>\n"
+            "table { border-collapse: collapse; font-family: sans-serif; }\n"
+            "th, td { padding: 2px 8px; text-align: right; }\n"
+            "tr:nth-child(even) { background: #f2f2f2; }\n"
+            "</style>\n</head>\n<body>\n<h1>Benchmark report</h1>\n"
+            + "\n".join(sections)
+            + "\n</body>\n</html>\n"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Summarize the benchmark files of the pipeline jobs per rule and species, and suggest resources"
+    )
+    parser.add_argument(
+        "--benchmark-dir",
+        help="Directory with the benchmark files, one subdirectory per rule",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--species",
+        help="TSV with the columns name and species, to match the jobs of shared rules to a species",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--requested",
+        help="TSV with the columns rule, threads, mem_gb and runtime requested by every rule",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help="Directory to write the summaries and benchmark_report.html to",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--percentile",
+        help="Percentile of the jobs the suggested resources should fit",
+        default=95,
+        type=float,
+    )
+    parser.add_argument(
+        "--headroom",
+        help="Factor the observed memory and run time are multiplied with",
+        default=1.2,
+        type=float,
+    )
+    args = parser.parse_args()
+
+    species_by_name = {}
+    if args.species is not None:
+        df_species = pd.read_csv(args.species, sep="\t", dtype=str)
+        species_by_name = dict(zip(df_species["name"], df_species["species"]))
+    df_requested = None
+    if args.requested is not None:
+        df_requested = pd.read_csv(args.requested, sep="\t")
+
+    df_benchmarks = read_benchmarks(args.benchmark_dir, species_by_name)
+    tables = {
+        "Species": summarize(df_benchmarks, ["species"], args.percentile),
+        "Rules": summarize(df_benchmarks, ["species", "rule"], args.percentile),
+        "Suggested resources": suggest_resources(
+            df_benchmarks, df_requested, args.percentile, args.headroom
+        ),
+    }
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for title, df in tables.items():
+        file_name = title.lower().replace(" ", "_")
+        df.to_csv(args.output_dir.joinpath(f"{file_name}.tsv"), sep="\t", index=False)
+    write_html(tables, args.output_dir.joinpath("benchmark_report.html"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from workflow.scripts import compare_aa_mutations, compare_nt_mutations
+from workflow.scripts.allele_normalisation import read_reference_sequences
+from workflow.scripts.combine_aa_nt_reports import combine_aa_nt
+from workflow.scripts.resistance_catalogue import (
+    ResistanceCatalogue,
+    get_catalogue_version,
+    load_catalogue,
+)
+from workflow.scripts.vcf_reader import iter_table_lines, open_variants_table
+
+
+def report_to_records(df_report: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Rows of a report as JSON serialisable dicts, with None for missing values
+    """
+    records: List[Dict[str, Any]] = json.loads(df_report.to_json(orient="records"))
+    return records
+
+
+@dataclass
+class ResistanceReport:
+    """
+    Resistance report of a single sample, as written by the pipeline
+
+    Attributes
+    ----------
+    sample : str
+        Name of the sample
+    catalogue_version : str
+        Version of the reference lists the sample was typed with, see
+        resistance_catalogue.get_catalogue_version
+    aa_mutations : pandas dataframe
+        Known amino acid based AMR mutations
+    aa_full : pandas dataframe
+        All mutations in resistance genes
+    nt_mutations : pandas dataframe, optional
+        Nucleotide based AMR mutations, if a nucleotide based list was used
+    """
+
+    sample: str
+    catalogue_version: str
+    aa_mutations: pd.DataFrame
+    aa_full: pd.DataFrame
+    nt_mutations: Optional[pd.DataFrame] = None
+
+    @property
+    def mutations(self) -> pd.DataFrame:
+        """
+        Known AMR mutations, with the nucleotide based mutations if any
+        """
+        if self.nt_mutations is None:
+            return self.aa_mutations
+        return combine_aa_nt(self.aa_mutations, self.nt_mutations)
+
+    @property
+    def full(self) -> pd.DataFrame:
+        """
+        All mutations in resistance genes, with the nucleotide based
+        mutations if any
+        """
+        if self.nt_mutations is None:
+            return self.aa_full
+        return combine_aa_nt(self.aa_full, self.nt_mutations)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        JSON serialisable version of the report, with the rows of mutations
+        and full as lists of dicts
+        """
+        return {
+            "sample": self.sample,
+            "catalogue_version": self.catalogue_version,
+            "mutations": report_to_records(self.mutations),
+            "full": report_to_records(self.full),
+        }
+
+
+class VariantTyper:
+    """
+    Type the annotated variants of samples against reference lists of AMR
+    mutations that are loaded once
+
+    The comparisons are the same as those of compare_aa_mutations and
+    compare_nt_mutations, but the reports are returned instead of written, so
+    a long running process can type many samples without reading the
+    reference lists or writing files for each of them.
+
+    Parameters
+    ----------
+    aa_resistance_variants_csv : Path
+        Reference CSV of amino acid based AMR mutations
+    nt_resistance_variants_csv : Path, optional
+        Reference CSV of nucleotide based AMR mutations
+    fasta_ref : Path, optional
+        Reference genome to left-normalise INDELs against, read once
+    screen_window : int
+        Number of bases up- and downstream of a tandem repeat region to screen
+    min_indel_length : int
+        Minimum length of the REF or ALT allele of a possible CNV
+    catalogue_cache_dir : Path, optional
+        Directory to cache the compiled catalogues in, defaults to the
+        directory of each CSV
+    """
+
+    def __init__(
+        self,
+        aa_resistance_variants_csv: Path,
+        nt_resistance_variants_csv: Optional[Path] = None,
+        fasta_ref: Optional[Path] = None,
+        screen_window: int = 50,
+        min_indel_length: int = 5,
+        catalogue_cache_dir: Optional[Path] = None,
+    ) -> None:
+        self.aa_catalogue = load_catalogue(
+            aa_resistance_variants_csv, catalogue_cache_dir
+        )
+        self.nt_catalogue: Optional[ResistanceCatalogue] = None
+        csv_paths = [aa_resistance_variants_csv]
+        if nt_resistance_variants_csv is not None:
+            self.nt_catalogue = load_catalogue(
+                nt_resistance_variants_csv, catalogue_cache_dir
+            )
+            csv_paths.append(nt_resistance_variants_csv)
+        self.catalogue_version = get_catalogue_version(csv_paths)
+        self.sequences: Optional[Dict[str, npt.NDArray[np.bytes_]]] = None
+        if fasta_ref is not None:
+            self.sequences = read_reference_sequences(fasta_ref)
+        self.screen_window = screen_window
+        self.min_indel_length = min_indel_length
+
+    def type_sample(
+        self, records: Union[str, Path, Iterable[str]], sample: str = ""
+    ) -> ResistanceReport:
+        """
+        Type the annotated variants of a sample
+
+        Parameters
+        ----------
+        records : Path or iterable of str
+            Annotated VCF or VariantsToTable export, or its lines. Lines of a
+            VCF are recognised by their header.
+        sample : str
+            Name of the sample, only used to label the report
+
+        Returns
+        -------
+        report : ResistanceReport
+        """
+        table_lines = get_table_lines(records)
+        df_aa_mutations, df_aa_full = compare_aa_mutations.get_reports(
+            table_lines, self.aa_catalogue
+        )
+        df_nt_mutations = None
+        if self.nt_catalogue is not None:
+            df_mutations = compare_nt_mutations.read_mutations(
+                io.StringIO("".join(table_lines)), compact=True
+            )
+            df_nt_mutations = compare_nt_mutations.get_report(
+                df_mutations,
+                self.nt_catalogue,
+                screen_window=self.screen_window,
+                min_indel_length=self.min_indel_length,
+                sequences=self.sequences,
+            )
+        return ResistanceReport(
+            sample,
+            self.catalogue_version,
+            df_aa_mutations,
+            df_aa_full,
+            df_nt_mutations,
+        )
+
+
+def get_table_lines(records: Union[str, Path, Iterable[str]]) -> List[str]:
+    """
+    Lines of the VariantsToTable export of an annotated VCF, a table, or their
+    lines
+    """
+    if isinstance(records, (str, Path)):
+        with open_variants_table(records) as f:
+            return list(f)
+    lines = [line if line.endswith("\n") else line + "\n" for line in records]
+    if lines and lines[0].startswith("#"):
+        return list(iter_table_lines(lines))
+    return lines
+
+
+def handle_request(typer: VariantTyper, request_line: str) -> Dict[str, Any]:
+    """
+    Type the sample of a single request of the JSON lines protocol
+
+    Parameters
+    ----------
+    typer : VariantTyper
+        Typer with the loaded reference lists
+    request_line : str
+        JSON object with "sample", and either "input", the path of an
+        annotated VCF or VariantsToTable export, or "lines", its lines. An
+        "id" is copied to the response.
+
+    Returns
+    -------
+    response : dict
+        ResistanceReport.to_dict of the sample, or "error" with the reason
+        the request failed
+    """
+    request_id = None
+    try:
+        request = json.loads(request_line)
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        request_id = request.get("id")
+        if ("input" in request) == ("lines" in request):
+            raise ValueError('Request needs either "input" or "lines"')
+        records = request["input"] if "input" in request else request["lines"]
+        response = typer.type_sample(records, str(request.get("sample", ""))).to_dict()
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        response = {"error": f"{type(e).__name__}: {e}"}
+    if request_id is not None:
+        response["id"] = request_id
+    return response
+
+
+def serve_lines(
+    typer: VariantTyper,
+    requests: IO[str],
+    responses: IO[str],
+    lock: Optional[threading.Lock] = None,
+) -> None:
+    """
+    Answer every request line with a response line, until requests ends
+
+    Parameters
+    ----------
+    typer : VariantTyper
+        Typer with the loaded reference lists
+    requests : file object
+        Requests of the JSON lines protocol, see handle_request
+    responses : file object
+        Stream to write one JSON response per request to
+    lock : threading.Lock, optional
+        Lock held while typing, for typers shared by threads
+    """
+    for request_line in requests:
+        if not request_line.strip():
+            continue
+        if lock is None:
+            response = handle_request(typer, request_line)
+        else:
+            with lock:
+                response = handle_request(typer, request_line)
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+
+def serve_socket(typer: VariantTyper, socket_path: Path) -> None:
+    """
+    Serve the JSON lines protocol on a Unix socket until interrupted
+
+    Every connection is handled in its own thread, the samples are typed one
+    at a time.
+
+    Parameters
+    ----------
+    typer : VariantTyper
+        Typer with the loaded reference lists
+    socket_path : Path
+        Path of the Unix socket to create
+    """
+    lock = threading.Lock()
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self) -> None:
+            connection: socket.socket = self.request
+            requests = connection.makefile("r", encoding="utf-8")
+            responses = connection.makefile("w", encoding="utf-8")
+            with requests, responses:
+                serve_lines(typer, requests, responses, lock)
+
+    socket_path.unlink(missing_ok=True)
+    with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+        print(f"Listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Keep reference lists of AMR mutations loaded and type samples sent as JSON lines on stdin or a Unix socket"
+    )
+    parser.add_argument(
+        "--aa-resistance-variants-csv",
+        help="Reference CSV of amino acid based AMR mutations",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--nt-resistance-variants-csv",
+        help="Reference CSV of nucleotide based AMR mutations",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--fasta-ref",
+        help="Reference genome to left-normalise INDELs against",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--screen-window",
+        help="Number of bases up- and downstream of tandem repeat regions to screen for large INDELs",
+        default=50,
+        type=int,
+    )
+    parser.add_argument(
+        "--min-indel-length",
+        help="Minimum length of the REF or ALT allele of a possible CNV",
+        default=5,
+        type=int,
+    )
+    parser.add_argument(
+        "--catalogue-cache-dir",
+        help="Directory to cache compiled reference lists in, defaults to next to each CSV",
+        default=None,
+        type=Path,
+    )
+    parser.add_argument(
+        "--socket",
+        help="Unix socket to listen on, requests are read from stdin if not given",
+        default=None,
+        type=Path,
+    )
+    args = parser.parse_args()
+
+    typer = VariantTyper(
+        args.aa_resistance_variants_csv,
+        args.nt_resistance_variants_csv,
+        fasta_ref=args.fasta_ref,
+        screen_window=args.screen_window,
+        min_indel_length=args.min_indel_length,
+        catalogue_cache_dir=args.catalogue_cache_dir,
+    )
+    if args.socket is None:
+        serve_lines(typer, sys.stdin, sys.stdout)
+    else:
+        serve_socket(typer, args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import argparse
+import gzip
+import io
+from pathlib import Path
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
+
+if TYPE_CHECKING:
+    from _typeshed import WriteableBuffer
+
+# Fields exported by the *_annotated_vcf_to_table rules
+table_fields = ["CHROM", "POS", "TYPE", "REF", "ALT", "DP", "AF", "BCSQ"]
+
+vcf_suffixes = (".vcf", ".vcf.gz", ".vcf.bgz", ".bcf")
+
+# Position of the fixed VCF columns
+fixed_columns = {
+    "CHROM": 0,
+    "POS": 1,
+    "ID": 2,
+    "REF": 3,
+    "ALT": 4,
+    "QUAL": 5,
+    "FILTER": 6,
+}
+
+
+def is_vcf(path: Union[str, Path]) -> bool:
+    """
+    Check if path is a VCF instead of a table exported by VariantsToTable
+    """
+    return str(path).endswith(vcf_suffixes)
+
+
+def open_vcf(vcf_path: Union[str, Path]) -> IO[str]:
+    """
+    Open a plain or (b)gzipped VCF as text
+
+    Parameters
+    ----------
+    vcf_path : Path
+        Path to VCF
+
+    Returns
+    -------
+    handle : file object
+        Text handle on the decompressed VCF
+    """
+    with open(vcf_path, "rb") as f:
+        magic = f.read(2)
+    # bgzip output is a series of gzip members, which gzip reads as one stream
+    raw = gzip.open(vcf_path, "rb") if magic == b"\x1f\x8b" else open(vcf_path, "rb")
+    if raw.peek(3)[:3] == b"BCF":
+        raw.close()
+        raise ValueError(
+            f"{vcf_path} is a BCF file, convert it to VCF with bcftools view -Ov"
+        )
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def get_variant_type(ref: str, alts: Sequence[str]) -> str:
+    """
+    Type of a variant, following the TYPE field of GATK VariantsToTable
+
+    Parameters
+    ----------
+    ref : str
+        Reference allele
+    alts : list of str
+        Alternate alleles
+
+    Returns
+    -------
+    variant_type : str
+        NO_VARIATION, SNP, MNP, INDEL, SYMBOLIC or MIXED
+    """
+    variant_type = None
+    for alt in alts:
+        if alt.startswith("<") or alt.endswith(">") or "[" in alt or "]" in alt:
+            allele_type = "SYMBOLIC"
+        elif len(alt) > 1 and (alt.startswith(".") or alt.endswith(".")):
+            # Single breakend
+            allele_type = "SYMBOLIC"
+        elif len(alt) == len(ref):
+            allele_type = "SNP" if len(ref) == 1 else "MNP"
+        else:
+            allele_type = "INDEL"
+        if variant_type is None:
+            variant_type = allele_type
+        elif variant_type != allele_type:
+            return "MIXED"
+    return variant_type if variant_type is not None else "NO_VARIATION"
+
+
+def get_info_value(info: str, key: str) -> str:
+    """
+    Value of key in the INFO column of a VCF record
+
+    Flags get the value "true" and missing keys "NA", as VariantsToTable
+    prints them.
+
+    Parameters
+    ----------
+    info : str
+        INFO column, prefixed and suffixed with ";"
+    key : str
+        INFO key
+
+    Returns
+    -------
+    value : str
+    """
+    # Searching for the key is faster than splitting all entries of the column
+    start = info.find(f";{key}=")
+    if start == -1:
+        return "true" if f";{key};" in info else "NA"
+    start += len(key) + 2
+    return info[start : info.index(";", start)]
+
+
+def iter_table_lines(
+    lines: Iterable[str], fields: Optional[List[str]] = None
+) -> Iterator[str]:
+    """
+    Convert VCF lines into the lines of a GATK VariantsToTable export
+
+    Like VariantsToTable, filtered records are skipped, multi-allelic records
+    are kept on a single line with comma separated values and fields that are
+    missing from a record are written as NA.
+
+    Parameters
+    ----------
+    lines : iterable of str
+        Lines of a VCF, including the header
+    fields : list of str, optional
+        CHROM, POS, ID, REF, ALT, QUAL, FILTER, TYPE or INFO keys to export,
+        defaults to table_fields
+
+    Yields
+    ------
+    line : str
+        Header line followed by one tab separated line per record
+    """
+    if fields is None:
+        fields = table_fields
+    yield "\t".join(fields) + "\n"
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        columns = line.rstrip("\r\n").split("\t", 8)
+        if len(columns) < 8 or columns[6] not in (".", "PASS"):
+            continue
+        ref = columns[3]
+        alt = columns[4]
+        info = f";{columns[7]};"
+        values = []
+        for field in fields:
+            if field in fixed_columns:
+                values.append(columns[fixed_columns[field]])
+            elif field == "TYPE":
+                values.append(
+                    get_variant_type(ref, [] if alt == "." else alt.split(","))
+                )
+            else:
+                values.append(get_info_value(info, field))
+        yield "\t".join(values) + "\n"
+
+
+class VcfTableReader(io.RawIOBase):
+    """
+    Read-only byte stream with the VariantsToTable export of a VCF, see
+    VcfTable for the text stream
+    """
+
+    def __init__(
+        self, vcf_path: Union[str, Path], fields: Optional[List[str]] = None
+    ) -> None:
+        super().__init__()
+        self._handle = open_vcf(vcf_path)
+        self._lines = iter_table_lines(self._handle, fields)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: "WriteableBuffer") -> int:
+        view = memoryview(buffer).cast("B")
+        size = len(view)
+        if len(self._buffer) < size:
+            # Convert as many records as fit in the buffer in one go
+            # Records are almost always ASCII, so their length in characters
+            # is close to their length in bytes
+            lines = []
+            length = len(self._buffer)
+            for line in self._lines:
+                lines.append(line)
+                length += len(line)
+                if length >= size:
+                    break
+            self._buffer += "".join(lines).encode("utf-8")
+        data = self._buffer[:size]
+        view[: len(data)] = data
+        self._buffer = self._buffer[size:]
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._handle.close()
+        super().close()
+
+
+class VcfTable(io.TextIOWrapper):
+    """
+    Read-only text stream with the VariantsToTable export of a VCF
+
+    Records are converted while the stream is read, so the VCF is never held
+    in memory as a whole. Can be iterated line by line or passed to
+    pandas.read_csv.
+
+    Parameters
+    ----------
+    vcf_path : Path
+        Path to a plain or (b)gzipped VCF
+    fields : list of str, optional
+        Fields to export, defaults to table_fields
+    """
+
+    def __init__(
+        self, vcf_path: Union[str, Path], fields: Optional[List[str]] = None
+    ) -> None:
+        super().__init__(
+            io.BufferedReader(VcfTableReader(vcf_path, fields), buffer_size=1 << 16),
+            encoding="utf-8",
+        )
+
+
+def open_variants_table(input_file: Union[str, Path]) -> IO[str]:
+    """
+    Open the variants of a sample as a VariantsToTable export
+
+    Parameters
+    ----------
+    input_file : Path
+        Annotated VCF, or a table exported by GATK VariantsToTable
+
+    Returns
+    -------
+    handle : file object
+        Text handle with a tab separated header and one line per variant
+    """
+    if is_vcf(input_file):
+        return VcfTable(input_file)
+    return open(input_file, "r")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export fields of a VCF to a table, like GATK VariantsToTable"
+    )
+    parser.add_argument("-V", "--vcf", help="Input VCF", required=True, type=Path)
+    parser.add_argument(
+        "-F",
+        "--fields",
+        help="Fields to export",
+        nargs="+",
+        default=table_fields,
+    )
+    parser.add_argument("-O", "--output", help="Output table", required=True, type=Path)
+    args = parser.parse_args()
+
+    with VcfTable(args.vcf, args.fields) as table, open(args.output, "w") as f:
+        for line in table:
+            f.write(line)
+
+
+if __name__ == "__main__":
+    main()